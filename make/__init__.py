@@ -2,11 +2,10 @@
 import atexit
 import json
 import os
-import shutil
+import re
 import signal
-import subprocess
+import sqlite3
 import sys
-import tempfile
 import threading
 from collections.abc import (
     Callable,
@@ -28,27 +27,18 @@ from typing import (
     cast,
 )
 
-_osDir = tempfile.mkdtemp()
-os.makedirs(os.path.join(_osDir, "lib/system"))
-os.makedirs(os.path.join(_osDir, "bin"))
-_ = atexit.register(shutil.rmtree, _osDir)
-_ = shutil.copytree(
-    "overlay/base/usr/lib/system/_os",
-    os.path.join(_osDir, "lib/system/_os"),
-)
-_ = shutil.copytree(
-    "overlay/atomic/usr/lib/system/_os",
-    os.path.join(_osDir, "lib/system/_os"),
-    dirs_exist_ok=True,
-)
-_ = shutil.copy2("overlay/base/usr/bin/os", os.path.join(_osDir, "bin/os"))
-_ = shutil.copystat("overlay/base/usr/bin/os", os.path.join(_osDir, "bin/os"))
-sys.path.append(os.path.join(_osDir, "lib/system"))
+_repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OS_PATH = os.path.join(_repoDir, "overlay/base/usr/lib/system")
+OS_OVERLAY_PATH = os.path.join(_repoDir, "overlay/atomic/usr/lib/system/_os")
+sys.path.append(OS_PATH)
 
 import _os  # pyright:ignore [reportMissingImports]
 import _os.podman  # pyright:ignore [reportMissingImports]
+import _os.registry  # pyright:ignore [reportMissingImports]
 import _os.system  # pyright:ignore [reportMissingImports]
 
+cast(list[str], _os.__path__).append(OS_OVERLAY_PATH)  # pyright:ignore [reportUnknownMemberType]
+
 podman = cast(Callable[..., None], _os.podman.podman)  # pyright:ignore [reportUnknownMemberType]
 podman_cmd = cast(Callable[..., list[str]], _os.podman.podman_cmd)  # pyright:ignore [reportUnknownMemberType]
 _execute = cast(Callable[..., int], _os.system._execute)  # pyright:ignore [reportUnknownMemberType]
@@ -59,13 +49,20 @@ in_system = cast(Callable[..., int], _os.podman.in_system)  # pyright:ignore [re
 in_system_output = cast(Callable[..., bytes], _os.podman.in_system_output)  # pyright:ignore [reportUnknownMemberType]
 is_root = cast(Callable[[], bool], _os.system.is_root)  # pyright:ignore [reportUnknownMemberType]
 image_hash = cast(Callable[[str], str], _os.podman.image_hash)  # pyright:ignore [reportUnknownMemberType]
-image_labels = cast(Callable[[str, bool], dict[str, str]], _os.podman.image_labels)  # pyright:ignore [reportUnknownMemberType]
+_image_labels = cast(Callable[[str, bool], dict[str, str]], _os.podman.image_labels)  # pyright:ignore [reportUnknownMemberType]
 image_exists = cast(Callable[[str, bool, bool], bool], _os.podman.image_exists)  # pyright:ignore [reportUnknownMemberType]
-image_tags = cast(Callable[[str, bool], list[str]], _os.podman.image_tags)  # pyright:ignore [reportUnknownMemberType]
+_image_tags = cast(Callable[[str, bool], list[str]], _os.podman.image_tags)  # pyright:ignore [reportUnknownMemberType]
 hex_to_base62 = cast(Callable[[str], str], _os.podman.hex_to_base62)  # pyright:ignore [reportUnknownMemberType]
 escape_label = cast(Callable[[str], str], _os.podman.escape_label)  # pyright: ignore[reportUnknownMemberType]
 image_digest = cast(Callable[[str, bool, bool], str], _os.podman.image_digest)  # pyright:ignore [reportUnknownMemberType]
+image_retag = cast(Callable[[str, list[str]], str], _os.podman.image_retag)  # pyright:ignore [reportUnknownMemberType]
+image_untag = cast(Callable[[str], None], _os.podman.image_untag)  # pyright:ignore [reportUnknownMemberType]
+image_tag = cast(Callable[[str, str], None], _os.podman.image_tag)  # pyright:ignore [reportUnknownMemberType]
+image_remove = cast(Callable[[str], None], _os.podman.image_remove)  # pyright:ignore [reportUnknownMemberType]
+image_run_output = cast(Callable[..., bytes], _os.podman.image_run_output)  # pyright:ignore [reportUnknownMemberType]
+image_copy = cast(Callable[[list[str], str], None], _os.podman.image_copy)  # pyright:ignore [reportUnknownMemberType]
 image_qualified_name = cast(Callable[[str], str], _os.podman.image_qualified_name)  # pyright:ignore [reportUnknownMemberType]
+RegistryError = cast(type[Exception], _os.registry.RegistryError)  # pyright:ignore [reportUnknownMemberType]
 file_hash = cast(Callable[[str], str], _os.system.file_hash)  # pyright:ignore [reportUnknownMemberType]
 base_images = cast(
     Callable[[str, dict[str, str] | None], Iterable[str]],
@@ -80,9 +77,16 @@ image_name_from_parts = cast(
     _os.podman.image_name_from_parts,  # pyright:ignore [reportUnknownMemberType]
 )
 parse_containerfile = cast(
-    Callable[[str | IO[str], dict[str, str] | None, bool], list[dict[str, Any]]],  # pyright: ignore[reportExplicitAny]
+    Callable[[str | IO[str], dict[str, str] | None], list[dict[str, Any]]],  # pyright: ignore[reportExplicitAny]
     _os.podman.parse_containerfile,  # pyright: ignore[reportUnknownMemberType]
 )
+parse_containerfiles = cast(
+    Callable[
+        [Iterable[tuple[str | IO[str], dict[str, str] | None]]],
+        list[list[dict[str, Any]]],  # pyright: ignore[reportExplicitAny]
+    ],
+    _os.podman.parse_containerfiles,  # pyright: ignore[reportUnknownMemberType]
+)
 bytes_to_stdout = cast(
     Callable[[bytes], None],
     _os.console.bytes_to_stdout,  # pyright: ignore[reportUnknownMemberType]
@@ -185,24 +189,171 @@ def progress_bar[T](
 
 
 _executor = ThreadPoolExecutor(max_workers=max(os.cpu_count() or 1, 15))
+
+DIGEST_CACHE_PATH = os.path.join(os.environ.get("TMPDIR", "/tmp"), "manifest_cache")  # noqa: S108
+# Tags like variant_2025.11.18.0 are never moved once pushed
+METADATA_TTL_IMMUTABLE = 60 * 60 * 24 * 30
+METADATA_TTL_MUTABLE = 60 * 5
+METADATA_TTL_TAGS = 60
+_immutable_tag = re.compile(r"_\d{4}\.\d{2}\.\d{2}\.\d+$")
+
+
+class MetadataCache:
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self._lock: threading.Lock = threading.Lock()
+        legacy = self._read_legacy()
+        try:
+            self._db: sqlite3.Connection = self._connect()
+
+        except sqlite3.DatabaseError as e:
+            print(f"Failed to load metadata cache: {e}", file=sys.stderr)
+            os.unlink(self.path)
+            self._db = self._connect()
+
+        _ = atexit.register(self.close)
+        for image, digest in legacy.items():
+            self.set("digest", image, digest, metadata_ttl(image))
+
+    def _read_legacy(self) -> dict[str, str]:
+        # Older runs stored a single JSON object of image -> digest at this path
+        if not os.path.exists(self.path):
+            return {}
+
+        with open(self.path, "rb") as f:
+            if f.read(1) != b"{":
+                return {}
+
+        data: dict[str, str] = {}
+        try:
+            with open(self.path) as f:
+                data = cast(dict[str, str], json.load(f))
+
+            assert isinstance(data, dict)
+
+        except Exception as e:
+            print(f"Failed to load digest cache: {e}", file=sys.stderr)
+            data = {}
+
+        os.unlink(self.path)
+        return {k: v for k, v in data.items() if isinstance(v, str)}  # pyright: ignore[reportUnnecessaryIsInstance]
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(
+            self.path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        try:
+            _ = db.execute("PRAGMA synchronous=OFF")
+            _ = db.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                + "kind TEXT NOT NULL, "
+                + "key TEXT NOT NULL, "
+                + "value TEXT NOT NULL, "
+                + "expires REAL NOT NULL, "
+                + "PRIMARY KEY (kind, key)"
+                + ") WITHOUT ROWID"
+            )
+            _ = db.execute("DELETE FROM metadata WHERE expires <= ?", (time(),))
+
+        except sqlite3.DatabaseError:
+            db.close()
+            raise
+
+        return db
+
+    def get(self, kind: str, key: str) -> str | None:
+        with self._lock:
+            row = cast(
+                tuple[str] | None,
+                self._db.execute(
+                    "SELECT value FROM metadata WHERE kind = ? AND key = ? AND expires > ?",
+                    (kind, key, time()),
+                ).fetchone(),
+            )
+
+        return None if row is None else row[0]
+
+    def all(self, kind: str) -> dict[str, str]:
+        with self._lock:
+            return dict(
+                cast(
+                    list[tuple[str, str]],
+                    self._db.execute(
+                        "SELECT key, value FROM metadata WHERE kind = ? AND expires > ?",
+                        (kind, time()),
+                    ).fetchall(),
+                )
+            )
+
+    def set(self, kind: str, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            _ = self._db.execute(
+                "INSERT OR REPLACE INTO metadata (kind, key, value, expires) VALUES (?, ?, ?, ?)",
+                (kind, key, value, time() + ttl),
+            )
+
+    def delete(self, kind: str, key: str) -> None:
+        with self._lock:
+            _ = self._db.execute(
+                "DELETE FROM metadata WHERE kind = ? AND key = ?",
+                (kind, key),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def metadata_ttl(image: str) -> float:
+    _, _, tag, digest = image_name_parts(image)
+    if digest is not None or (tag is not None and _immutable_tag.search(tag)):
+        return METADATA_TTL_IMMUTABLE
+
+    return METADATA_TTL_MUTABLE
+
+
+_metadata_cache: MetadataCache | None = None
+_metadata_cache_lock = threading.Lock()
+
+
+def _metadata() -> MetadataCache:
+    global _metadata_cache
+    with _metadata_cache_lock:
+        if _metadata_cache is None:
+            _metadata_cache = MetadataCache(DIGEST_CACHE_PATH)
+
+        return _metadata_cache
+
+
 _image_sizes: dict[str, Future[int]] = {}
 _image_sizes_lock = threading.Lock()
 
 
+def _remote_image_size(image: str) -> int:
+    size = cast(
+        Callable[[str], int],
+        _os.podman.image_size,  # pyright: ignore[reportUnknownMemberType]
+    )(image)
+    _metadata().set("size", image, str(size), metadata_ttl(image))
+    return size
+
+
 def _image_size_cached(image: str) -> Future[int] | int:
+    image = image_qualified_name(image)
     future = _image_sizes.get(image)
     if future is None:
         with _image_sizes_lock:
             # In case it was added after we locked
             future = _image_sizes.get(image)
             if future is None:
-                future = _executor.submit(
-                    cast(
-                        Callable[[str], int],
-                        _os.podman.image_size,  # pyright: ignore[reportUnknownMemberType]
-                    ),
-                    image,
-                )
+                size = _metadata().get("size", image)
+                if size is not None:
+                    return int(size)
+
+                future = _executor.submit(_remote_image_size, image)
                 _image_sizes[image] = future
 
     return future
@@ -216,39 +367,53 @@ def image_size_cached(image: str) -> int:
     return future
 
 
-DIGEST_CACHE_PATH = os.path.join(os.environ.get("TMPDIR", "/tmp"), "manifest_cache")  # noqa: S108
-_image_digests: dict[str, Future[str]] = {}
-_image_digests_lock = threading.Lock()
-_image_digests_write_lock = threading.Lock()
-if os.path.exists(DIGEST_CACHE_PATH):
-    with open(DIGEST_CACHE_PATH) as f:
-        try:
-            data = json.load(f)  # pyright: ignore[reportAny]
-            assert isinstance(data, dict)
-            for image, digest in cast(dict[str, str], data).items():
-                assert isinstance(image, str)
-                assert isinstance(digest, str)
-                future: Future[str] = Future()
-                future.set_result(digest)
-                with _image_digests_lock:
-                    _image_digests[image] = future
+def image_labels(image: str, remote: bool = True) -> dict[str, str]:
+    if not remote:
+        return _image_labels(image, False)
 
-        except Exception as e:
-            print(f"Failed to load digest cache: {e}", file=sys.stderr)
-            os.unlink(DIGEST_CACHE_PATH)
+    image = image_qualified_name(image)
+    data = _metadata().get("labels", image)
+    if data is not None:
+        return cast(dict[str, str], json.loads(data))
 
-if not os.path.exists(DIGEST_CACHE_PATH):
-    with open(DIGEST_CACHE_PATH, "w") as f:
-        _ = f.write("{}")
+    labels = _image_labels(image, True)
+    _metadata().set("labels", image, json.dumps(labels), metadata_ttl(image))
+    return labels
+
+
+def image_tags(image: str, skip_manifest: bool = False) -> list[str]:
+    # Only the registry listing is cached, the manifest lookup is already local
+    if not skip_manifest:
+        return _image_tags(image, False)
+
+    image = image_qualified_name(image)
+    data = _metadata().get("tags", image)
+    if data is not None:
+        return cast(list[str], json.loads(data))
+
+    tags = _image_tags(image, True)
+    _metadata().set("tags", image, json.dumps(tags), METADATA_TTL_TAGS)
+    return tags
+
+
+def invalidate_metadata(image: str) -> None:
+    image = image_qualified_name(image)
+    registry, repo, _, _ = image_name_parts(image)
+    _metadata().delete("labels", image)
+    _metadata().delete("size", image)
+    _metadata().delete("tags", image_name_from_parts(registry, repo, None, None))
+
+
+_image_digests: dict[str, Future[str]] = {}
+_image_digests_lock = threading.Lock()
 
 
 def _remote_image_digest(image: str, skip_manifest: bool = False) -> str:
     e: Exception | None = None
     for attempt in range(10):
         try:
-            assert image_exists(image, True, True), (
-                f"{image} does not exist on the remote server"
-            )
+            # A missing image is a 404 from the registry, checking that it exists
+            # first would list every tag in the repository
             digest = image_digest(image, True, skip_manifest)
             _image_digests_write_cache(image, digest)
             return digest
@@ -256,9 +421,9 @@ def _remote_image_digest(image: str, skip_manifest: bool = False) -> str:
         except PermissionError, AssertionError:
             raise
 
-        except subprocess.CalledProcessError as ex:
+        except RegistryError as ex:
             e = ex
-            if e.returncode == 2:
+            if cast(int, getattr(ex, "status")) == 404:
                 # Exit early, image cannot be found
                 break
 
@@ -280,7 +445,16 @@ def image_digest_cached(image: str, skip_manifest: bool = False) -> Future[str]:
             # In case it was added after we locked
             future = _image_digests.get(image, None)
             if future is None:
-                future = _executor.submit(_remote_image_digest, image, skip_manifest)
+                digest = _metadata().get("digest", image)
+                if digest is not None:
+                    future = Future()
+                    future.set_result(digest)
+
+                else:
+                    future = _executor.submit(
+                        _remote_image_digest, image, skip_manifest
+                    )
+
                 _image_digests[image] = future
 
     return future
@@ -288,38 +462,14 @@ def image_digest_cached(image: str, skip_manifest: bool = False) -> Future[str]:
 
 def _image_digests_write_cache(image: str, digest: str) -> None:
     global _image_digests  # noqa: PLW0602
-    with _image_digests_write_lock:
-        image = image_qualified_name(image)
-        future: Future[str] = Future()
-        future.set_result(digest)
-        with _image_digests_lock:
-            _image_digests[image] = future
-
-        tries = 0
-        while True:
-            try:
-                with open(DIGEST_CACHE_PATH, "w") as f:
-                    with _image_digests_lock:
-                        json.dump(
-                            {
-                                k: v.result()
-                                for k, v in _image_digests.items()
-                                if v.done()
-                                and not v.cancelled()
-                                and v.exception() is None
-                            },
-                            f,
-                            sort_keys=True,
-                        )
-
-                    _ = f.truncate()
-                    _ = f.flush()
-
-                break
+    image = image_qualified_name(image)
+    future: Future[str] = Future()
+    future.set_result(digest)
+    with _image_digests_lock:
+        _image_digests[image] = future
 
-            except PermissionError:
-                tries += 1
-                if tries >= 5:
-                    raise
+    if _metadata().get("digest", image) != digest:
+        # The tag moved, anything else known about it is stale
+        invalidate_metadata(image)
 
-                sleep(0.1)
+    _metadata().set("digest", image, digest, metadata_ttl(image))
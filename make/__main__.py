@@ -1,10 +1,33 @@
 import argparse
+import ast
 import importlib
 import os
+import re
 import sys
 from collections.abc import Callable
 from glob import iglob
-from typing import cast
+from typing import (
+    Any,
+    cast,
+)
+
+_kwds = re.compile(r"^kwds\b[^=\n]*=\s*(\{.*?^\})", re.MULTILINE | re.DOTALL)
+
+
+def _read_kwds(file: str) -> dict[str, Any] | None:  # pyright: ignore[reportExplicitAny]
+    with open(file) as f:
+        match = _kwds.search(f.read())
+
+    if match is None:
+        return {}
+
+    try:
+        return cast(dict[str, Any], ast.literal_eval(match.group(1)))  # pyright: ignore[reportExplicitAny]
+
+    except ValueError, SyntaxError:
+        # Not a literal, or the match ended early, the module needs to be
+        # imported to know the value
+        return None
 
 
 def cli(argv: list[str]) -> None:
@@ -14,16 +37,25 @@ def cli(argv: list[str]) -> None:
     subparsers = parser.add_subparsers(help="Action to run")
     __dirname__ = os.path.dirname(__file__)
     modulename = os.path.basename(__dirname__)
-    for file in iglob(os.path.join(__dirname__, "*.py")):
+    selected = next((x for x in argv if not x.startswith("-")), None)
+    for file in sorted(iglob(os.path.join(__dirname__, "*.py"))):
         if os.path.basename(file).startswith("__") or file.endswith("__.py"):
             continue
 
         name = os.path.splitext(os.path.basename(file))[0]
+        kwds = _read_kwds(file) if name != selected else None
+        if kwds is not None:
+            _ = subparsers.add_parser(name, **kwds)  # pyright:ignore [reportAny]
+            continue
+
         module = importlib.import_module(f"{modulename}.{name}", modulename)
         subparser = subparsers.add_parser(
             name,
             **getattr(module, "kwds", {}),  # pyright:ignore [reportAny]
         )
+        if name != selected:
+            continue
+
         module.register(subparser)  # pyright:ignore [reportAny]
         subparser.set_defaults(func=module.command)  # pyright:ignore [reportAny]
 
@@ -0,0 +1,209 @@
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tarfile
+from argparse import (
+    ArgumentParser,
+    Namespace,
+)
+from collections.abc import Callable
+from tempfile import TemporaryDirectory
+from time import time
+from typing import (
+    IO,
+    Any,
+    cast,
+)
+
+import _os.tar  # pyright:ignore [reportMissingImports]
+
+from . import (
+    image_copy,
+    is_root,
+    podman_cmd,
+)
+
+normalize_mtime = cast(Callable[[IO[bytes], IO[bytes]], int], _os.tar.normalize_mtime)  # pyright:ignore [reportUnknownMemberType]
+
+kwds: dict[str, str] = {
+    "help": "Measure the cost of parts of the system upgrade",
+}
+
+BENCHMARKS = ["mtime", "image-copy"]
+
+
+def register(parser: ArgumentParser) -> None:
+    _ = parser.add_argument(
+        "--files",
+        type=int,
+        default=50000,
+        help="Number of files in the generated rootfs",
+    )
+    _ = parser.add_argument(
+        "--image",
+        default="system:latest",
+        help="Image to copy between container storages",
+    )
+    _ = parser.add_argument(
+        "--directory",
+        default=None,
+        help="Directory to create the target container storages in",
+    )
+    _ = parser.add_argument(
+        "benchmark",
+        choices=BENCHMARKS,
+        help="Benchmark to run",
+    )
+
+
+def command(args: Namespace) -> None:
+    match cast(str, args.benchmark):
+        case "mtime":
+            mtime(cast(int, args.files))
+
+        case "image-copy":
+            if not is_root():
+                print("Must be run as root", file=sys.stderr)
+                sys.exit(1)
+
+            copy_storage(cast(str, args.image), cast(str | None, args.directory))
+
+        case _:
+            raise NotImplementedError()
+
+
+def _timed(func: Callable[[], object]) -> float:
+    start = time()
+    _ = func()
+    return time() - start
+
+
+def mtime(files: int) -> None:
+    with TemporaryDirectory() as tmpdir:
+        rootfs = os.path.join(tmpdir, "rootfs")
+        for i in range(files):
+            path = os.path.join(rootfs, f"usr/share/{i // 500}", str(i))
+            if not i % 500:
+                os.makedirs(os.path.dirname(path))
+
+            with open(path, "wb") as f:
+                _ = f.write(os.urandom(i % 8192))
+
+        archive = os.path.join(tmpdir, "rootfs.tar")
+        with tarfile.open(archive, "w") as t:
+            t.add(rootfs, ".")
+
+        def touch() -> None:
+            # The pass commit_export used to run inside the container. Touching a
+            # file from a lower layer makes overlayfs copy it up, so do the same
+            upper = os.path.join(tmpdir, "upper")
+            if os.path.exists(upper):
+                shutil.rmtree(upper)
+
+            _ = shutil.copytree(rootfs, upper, symlinks=True)
+            _ = subprocess.run(
+                [
+                    "sh",
+                    "-c",
+                    'find "$0" -xdev -print0 '
+                    + '| xargs -0 -r -P$(nproc) -n500 touch -h -d "@1735689640"',
+                    upper,
+                ],
+                check=True,
+            )
+
+        def copy() -> None:
+            with open(archive, "rb") as src, open(os.devnull, "wb") as dest:
+                shutil.copyfileobj(src, dest, 1024 * 1024)
+
+        def normalize() -> None:
+            with open(archive, "rb") as src, open(os.devnull, "wb") as dest:
+                _ = normalize_mtime(src, dest)
+
+        touch_time = min(_timed(touch) for _ in range(3))
+        copy_time = min(_timed(copy) for _ in range(3))
+        normalize_time = min(_timed(normalize) for _ in range(3))
+
+    overhead = max(normalize_time - copy_time, 0)
+    print(f"Files:                 {files}")
+    print(f"Copy up and touch:     {touch_time:.3f}s")
+    print(f"Stream rewrite:        {overhead:.3f}s on top of {copy_time:.3f}s")
+    print(f"Saved per upgrade:     {touch_time - overhead:.3f}s")
+
+
+def _size(path: str) -> int:
+    size = 0
+    seen: set[tuple[int, int]] = set()
+    for root, _, files in os.walk(path):
+        for name in files:
+            st = os.lstat(os.path.join(root, name))
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                size += st.st_size
+
+    return size
+
+
+def copy_storage(image: str, directory: str | None) -> None:
+    with TemporaryDirectory(dir=directory) as tmpdir:
+        load = os.path.join(tmpdir, "load")
+        copy = os.path.join(tmpdir, "copy")
+
+        def pipeline() -> None:
+            # What os install and os iso used to run
+            _ = subprocess.run(
+                [
+                    "bash",
+                    "-c",
+                    " | ".join(
+                        [
+                            shlex.join(podman_cmd("save", image)),
+                            shlex.join(
+                                [
+                                    "podman",
+                                    f"--root={load}",
+                                    "--runroot=/tmp/podman-runroot",
+                                    "--storage-driver=overlay",
+                                    "--events-backend=file",
+                                    "load",
+                                ]
+                            ),
+                        ]
+                    ),
+                ],
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+
+        load_time = _timed(pipeline)
+        copy_time = _timed(lambda: image_copy([image], copy))
+        # Everything is already there, so this only measures the skip
+        skip_time = _timed(lambda: image_copy([image], copy))
+        size = _size(load)
+
+    print(f"Image:                 {image} ({size / 1024**2:.1f} MiB)")
+    print(
+        f"Save and load:         {load_time:.3f}s "
+        + f"({size / 1024**2 / load_time:.1f} MiB/s)"
+    )
+    print(
+        f"Storage copy:          {copy_time:.3f}s "
+        + f"({size / 1024**2 / copy_time:.1f} MiB/s)"
+    )
+    print(f"Storage copy again:    {skip_time:.3f}s")
+
+
+if __name__ == "__main__":
+    kwds["description"] = kwds["help"]
+    del kwds["help"]
+    parser = ArgumentParser(
+        **cast(  # pyright: ignore[reportAny]
+            dict[str, Any],  # pyright: ignore[reportExplicitAny]
+            kwds,
+        ),
+    )
+    register(parser)
+    args = parser.parse_args()
+    command(args)
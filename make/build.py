@@ -1,15 +1,23 @@
 import json
 import os
-import subprocess
 import sys
+import threading
 from argparse import (
     ArgumentParser,
     Namespace,
 )
+from collections.abc import Callable
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
 from datetime import (
     UTC,
     datetime,
 )
+from time import time
 from typing import (
     Any,
     cast,
@@ -18,17 +26,26 @@ from typing import (
 from . import (
     REPO,
     base_images,
+    bytes_to_stderr,
+    bytes_to_stdout,
     image_exists,
     image_labels,
-    in_system_output,
+    image_qualified_name,
+    image_remove,
+    image_run_output,
+    image_tag,
     is_root,
+    parse_containerfiles,
     podman,
-    podman_cmd,
 )
-from .config import parse_config
+from .config import (
+    parse_all_config,
+    parse_config,
+)
 from .hash import hash
 from .pull import pull
 from .push import push
+from .workflow import build_job_graph
 
 kwds: dict[str, str] = {
     "help": "Build a variant",
@@ -47,6 +64,20 @@ def register(parser: ArgumentParser) -> None:
         dest="cache",
         help="Do not reuse the previous layer cache when building",
     )
+    _ = parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of variants to build at the same time",
+    )
+    _ = parser.add_argument(
+        "--io-jobs",
+        type=int,
+        default=1,
+        dest="ioJobs",
+        help="Number of image pulls and pushes to run at the same time",
+    )
     _ = parser.add_argument(
         "target",
         action="extend",
@@ -62,14 +93,154 @@ def command(args: Namespace) -> None:
         print("Must be run as root", file=sys.stderr)
         sys.exit(1)
 
-    for target in cast(list[str], args.target):
-        build(target, cast(bool, args.cache))
-        if cast(bool, args.push):
-            push(target)
+    build_all(
+        cast(list[str], args.target),
+        cast(bool, args.cache),
+        cast(bool, args.push),
+        max(cast(int, args.jobs), 1),
+        max(cast(int, args.ioJobs), 1),
+    )
 
 
-def build(target: str, cache: bool = True) -> None:
-    now = datetime.now(UTC)
+def build_dependencies(targets: list[str]) -> dict[str, str | None]:
+    graph, _ = build_job_graph(parse_all_config())
+    dependencies: dict[str, str | None] = {}
+    for target in targets:
+        depends = cast(str | None, graph.get(target, {}).get("depends", None))
+        # Wait on the nearest ancestor being built here, anything above that is
+        # expected to already exist, or be pulled
+        while depends is not None and depends not in targets:
+            depends = cast(str | None, graph.get(depends, {}).get("depends", None))
+
+        dependencies[target] = depends
+
+    return dependencies
+
+
+def _prefixed(target: str, out: Callable[[bytes], None]) -> Callable[[bytes], None]:
+    prefix = f"[{target}] ".encode()
+
+    def write(line: bytes) -> None:
+        out(prefix + line)
+
+    return write
+
+
+def _build_target(
+    target: str,
+    cache: bool,
+    push_: bool,
+    prefix: bool,
+    io_slots: threading.BoundedSemaphore,
+) -> float:
+    start = time()
+    onstdout = _prefixed(target, bytes_to_stdout) if prefix else bytes_to_stdout
+    onstderr = _prefixed(target, bytes_to_stderr) if prefix else bytes_to_stderr
+    build(target, cache, onstdout=onstdout, onstderr=onstderr, io_slots=io_slots)
+    if push_:
+        with io_slots:
+            push(target, onstdout=onstdout, onstderr=onstderr)
+
+    return time() - start
+
+
+def build_all(
+    targets: list[str],
+    cache: bool = True,
+    push_: bool = False,
+    jobs: int = 1,
+    io_jobs: int = 1,
+) -> None:
+    dependencies = build_dependencies(targets)
+    # Parse every Containerfile up front so the parser is only spawned once
+    _ = parse_containerfiles(map(target_containerfile, targets))
+    pull_base_images(targets, io_jobs)
+    io_slots = threading.BoundedSemaphore(io_jobs)
+    pending = list(dependencies)
+    durations: dict[str, float] = {}
+    errors: dict[str, Exception] = {}
+    skipped: set[str] = set()
+    running: dict[Future[float], str] = {}
+    start = time()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for target in list(pending):
+                depends = dependencies[target]
+                if depends in errors or depends in skipped:
+                    pending.remove(target)
+                    skipped.add(target)
+
+                elif depends is None or depends in durations:
+                    pending.remove(target)
+                    future = executor.submit(
+                        _build_target,
+                        target,
+                        cache,
+                        push_,
+                        len(targets) > 1,
+                        io_slots,
+                    )
+                    running[future] = target
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                target = running.pop(future)
+                try:
+                    durations[target] = future.result()
+
+                except Exception as e:
+                    errors[target] = e
+                    print(f"Failed to build {target}: {e}", file=sys.stderr)
+
+    if len(targets) > 1:
+        width = max(len(x) for x in targets)
+        print("Build summary:")
+        for target in dependencies:
+            if target in durations:
+                status = f"{durations[target]:.1f}s"
+
+            elif target in errors:
+                status = "failed"
+
+            else:
+                status = "skipped"
+
+            print(f"  {target.ljust(width)} {status}")
+
+        print(f"  {'total'.ljust(width)} {time() - start:.1f}s")
+
+    if errors:
+        raise ExceptionGroup(
+            "Failed to build",
+            list(errors.values()),
+        )
+
+
+def pull_base_images(targets: list[str], jobs: int = 1) -> None:
+    # Targets that share a base image would each pull it, so pull every base
+    # image once before any of them start. Images built here are left alone
+    built = {image_qualified_name(f"{REPO}:{x}") for x in targets}
+    images = sorted(
+        {
+            x
+            for target in targets
+            for x in base_images(*target_containerfile(target))
+            if x not in built
+        }
+    )
+    missing = [x for x in images if not image_exists(x, False, False)]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(pull, x): x for x in missing}
+        for future, image in futures.items():
+            try:
+                future.result()
+
+            except Exception as e:
+                # The targets that need it will try again, and fail on their own
+                print(f"Failed to pull {image}: {e}", file=sys.stderr)
+
+
+def target_containerfile(target: str) -> tuple[str, dict[str, str]]:
     build_args: dict[str, str] = {}
     containerfile = f"variants/{target}.Containerfile"
     if target == "rootfs":
@@ -80,10 +251,27 @@ def build(target: str, cache: bool = True) -> None:
         containerfile = f"templates/{template}.Containerfile"
         build_args["BASE_VARIANT_ID"] = f"{base_variant}"
 
+    return containerfile, build_args
+
+
+def build(
+    target: str,
+    cache: bool = True,
+    onstdout: Callable[[bytes], None] = bytes_to_stdout,
+    onstderr: Callable[[bytes], None] = bytes_to_stderr,
+    *,
+    io_slots: threading.BoundedSemaphore | None = None,
+) -> None:
+    if io_slots is None:
+        io_slots = threading.BoundedSemaphore(1)
+
+    now = datetime.now(UTC)
+    containerfile, build_args = target_containerfile(target)
     for base_image in base_images(containerfile, build_args):
-        print(f"Base image {base_image}")
+        onstdout(f"Base image {base_image}\n".encode())
         if not image_exists(base_image, False, False):
-            pull(base_image)
+            with io_slots:
+                pull(base_image, onstdout=onstdout, onstderr=onstderr)
 
     build_tag = f"localhost/build:{target}"
     if target == "rootfs":
@@ -103,10 +291,12 @@ def build(target: str, cache: bool = True) -> None:
         "--timestamp=1735689640",
         "--annotation=io.github.containers.compression.zstd=true",
         ".",
+        onstdout=onstdout,
+        onstderr=onstderr,
     )
     if target == "rootfs":
-        podman("tag", build_tag, f"{REPO}:{target}")
-        podman("rmi", build_tag)
+        image_tag(build_tag, f"{REPO}:{target}")
+        image_remove(build_tag)
         return
 
     build_args["HASH"] = hash(target)
@@ -120,7 +310,8 @@ def build(target: str, cache: bool = True) -> None:
         build_args["VARIANT_ID"] = f"{labels['os-release.VARIANT_ID']}-{template}"
         build_args["VERSION_ID"] = f"{labels['os-release.VERSION_ID']}"
         if not image_exists(f"{REPO}:{base_variant}", False, False):
-            pull(f"{REPO}:{base_variant}")
+            with io_slots:
+                pull(f"{REPO}:{base_variant}", onstdout=onstdout, onstderr=onstderr)
 
     else:
         image = f"{REPO}:rootfs"
@@ -137,11 +328,10 @@ def build(target: str, cache: bool = True) -> None:
     build_args["MIRRORLIST"] = json.dumps(
         [
             x.split(" = ", 1)[1]
-            for x in in_system_output(
-                "cat",
+            for x in image_run_output(
+                build_tag,
                 "/etc/pacman.d/mirrorlist",
-                entrypoint="",
-                target=build_tag,
+                entrypoint="/usr/bin/cat",
             )
             .decode("utf-8")
             .splitlines()
@@ -155,15 +345,7 @@ def build(target: str, cache: bool = True) -> None:
     build_args["HOME_URL"] = f"{labels['os-release.HOME_URL']}"
     build_args["BUG_REPORT_URL"] = f"{labels['os-release.BUG_REPORT_URL']}"
     build_args["PACKAGES"] = (
-        subprocess.check_output(
-            podman_cmd(
-                "run",
-                "--rm",
-                "--entrypoint=/usr/sbin/pacman",
-                build_tag,
-                "-Q",
-            )
-        )
+        image_run_output(build_tag, "-Q", entrypoint="/usr/sbin/pacman")
         .decode("utf-8")
         .strip()
     )
@@ -179,8 +361,10 @@ def build(target: str, cache: bool = True) -> None:
         "--timestamp=1735689640",
         "--annotation=io.github.containers.compression.zstd=true",
         ".",
+        onstdout=onstdout,
+        onstderr=onstderr,
     )
-    podman("rmi", build_tag)
+    image_remove(build_tag)
 
 
 if __name__ == "__main__":
@@ -13,7 +13,7 @@ from typing import (
 from . import BUILDER, podman
 
 kwds: dict[str, str] = {
-    "help": f"Build the {BUILDER} image",
+    "help": "Build the builder tool image",
 }
 
 
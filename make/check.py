@@ -2,32 +2,252 @@ import json
 import os
 import shlex
 import shutil
+import subprocess
 import sys
+import tempfile
+import threading
 from argparse import (
     ArgumentParser,
     Namespace,
 )
+from hashlib import sha256
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from time import time
 from typing import (
     Any,
+    ClassVar,
     cast,
+    override,
 )
 
 from . import (
     IMAGE,
+    OS_OVERLAY_PATH,
+    OS_PATH,
     REPO,
     _execute,  # pyright: ignore[reportPrivateUsage]
-    _osDir,  # pyright: ignore[reportPrivateUsage]
+    _os,  # pyright: ignore[reportPrivateUsage, reportPrivateLocalImportUsage]
     bytes_to_stderr,
     bytes_to_stdout,
     chronic,
     execute_pipe,
     image_qualified_name,
 )
+from .retention import delete_unsupported
 
 kwds: dict[str, str] = {
     "help": "Check the codebase and ensure it follows standards",
 }
 
+STARTUP_COMMANDS: list[list[str]] = [
+    ["config"],
+    ["workflow", "--check"],
+    ["variants-diagram", "--check"],
+    ["hash-builder"],
+]
+# How many times slower than starting the interpreter itself a command may be
+STARTUP_BUDGET = 15
+
+
+class _RegistryStandIn(BaseHTTPRequestHandler):
+    protocol_version: str = "HTTP/1.1"
+    manifest: bytes = json.dumps(
+        {
+            "schemaVersion": 2,
+            "mediaType": "application/vnd.oci.image.manifest.v1+json",
+            "layers": [{"digest": "sha256:0", "size": 3}],
+        }
+    ).encode()
+    tags: ClassVar[list[str]] = [f"tag{x}" for x in range(3)]
+    tokens: int = 0
+    ports: ClassVar[set[int]] = set()
+    pushed: ClassVar[dict[str, bytes]] = {}
+
+    def _reply(self, status: int, body: bytes, headers: dict[str, str]) -> None:
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            _ = self.wfile.write(body)
+
+    def do_PUT(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Authorization") != "Bearer abc":
+            self.do_GET()
+            return
+
+        _RegistryStandIn.pushed[self.path.rsplit("/", 1)[1]] = body
+        self._reply(
+            201, b"", {"Docker-Content-Digest": f"sha256:{sha256(body).hexdigest()}"}
+        )
+
+    def do_HEAD(self) -> None:
+        self.do_GET()
+
+    def do_DELETE(self) -> None:
+        if self.headers.get("Authorization") != "Bearer abc":
+            self.do_GET()
+            return
+
+        self._reply(
+            405,
+            b'{"errors": [{"code": "UNSUPPORTED", "message": "unsupported"}]}',
+            {},
+        )
+
+    def do_GET(self) -> None:
+        _RegistryStandIn.ports.add(self.client_address[1])
+        if self.path.startswith("/token?"):
+            _RegistryStandIn.tokens += 1
+            self._reply(200, b'{"token": "abc", "expires_in": 300}', {})
+            return
+
+        if self.headers.get("Authorization") != "Bearer abc":
+            host = f"http://{self.headers['Host']}"
+            self._reply(
+                401,
+                b"",
+                {
+                    "WWW-Authenticate": f'Bearer realm="{host}/token",'
+                    + 'service="test",scope="repository:test/repo:pull"'
+                },
+            )
+            return
+
+        if self.path.startswith("/v2/test/repo/tags/list"):
+            last = self.path.rsplit("last=", 1)[1] if "last=" in self.path else None
+            tags = self.tags[self.tags.index(last) + 1 :] if last else self.tags
+            headers: dict[str, str] = {}
+            if len(tags) > 1:
+                headers["Link"] = (
+                    f'</v2/test/repo/tags/list?n=1&last={tags[0]}>; rel="next"'
+                )
+
+            self._reply(200, json.dumps({"tags": tags[:1]}).encode(), headers)
+            return
+
+        if self.path == "/v2/test/repo/manifests/latest":
+            self._reply(
+                200,
+                self.manifest,
+                {
+                    "Docker-Content-Digest": f"sha256:{sha256(self.manifest).hexdigest()}"
+                },
+            )
+            return
+
+        self._reply(404, b"", {})
+
+    @override
+    def log_message(self, format: str, *args: Any) -> None:  # pyright: ignore[reportExplicitAny]
+        pass
+
+
+def _check_registry_client() -> bool:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RegistryStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    registry = f"localhost:{server.server_address[1]}"
+    client = _os.registry.RegistryClient()  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    try:
+        tags = cast(list[str], client.tags(registry, "test/repo"))  # pyright: ignore[reportUnknownMemberType]
+        digest = cast(str, client.manifest_digest(registry, "test/repo", "latest"))  # pyright: ignore[reportUnknownMemberType]
+        _, raw = cast(
+            tuple[str, bytes],
+            client.manifest(registry, "test/repo", "latest"),  # pyright: ignore[reportUnknownMemberType]
+        )
+        retagged = cast(
+            str,
+            client.put_manifest(registry, "test/repo", "retag", raw),  # pyright: ignore[reportUnknownMemberType]
+        )
+        try:
+            _ = client.manifest_digest(registry, "test/repo", "missing")  # pyright: ignore[reportUnknownMemberType]
+            status = 200
+
+        except _os.registry.RegistryError as e:  # pyright: ignore[reportUnknownMemberType]
+            status = cast(int, e.status)  # pyright: ignore[reportUnknownMemberType]
+
+        try:
+            client.delete_manifest(registry, "test/repo", "retag")  # pyright: ignore[reportUnknownMemberType]
+            unsupported = False
+
+        except _os.registry.RegistryError as e:  # pyright: ignore[reportUnknownMemberType]
+            unsupported = delete_unsupported(cast(Exception, e))
+
+    finally:
+        client.close()  # pyright: ignore[reportUnknownMemberType]
+        server.shutdown()
+        server.server_close()
+
+    checks = {
+        "tags": (tags, _RegistryStandIn.tags),
+        "digest": (digest, f"sha256:{sha256(_RegistryStandIn.manifest).hexdigest()}"),
+        "manifest": (raw, _RegistryStandIn.manifest),
+        "missing": (status, 404),
+        "delete unsupported": (unsupported, True),
+        "retag": (
+            (retagged, _RegistryStandIn.pushed.get("retag", None)),
+            (digest, _RegistryStandIn.manifest),
+        ),
+        # One for the pull scope, one for the pull,push scope
+        "tokens": (_RegistryStandIn.tokens, 2),
+        "connections": (len(_RegistryStandIn.ports), 1),
+    }
+    ok = True
+    for name, (actual, expected) in checks.items():
+        if actual != expected:
+            print(f" Failed: registry client {name}")
+            print(f"  Expected: {expected!r}")
+            print(f"  Actual: {actual!r}")
+            ok = False
+
+    return ok
+
+
+def _check_archiso_extract() -> bool:
+    from _os.cli.iso import extract_archiso  # noqa: PLC0415  # pyright: ignore[reportMissingImports, reportUnknownVariableType]
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # The same layout as the image, /etc is a symlink to /usr/etc
+        root = os.path.join(tmpdir, "root")
+        system = os.path.join(root, "usr/etc/system")
+        os.makedirs(os.path.join(system, "archiso"))
+        for name in ("archiso/grub.cfg", "efiboot.img"):
+            with open(os.path.join(system, name), "w") as f:
+                _ = f.write(name)
+
+        os.symlink("/usr/etc", os.path.join(root, "etc"))
+        chronic("mksquashfs", root, os.path.join(tmpdir, "airootfs.sfs"))
+        os.chdir(tmpdir)
+        try:
+            extract_archiso("airootfs.sfs")
+
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f" Failed: extract_archiso raised {e!r}")
+            return False
+
+        finally:
+            os.chdir(cwd)
+
+        missing = [
+            x
+            for x in ("archiso/grub.cfg", "efiboot.img")
+            if not os.path.isfile(os.path.join(tmpdir, x))
+        ]
+
+    if missing:
+        print(f" Failed: extract_archiso did not extract {', '.join(missing)}")
+        return False
+
+    return True
+
 
 def register(parser: ArgumentParser) -> None:
     _ = parser.add_argument(
@@ -79,6 +299,14 @@ def command(args: Namespace) -> None:
     )
     failed = failed or not _assert_name(f"{IMAGE}:latest", f"{REPO}:latest")
     failed = failed or not _assert_name(IMAGE, REPO)
+    failed = not _check_registry_client() or failed
+    if (
+        shutil.which("mksquashfs") is not None
+        and shutil.which("unsquashfs") is not None
+    ):
+        print("[check] Checking archiso extraction", file=sys.stderr)
+        failed = not _check_archiso_extract() or failed
+
     if shutil.which("niri") is not None:
         print("[check] Checking niri config", file=sys.stderr)
         cmd = shlex.join(
@@ -248,29 +476,35 @@ def command(args: Namespace) -> None:
         print(f"[check] Failed: {cmd}\nStatus code: {res}", file=sys.stderr)
         failed = True
 
-    cmd = shlex.join(
-        [
-            "bash",
-            "-ec",
-            ";".join(
-                [
-                    "source .venv/bin/activate",
-                    shlex.join(
-                        [
-                            "basedpyright",
-                            "--pythonversion=3.14",
-                            "--pythonplatform=Linux",
-                            "--venvpath=.venv",
-                            "make.py",
-                            f"{_osDir}",
-                        ]
-                    ),
-                ]
-            ),
-        ]
-    )
-    print("[check] Checking python types", file=sys.stderr)
-    res = _execute(cmd)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # basedpyright needs to see the base and atomic _os overlays as one package
+        os_path = os.path.join(tmpdir, "lib/system/_os")
+        _ = shutil.copytree(os.path.join(OS_PATH, "_os"), os_path)
+        _ = shutil.copytree(OS_OVERLAY_PATH, os_path, dirs_exist_ok=True)
+        cmd = shlex.join(
+            [
+                "bash",
+                "-ec",
+                ";".join(
+                    [
+                        "source .venv/bin/activate",
+                        shlex.join(
+                            [
+                                "basedpyright",
+                                "--pythonversion=3.14",
+                                "--pythonplatform=Linux",
+                                "--venvpath=.venv",
+                                "make.py",
+                                tmpdir,
+                            ]
+                        ),
+                    ]
+                ),
+            ]
+        )
+        print("[check] Checking python types", file=sys.stderr)
+        res = _execute(cmd)
+
     if res:
         print(f"[check] Failed: {cmd}\nStatus code: {res}", file=sys.stderr)
         failed = True
@@ -311,6 +545,44 @@ def command(args: Namespace) -> None:
         print(f"[check] Failed: {cmd}\nStatus code: {res}", file=sys.stderr)
         failed = True
 
+    def _time(argv: list[str]) -> tuple[int, float]:
+        start = time()
+        res = subprocess.run(
+            argv,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        ).returncode
+        return res, time() - start
+
+    print("[check] Checking startup time", file=sys.stderr)
+    for command_args in STARTUP_COMMANDS:
+        cmd = shlex.join([sys.executable, "make.py", *command_args])
+        # The baseline is measured alongside the command, so a loaded machine
+        # slows both down instead of failing the check
+        baselines: list[float] = []
+        timings: list[float] = []
+        for _ in range(3):
+            _, baseline = _time([sys.executable, "-c", "pass"])
+            baselines.append(baseline)
+            res, timing = _time([sys.executable, "make.py", *command_args])
+            timings.append(timing)
+            if res:
+                break
+
+        if res:
+            print(f"[check] Failed: {cmd}\nStatus code: {res}", file=sys.stderr)
+            failed = True
+
+        elif min(timings) > min(baselines) * STARTUP_BUDGET:
+            print(
+                f"[check] Too slow: {cmd}\n"
+                + f"Took {min(timings):.3f}s, budget is {STARTUP_BUDGET}x the "
+                + f"{min(baselines):.3f}s interpreter startup",
+                file=sys.stderr,
+            )
+            failed = True
+
     if failed:
         print("[check] One or more checks failed", file=sys.stderr)
         sys.exit(1)
@@ -26,6 +26,7 @@ from . import (
 )
 from .hash import hash
 from .pull import pull
+from .tags import load_tag_index
 
 kwds: dict[str, str] = {
     "help": "Check to see if a variant has updates and needs to be rebuilt",
@@ -56,8 +57,9 @@ def command(args: Namespace) -> None:
         containerfile = f"templates/{template}.Containerfile"
 
     image = image_qualified_name(f"{REPO}:{target}")
-    exists = image_exists(image, True, False)
-    if exists and not image_exists(image, False, False):
+    exists = image_exists(image, False, False)
+    if not exists and target in load_tag_index().variant_tags:
+        exists = True
         try:
             pull(image)
 
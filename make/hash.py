@@ -1,8 +1,10 @@
 import os
+import threading
 from argparse import (
     ArgumentParser,
     Namespace,
 )
+from functools import cache
 from glob import iglob
 from hashlib import sha256
 from typing import (
@@ -11,19 +13,28 @@ from typing import (
 )
 
 from . import (
-    REPO,
-    image_exists,
-    image_labels,
+    MetadataCache,
 )
 from . import (
     file_hash as _file_hash,
 )
-from .config import parse_config
+from .config import parse_all_config
+from .workflow import (
+    Graph,
+    build_job_graph,
+    topological_sort,
+)
 
 kwds: dict[str, str] = {
     "help": "Get the variant hash",
 }
 
+HASH_CACHE_PATH = os.path.join(os.environ.get("TMPDIR", "/tmp"), "hash_cache")  # noqa: S108
+HASH_CACHE_TTL = 60 * 60 * 24 * 7
+_hash_cache: MetadataCache | None = None
+_file_hashes: dict[str, str] = {}
+_file_hashes_lock = threading.Lock()
+
 
 def register(parser: ArgumentParser) -> None:
     _ = parser.add_argument(
@@ -32,70 +43,78 @@ def register(parser: ArgumentParser) -> None:
     _ = parser.add_argument(
         "target",
         action="extend",
-        nargs="+",
+        nargs="*",
         type=str,
         metavar="VARIANT",
-        help="Variant to hash",
+        help="Variant to hash, defaults to all variants",
     )
 
 
 def command(args: Namespace) -> None:
-    for target in cast(list[str], args.target):
-        if not cast(bool, args.debug):
-            print(f"{target}: {hash(target)[:9]}")
+    debug = cast(bool, args.debug)
+    targets = cast(list[str], args.target)
+    if not targets:
+        graph, indegree = build_job_graph(parse_all_config())
+        targets = topological_sort(graph, indegree)
+
+    for target in targets:
+        digest, parts = hash_with_parts(target)
+        if not debug:
+            print(f"{target}: {digest[:9]}")
             continue
 
-        print(f"{target}: {hash(target)[:9]}\n  ", end="")
-        print("\n  ".join([f"{t.ljust(5)} {n}: {h}" for t, n, h in hash_parts(target)]))
+        print(f"{target}: {digest[:9]}\n  ", end="")
+        print("\n  ".join([f"{t.ljust(5)} {n}: {h}" for t, n, h in parts]))
 
 
 def file_hash(file: str) -> str:
-    return _file_hash(file)[:9]
+    return _cached_file_hash(file)[:9]
 
 
-def hash_parts(target: str) -> list[tuple[str, str, str]]:
-    parts: list[tuple[str, str, str]] = []
-    containerfile = (
-        f"variants/{target}.Containerfile"
-        if target != "rootfs"
-        else "rootfs.Containerfile"
+def _cached_file_hash(file: str) -> str:
+    global _hash_cache
+    # Anything that changes the output of _file_hash will also change one of these
+    st = os.stat(file)
+    key = "\0".join(
+        [
+            os.path.abspath(file),
+            str(st.st_ino),
+            str(st.st_size),
+            str(st.st_mtime_ns),
+            str(st.st_mode),
+            str(st.st_uid),
+            str(st.st_gid),
+            *sorted(os.listxattr(file)),
+        ]
     )
-    # TODO also include hash from x-depends
-    if "-" in target and not os.path.exists(containerfile):
-        base_variant, template = target.rsplit("-", 1)
-        containerfile = f"templates/{template}.Containerfile"
-        image = f"{REPO}:{base_variant}"
-        labels = image_labels(image, not image_exists(image, False, False))
-        parts.append(("image", image, labels["hash"][:9]))
+    with _file_hashes_lock:
+        if _hash_cache is None:
+            _hash_cache = MetadataCache(HASH_CACHE_PATH)
+            _file_hashes.update(_hash_cache.all("file"))
 
-    elif target != "rootfs":
-        _, config = parse_config(containerfile)
-        depends = config.get("depends", "rootfs")
-        image = f"{REPO}:{depends}"
-        labels = image_labels(image, not image_exists(image, False, False))
-        parts.append(("image", image, labels["hash"][:9]))
+        digest = _file_hashes.get(key, None)
 
-    parts.append(("file", containerfile, file_hash(containerfile)))
-    for file in sorted(iglob(f"overlay/{target}/**", recursive=True)):
-        parts.append(("dir" if os.path.isdir(file) else "file", file, file_hash(file)))
+    if digest is None:
+        digest = _file_hash(file)
+        with _file_hashes_lock:
+            _file_hashes[key] = digest
 
-    for file in sorted(
-        [
-            "build.py",
-            "hash.py",
-            "pull.py",
-            "push.py",
-            "__init__.py",
-        ]
-    ):
-        file = f"make/{file}"  # noqa: PLW2901
-        parts.append(("file", file, file_hash(file)))
+        _hash_cache.set("file", key, digest, HASH_CACHE_TTL)
 
-    return parts
+    return digest
 
 
-def hash(target: str) -> str:
+@cache
+def _job_graph() -> Graph:
+    graph, _ = build_job_graph(parse_all_config())
+    return graph
+
+
+@cache
+def hash_with_parts(target: str) -> tuple[str, tuple[tuple[str, str, str], ...]]:
     m = sha256()
+    parts: list[tuple[str, str, str]] = []
+    depends = cast(str | None, _job_graph().get(target, {}).get("depends", None))
     containerfile = (
         f"variants/{target}.Containerfile"
         if target != "rootfs"
@@ -104,15 +123,22 @@ def hash(target: str) -> str:
     if "-" in target and not os.path.exists(containerfile):
         base_variant, template = target.rsplit("-", 1)
         containerfile = f"templates/{template}.Containerfile"
-        image = f"{REPO}:{base_variant}"
-        labels = image_labels(image, not image_exists(image, False, False))
-        m.update(labels["hash"].encode("utf-8"))
+        depends = depends or base_variant
+
+    if depends is not None and depends in _job_graph():
+        # Merkle style, any change to a parent variant changes all of its children
+        parent = hash(depends)
+        m.update(parent.encode("utf-8"))
+        parts.append(("hash", depends, parent[:9]))
 
     with open(containerfile, "rb") as f:
         m.update(f.read())
 
+    parts.append(("file", containerfile, file_hash(containerfile)))
     for file in sorted(iglob(f"overlay/{target}/**", recursive=True)):
-        m.update(file_hash(file).encode("utf-8"))
+        digest = file_hash(file)
+        m.update(digest.encode("utf-8"))
+        parts.append(("dir" if os.path.isdir(file) else "file", file, digest))
 
     for file in sorted(
         [
@@ -123,9 +149,20 @@ def hash(target: str) -> str:
             "__init__.py",
         ]
     ):
-        m.update(file_hash(f"make/{file}").encode("utf-8"))
+        file = f"make/{file}"  # noqa: PLW2901
+        digest = file_hash(file)
+        m.update(digest.encode("utf-8"))
+        parts.append(("file", file, digest))
+
+    return m.hexdigest(), tuple(parts)
+
 
-    return m.hexdigest()
+def hash_parts(target: str) -> list[tuple[str, str, str]]:
+    return list(hash_with_parts(target)[1])
+
+
+def hash(target: str) -> str:
+    return hash_with_parts(target)[0]
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+import json
 import os
 import subprocess
 import tempfile
@@ -18,6 +19,7 @@ from datetime import (
     datetime,
     timedelta,
 )
+from hashlib import sha256
 from time import sleep
 from typing import (
     Any,
@@ -26,18 +28,24 @@ from typing import (
 
 from . import (
     REPO,
+    RegistryError,
     _os,  # pyright: ignore[reportPrivateUsage, reportPrivateLocalImportUsage]
     bytes_to_stderr,
     chronic,
-    escape_label,
     image_digest_cached,
     image_labels,
     image_tags,
+    invalidate_metadata,
     podman,
     podman_cmd,
     progress_bar,
 )
 from .config import parse_all_config
+from .tags import (
+    INDEX_LABEL,
+    TagIndex,
+    classify_tag,
+)
 
 _latest_manifest = cast(Callable[[], bool], _os.podman._latest_manifest)  # pyright:ignore [reportUnknownMemberType]
 
@@ -52,6 +60,11 @@ def register(parser: ArgumentParser) -> None:
         action="store_true",
         help="Push the manifest after it builds",
     )
+    _ = parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Resolve every tag instead of only the ones that may have changed",
+    )
 
 
 def command(args: Namespace) -> None:
@@ -68,149 +81,215 @@ def command(args: Namespace) -> None:
     try:
         manifest = image_labels(f"{REPO}:_manifest", True)
 
-    except subprocess.CalledProcessError:
+    except RegistryError:
         manifest = {}
 
+    previous: dict[str, str] = {}
+    if not cast(bool, args.full):
+        previous = {
+            k[19:]: v
+            for k, v in manifest.items()
+            if k.startswith("arkes.manifest.tag.")
+        }
+
     config = parse_all_config()
     print("Getting all tags...")
     all_tags = image_tags(REPO, True)
     assert all_tags, "No tags found"
-    digest_worker_queue: list[tuple[str, bool]] = []
+    index = TagIndex(all_tags)
+    # Tags that can be moved to a new digest by a later build
+    mutable_tags: list[str] = []
+    immutable_tags: list[str] = []
     valid_variants = ["rootfs", *config["variants"].keys()]
+    valid_templates = [
+        y
+        for x in config["variants"].values()
+        for y in cast(list[str], x.get("templates", []))
+    ]
+    # Version tags are moved by every build on that date, stop checking them once
+    # no more builds can happen for that date
+    cutoff = datetime.now(UTC).date() - timedelta(days=3)
     print("Classifying tags...")
-    for tag in all_tags:
-        kind, a, version = _classify_tag(tag)
-        if kind in ("other", "manifest"):
-            continue
-
-        if kind not in ("build", "version", "variant"):
-            # this should never happen, but just in case we add a new kind of tag
-            digest_worker_queue.append((tag, False))
-            continue
-
-        assert a
-        parts = a.split("-", 1)
-        variant = parts[0]
-        if variant not in valid_variants:
+    for variant in index.variants():
+        parts = variant.split("-", 1)
+        if parts[0] not in valid_variants:
             continue
 
-        if "-" in a and parts[1] not in [
-            y
-            for x in config["variants"].values()
-            for y in cast(list[str], x.get("templates", []))
-        ]:
+        if len(parts) > 1 and parts[1] not in valid_templates:
             continue
 
-        skip = True
-        if kind in ("version", "build"):
-            assert version is not None
-            if kind == "build":
-                version = version.rsplit(".", 1)[0]
+        if variant in index.variant_tags:
+            mutable_tags.append(variant)
 
-            tag_date = datetime.strptime(version, "%Y.%m.%d")
-            age = datetime.now(UTC).date() - tag_date.date()
-            skip = age > timedelta(days=3)
+        mutable_tags += index.versions_since(variant, cutoff)
+        immutable_tags += index.versions_before(variant, cutoff)
+        immutable_tags += index.build_tags(variant)
 
-        digest_worker_queue.append((tag, skip))
+    for tag in index.other:
+        if classify_tag(tag)[0] != "other":
+            # this should never happen, but just in case we add a new kind of tag
+            mutable_tags.append(tag)
 
-    assert digest_worker_queue, "No tags found"
+    assert mutable_tags or immutable_tags, "No tags found"
 
     digest_queue: dict[Future[str], str] = {}
     digests: list[tuple[str, str]] = []
     print("Queuing digest requests...")
-    for tag, skip in digest_worker_queue:
-        digest = None
-        if not skip:
-            digest = manifest.get(f"arkes.manifest.tag.{tag}", None)
-
+    for tag in immutable_tags:
+        digest = previous.get(tag, None)
         if digest is not None:
             digests.append((tag, digest))
             continue
 
-        future = image_digest_cached(f"{REPO}:{tag}", skip_manifest=skip)
+        future = image_digest_cached(f"{REPO}:{tag}", skip_manifest=True)
         digest_queue[future] = tag
 
+    for tag in mutable_tags:
+        future = image_digest_cached(f"{REPO}:{tag}", skip_manifest=True)
+        digest_queue[future] = tag
+
+    tags = {*mutable_tags, *immutable_tags}
+    print(
+        f"Reusing {len(digests)} digests, resolving {len(digest_queue)}, "
+        + f"{len(tags - previous.keys())} new tags, "
+        + f"{len(previous.keys() - tags)} removed tags"
+    )
     labels: dict[str, str] = {}
     for tag, digest in progress_bar(
         _as_completed_digests(digests, digest_queue),
         prefix="Encoding digests... ",
-        count=len(digest_worker_queue),
+        count=len(tags),
     ):
-        labels[f"tag.{tag}"] = digest
-
-    labels["timestamp"] = datetime.now(tz=UTC).replace(microsecond=0).isoformat() + "Z"
-    print("Generating Containerfile...")
+        labels[f"arkes.manifest.tag.{tag}"] = digest
+
+    changed = sorted(k[19:] for k, v in labels.items() if manifest.get(k, None) != v)
+    print(f"{len(changed)} new or moved tags")
+    created = datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+    labels[INDEX_LABEL] = TagIndex(
+        k[19:] for k in labels if k.startswith("arkes.manifest.tag.")
+    ).to_json()
+    labels["arkes.manifest.timestamp"] = created
+    labels["arkes.manifest.version"] = "1"
+    image = f"{REPO}:_manifest"
+    print(f"Building {image}...")
     with tempfile.TemporaryDirectory() as tmpdir:
-        containerfile = os.path.join(tmpdir, "Containerfile")
-        with open(containerfile, "w") as f:
-            _ = f.write("FROM scratch\nLABEL \\")
-            for k, v in labels.items():
-                _ = f.write(f'\n  arkes.manifest.{k}="{escape_label(v)}" \\')
+        _write_oci_image(tmpdir, labels, created)
+        image_id = (
+            subprocess.check_output(
+                podman_cmd("pull", "--quiet", f"oci:{tmpdir}:_manifest")
+            )
+            .strip()
+            .decode("utf-8")
+        )
 
-            _ = f.write('\n  arkes.manifest.version="1"\n')
+    chronic(podman_cmd("tag", image_id, image))
+    if not cast(bool, args.push):
+        return
 
-        image = f"{REPO}:_manifest"
-        print(f"Building {image}...")
-        try:
-            chronic(
-                podman_cmd(
-                    "build",
-                    f"--tag={image}",
-                    f"--file={containerfile}",
-                    tmpdir,
-                )
-            )
+    e: Exception | None = None
+    stderr: bytes = b""
 
-        except Exception:
-            tmppath = f"/tmp/{os.getpid()}.manifest.Containerfile"  # noqa: S108
-            with (
-                open(containerfile) as f,
-                open(tmppath, "w") as out,
-            ):
-                _ = out.write(f.read())
+    def onstderr(line: bytes) -> None:
+        nonlocal stderr
+        stderr += line
+        bytes_to_stderr(line)
 
-            print(f"Containerfile: {tmppath}")
+    for attempt in range(10):
+        stderr = b""
+        try:
+            podman("push", image, onstderr=onstderr)
+            invalidate_metadata(image)
+            return
+
+        except AssertionError:
             raise
 
-        if not cast(bool, args.push):
-            return
+        except subprocess.CalledProcessError as ex:
+            e = ex
+            if (
+                b"unauthorized: access to the requested resource is not authorized"
+                in stderr
+            ):
+                raise
 
-        e: Exception | None = None
-        stderr: bytes = b""
+        except Exception as ex:
+            e = ex
 
-        def onstderr(line: bytes) -> None:
-            nonlocal stderr
-            stderr += line
-            bytes_to_stderr(line)
+        sleep(1.0 * (2**attempt))  # pyright: ignore[reportAny]
 
-        for attempt in range(10):
-            stderr = b""
-            try:
-                podman("push", image, onstderr=onstderr)
-                return
+    assert e is not None
+    raise e
 
-            except AssertionError:
-                raise
 
-            except subprocess.CalledProcessError as ex:
-                e = ex
-                if (
-                    b"unauthorized: access to the requested resource is not authorized"
-                    in stderr
-                ):
-                    raise
+def _write_blob(layout: str, data: bytes) -> dict[str, str | int]:
+    digest = sha256(data).hexdigest()
+    with open(os.path.join(layout, "blobs/sha256", digest), "wb") as f:
+        _ = f.write(data)
 
-            except Exception as ex:
-                e = ex
+    return {"digest": f"sha256:{digest}", "size": len(data)}
 
-            sleep(1.0 * (2**attempt))  # pyright: ignore[reportAny]
 
-        assert e is not None
-        raise e
+def _write_oci_image(layout: str, labels: dict[str, str], created: str) -> None:
+    os.makedirs(os.path.join(layout, "blobs/sha256"), exist_ok=True)
+    # An empty tar archive, some registries reject images without any layers
+    layer = _write_blob(layout, b"\0" * 1024)
+    config = _write_blob(
+        layout,
+        json.dumps(
+            {
+                "created": created,
+                "architecture": "amd64",
+                "os": "linux",
+                "config": {"Labels": labels},
+                "rootfs": {"type": "layers", "diff_ids": [layer["digest"]]},
+                "history": [{"created": created, "created_by": "make manifest"}],
+            },
+            sort_keys=True,
+        ).encode(),
+    )
+    manifest = _write_blob(
+        layout,
+        json.dumps(
+            {
+                "schemaVersion": 2,
+                "mediaType": "application/vnd.oci.image.manifest.v1+json",
+                "config": {
+                    "mediaType": "application/vnd.oci.image.config.v1+json",
+                    **config,
+                },
+                "layers": [
+                    {
+                        "mediaType": "application/vnd.oci.image.layer.v1.tar",
+                        **layer,
+                    }
+                ],
+            },
+            sort_keys=True,
+        ).encode(),
+    )
+    with open(os.path.join(layout, "index.json"), "w") as f:
+        json.dump(
+            {
+                "schemaVersion": 2,
+                "manifests": [
+                    {
+                        "mediaType": "application/vnd.oci.image.manifest.v1+json",
+                        **manifest,
+                        "annotations": {
+                            "org.opencontainers.image.ref.name": "_manifest"
+                        },
+                    }
+                ],
+            },
+            f,
+        )
+
+    with open(os.path.join(layout, "oci-layout"), "w") as f:
+        json.dump({"imageLayoutVersion": "1.0.0"}, f)
 
 
 def _assertkind(tag: str, expected_kind: str) -> None:
-    kind, _, _ = _classify_tag(tag)
+    kind, _, _ = classify_tag(tag)
     assert kind == expected_kind, f"{kind} != {expected_kind}: {tag}"
 
 
@@ -222,44 +301,6 @@ def _as_completed_digests(
         yield digest_queue[future], future.result()
 
 
-def _classify_tag(tag: str) -> tuple[str, str | None, str | None]:
-    if tag.startswith("_"):
-        if tag == "_manifest":
-            return "manifest", None, None
-
-        return "other", None, None
-
-    if "_" not in tag:
-        if all(c.isalnum() or c == "-" for c in tag):
-            return "variant", tag, None
-
-        return "other", None, None
-
-    sep_idx = tag.rfind("_")
-    if sep_idx <= 0:
-        return "other", None, None
-
-    variant = tag[:sep_idx]
-    rest = tag[sep_idx + 1 :]
-    if not (variant and all(c.isalnum() or c == "-" for c in variant)):
-        return "other", None, None
-
-    if "." in rest:
-        last_dot = rest.rfind(".")
-        if last_dot > 0:
-            build_num = rest[last_dot + 1 :]
-            if build_num.isdigit():
-                version_part = rest[:last_dot]
-                if version_part.count(".") >= 2:
-                    full_version = f"{version_part}.{build_num}"
-                    return "build", variant, full_version
-
-    if rest and all(c.isalnum() or c in ".-" for c in rest):
-        return "version", variant, rest
-
-    return "other", None, None
-
-
 if __name__ == "__main__":
     kwds["description"] = kwds["help"]
     del kwds["help"]
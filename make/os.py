@@ -1,4 +1,3 @@
-import os
 import shlex
 import sys
 from argparse import (
@@ -11,8 +10,9 @@ from typing import (
 )
 
 from . import (
+    OS_OVERLAY_PATH,
+    OS_PATH,
     _execute,  # pyright: ignore[reportPrivateUsage]
-    _osDir,  # pyright: ignore[reportPrivateUsage]
 )
 
 kwds: dict[str, str] = {
@@ -33,7 +33,22 @@ def register(parser: ArgumentParser) -> None:
 
 def command(args: Namespace) -> None:
     ret = _execute(
-        shlex.join([os.path.join(_osDir, "bin/os"), *cast(list[str], args.arg or [])])
+        shlex.join(
+            [
+                sys.executable,
+                "-c",
+                ";".join(
+                    [
+                        "import sys",
+                        f"sys.path.insert(0, {OS_PATH!r})",
+                        "import _os",
+                        f"_os.__path__.append({OS_OVERLAY_PATH!r})",
+                        "_os.cli(sys.argv[1:])",
+                    ]
+                ),
+                *cast(list[str], args.arg or []),
+            ]
+        )
     )
     if ret:
         sys.exit(ret)
@@ -50,7 +50,6 @@ def command(args: Namespace) -> None:
                     for x in cast(list[str], args.build_arg or [])
                     for k, v in [x.split("=", 1)]
                 },
-                cast(bool, args.pretty),
             ),
             indent=2 if cast(bool, args.pretty) else None,
         )
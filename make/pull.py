@@ -13,7 +13,7 @@ import _os.podman  # pyright:ignore [reportMissingImports]
 
 from . import REPO, is_root
 
-pull = cast(Callable[[str], None], _os.podman.pull)  # pyright:ignore [reportUnknownMemberType]
+pull = cast(Callable[..., None], _os.podman.pull)  # pyright:ignore [reportUnknownMemberType]
 
 kwds: dict[str, str] = {
     "help": "Pull one or more tags from the remote repository",
@@ -1,4 +1,6 @@
+import os
 import sys
+import tempfile
 from argparse import (
     ArgumentParser,
     Namespace,
@@ -6,24 +8,20 @@ from argparse import (
 from collections.abc import Callable
 from typing import (
     Any,
-    Literal,
     cast,
 )
 
-import _os  # pyright: ignore[reportMissingImports]
-from podman import PodmanClient
-
 from . import (
     REPO,
     _image_digests_write_cache,  # pyright: ignore[reportPrivateUsage]
-    image_digest,
+    bytes_to_stderr,
+    bytes_to_stdout,
     image_labels,
+    image_retag,
     is_root,
     podman,
 )
 
-get_client = cast(Callable[[], PodmanClient], _os.podman.get_client)  # pyright: ignore[reportUnknownMemberType]
-
 kwds: dict[str, str] = {
     "help": "Push one or more tags to the remote repository",
 }
@@ -49,42 +47,47 @@ def command(args: Namespace) -> None:
         push(target)
 
 
-def push(target: str) -> None:
-    client = get_client()
+def push(
+    target: str,
+    onstdout: Callable[[bytes], None] = bytes_to_stdout,
+    onstderr: Callable[[bytes], None] = bytes_to_stderr,
+) -> None:
     image = f"{REPO}:{target}"
-    _image = client.images.get(image)
     labels = image_labels(image, False)
     tags: list[str] = []
     if labels.get("os-release.VERSION", None):
         version = labels["os-release.VERSION"]
         version_id = labels.get("os-release.VERSION_ID", None)
         if version_id and version != version_id:
-            tag = f"{target}_{version}.{version_id}"
-            tags.append(tag)
-            assert _image.tag(REPO, tag), "Failed to tag image"
-
-        tag = f"{target}_{version}"
-        tags.append(tag)
-        assert _image.tag(REPO, tag), "Failed to tag image"
+            tags.append(f"{target}_{version}.{version_id}")
+
+        tags.append(f"{target}_{version}")
+
+    tags.append(target)
+    # Upload the image once, the rest of the tags only need the manifest
+    with tempfile.TemporaryDirectory() as tmpdir:
+        digestfile = os.path.join(tmpdir, "digest")
+        podman(
+            "push",
+            "--retry=5",
+            "--compression-format=zstd:chunked",
+            f"--digestfile={digestfile}",
+            image,
+            f"docker://{REPO}:{tags[0]}",
+            onstdout=onstdout,
+            onstderr=onstderr,
+        )
+        with open(digestfile) as f:
+            digest = f.read().strip()
 
-    for tag in [*tags, target]:
-        image = f"{REPO}:{tag}"
-        podman("push", "--retry=5", "--compression-format=zstd:chunked", image)
-        print(f"Pushed {image}")
-        _image_digests_write_cache(image, image_digest(image, False, False))
+    onstdout(f"Pushed {REPO}:{tags[0]}\n".encode())
+    if len(tags) > 1:
+        _ = image_retag(f"{REPO}@{digest}", tags[1:])
+        for tag in tags[1:]:
+            onstdout(f"Tagged {REPO}:{tag}\n".encode())
 
-    results: list[
-        dict[Literal["Deleted", "Untagged", "Errors", "ExitCode"], str | int]
-    ] = []
     for tag in tags:
-        results.extend(client.images.remove(f"{REPO}:{tag}"))
-
-    errors = [x.get("Errors") for x in results if x.get("Errors") is not None]
-    if errors:
-        raise ExceptionGroup(
-            "Failed to remove tags",
-            [Exception(x) for x in errors],
-        )
+        _image_digests_write_cache(f"{REPO}:{tag}", digest)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,241 @@
+import sys
+from argparse import (
+    ArgumentParser,
+    Namespace,
+)
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+from datetime import (
+    UTC,
+    date,
+    datetime,
+    timedelta,
+)
+from typing import (
+    Any,
+    cast,
+)
+
+from . import (
+    REPO,
+    RegistryError,
+    _image_size_cached,  # pyright: ignore[reportPrivateUsage]
+    image_digest_cached,
+    image_labels,
+    image_untag,
+    invalidate_metadata,
+    progress_bar,
+)
+from .tags import (
+    TagIndex,
+    load_tag_index,
+)
+
+kwds: dict[str, str] = {
+    "help": "Delete old build tags from the remote repository",
+}
+
+type Policy = tuple[int, int]
+
+
+def register(parser: ArgumentParser) -> None:
+    _ = parser.add_argument(
+        "--keep-last",
+        type=int,
+        default=14,
+        metavar="N",
+        help="Number of most recent builds to keep for each variant",
+    )
+    _ = parser.add_argument(
+        "--keep-days",
+        type=int,
+        default=30,
+        metavar="DAYS",
+        help="Keep the latest build of each day for this many days",
+    )
+    _ = parser.add_argument(
+        "--policy",
+        action="append",
+        default=[],
+        metavar="VARIANT=N:DAYS",
+        help="Override --keep-last and --keep-days for a variant",
+    )
+    _ = parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only output what would be deleted",
+    )
+    _ = parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=8,
+        help="Number of tags to delete at once",
+    )
+
+
+def command(args: Namespace) -> None:
+    default: Policy = (cast(int, args.keep_last), cast(int, args.keep_days))
+    policies: dict[str, Policy] = {}
+    for policy in cast(list[str], args.policy):
+        variant, _, value = policy.partition("=")
+        last, _, days = value.partition(":")
+        if not variant or not last.isdigit() or not days.isdigit():
+            print(f"Invalid policy: {policy}", file=sys.stderr)
+            sys.exit(1)
+
+        policies[variant] = (int(last), int(days))
+
+    print("Getting manifest labels...")
+    try:
+        manifest = image_labels(f"{REPO}:_manifest", True)
+
+    except RegistryError as e:
+        if cast(int, getattr(e, "status")) != 404:
+            raise
+
+        # Without a manifest every tag, the variant tags included, is looked up
+        manifest = {}
+
+    digests = {
+        k[19:]: v for k, v in manifest.items() if k.startswith("arkes.manifest.tag.")
+    }
+    index = load_tag_index()
+    print("Resolving digests...")
+    # Only tags published after the manifest was generated need a lookup
+    futures: dict[str, Future[str]] = {
+        tag: image_digest_cached(f"{REPO}:{tag}", skip_manifest=True)
+        for variant in index.variants()
+        for tag in index.tags(variant)
+        if tag not in digests
+    }
+    for tag, future in futures.items():
+        try:
+            digests[tag] = future.result()
+
+        except RegistryError as e:
+            if cast(int, getattr(e, "status")) != 404:
+                raise
+
+            # Deleted since the tags were listed, there is nothing to plan for
+            print(f"Skipping {REPO}:{tag}, it no longer exists")
+
+    today = datetime.now(UTC).date()
+    delete: list[str] = []
+    keep: list[str] = []
+    for variant in index.variants():
+        _delete, _keep = plan(
+            index, variant, policies.get(variant, default), digests, today
+        )
+        delete += _delete
+        keep += _keep
+
+    if not delete:
+        print("Nothing to delete")
+        return
+
+    # Images are only reclaimed once no tag that is kept points at them anymore
+    kept = {digests[x] for x in keep}
+    reclaimed = {digests[x] for x in delete} - kept
+    sizes = [_image_size_cached(f"{REPO}@{x}") for x in reclaimed]
+    size = sum(x.result() if isinstance(x, Future) else x for x in sizes)
+    dry_run = cast(bool, args.dry_run)
+    for tag in delete:
+        print(f"{'Would delete' if dry_run else 'Deleting'} {REPO}:{tag}")
+
+    print(
+        f"{len(delete)} tags, {len(reclaimed)} images, "
+        + f"{size / 1024**3:.2f} GiB to reclaim (before layer sharing)"
+    )
+    if dry_run:
+        return
+
+    def untag(tag: str) -> str:
+        image_untag(f"{REPO}:{tag}")
+        invalidate_metadata(f"{REPO}:{tag}")
+        return tag
+
+    # Deleting by digest instead would also delete the kept tags that share it,
+    # so find out if the registry can delete tags before queuing the rest
+    try:
+        _ = untag(delete[0])
+
+    except RegistryError as e:
+        if not delete_unsupported(e):
+            raise
+
+        print(
+            f"The registry does not support deleting tags, nothing was deleted: {e}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    with ThreadPoolExecutor(max_workers=cast(int, args.jobs)) as executor:
+        for _ in progress_bar(
+            executor.map(untag, delete[1:]),
+            prefix="Deleting tags... ",
+            count=len(delete) - 1,
+        ):
+            pass
+
+    print("Run ./make.py manifest --push to publish the updated manifest")
+
+
+def delete_unsupported(e: Exception) -> bool:
+    # Deleting a manifest by tag is optional in the distribution spec
+    return cast(int, getattr(e, "status")) == 405 or "UNSUPPORTED" in cast(
+        str, getattr(e, "reason")
+    )
+
+
+def plan(
+    index: TagIndex,
+    variant: str,
+    policy: Policy,
+    digests: dict[str, str],
+    today: date,
+) -> tuple[list[str], list[str]]:
+    keep_last, keep_days = policy
+    # Tags without a digest have gone missing, they are neither kept nor deleted
+    builds = [x for x in index.builds.get(variant, []) if x[2] in digests]
+    keep = {x[2] for x in builds[len(builds) - keep_last :]} if keep_last else set()
+    cutoff = today - timedelta(days=keep_days)
+    # Builds are sorted, so the last one seen for each day is the latest
+    latest = {day: tag for day, _, tag in builds if day >= cutoff}
+    keep.update(latest.values())
+    # Whatever the variant tag points at must stay pullable by digest
+    current = digests.get(variant, None)
+    if current is not None:
+        keep.update(x[2] for x in builds if digests[x[2]] == current)
+        keep.add(variant)
+
+    delete = [x[2] for x in builds if x[2] not in keep]
+    # Version tags point at the latest build of their day
+    days = {day for day, _, tag in builds if tag in keep}
+    for day, tag in index.versions.get(variant, []):
+        if tag not in digests:
+            continue
+
+        if day in days:
+            keep.add(tag)
+
+        else:
+            delete.append(tag)
+
+    return delete, sorted(keep)
+
+
+if __name__ == "__main__":
+    kwds["description"] = kwds["help"]
+    del kwds["help"]
+    parser = ArgumentParser(
+        **cast(  # pyright: ignore[reportAny]
+            dict[str, Any],  # pyright: ignore[reportExplicitAny]
+            kwds,
+        ),
+    )
+    register(parser)
+    args = parser.parse_args()
+    command(args)
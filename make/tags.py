@@ -0,0 +1,296 @@
+import json
+from argparse import (
+    ArgumentParser,
+    Namespace,
+)
+from bisect import (
+    bisect_left,
+    bisect_right,
+)
+from collections.abc import Iterable
+from datetime import (
+    UTC,
+    date,
+    datetime,
+    timedelta,
+)
+from typing import (
+    Any,
+    cast,
+)
+
+from . import (
+    REPO,
+    RegistryError,
+    image_labels,
+    image_tags,
+)
+
+kwds: dict[str, str] = {
+    "help": "Query the index of tags published to the registry",
+}
+
+INDEX_LABEL = "arkes.manifest.index"
+
+type Build = tuple[date, int, str]
+type Version = tuple[date, str]
+
+
+def register(parser: ArgumentParser) -> None:
+    _ = parser.add_argument(
+        "--latest",
+        metavar="VARIANT",
+        help="Output the latest build tag of a variant",
+    )
+    _ = parser.add_argument(
+        "--older-than",
+        metavar="DAYS",
+        type=int,
+        help="Output all build tags older than DAYS days",
+    )
+    _ = parser.add_argument(
+        "--by-date",
+        metavar="VARIANT",
+        help="Output the build tags of a variant grouped by date",
+    )
+    _ = parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Build the index from the registry tag list instead of the manifest",
+    )
+
+
+def command(args: Namespace) -> None:
+    index = load_tag_index(cast(bool, args.rebuild))
+    latest = cast(str | None, args.latest)
+    older_than = cast(int | None, args.older_than)
+    by_date = cast(str | None, args.by_date)
+    if latest is not None:
+        print(index.latest_build(latest) or "")
+
+    elif older_than is not None:
+        print("\n".join(index.builds_older_than(older_than)))
+
+    elif by_date is not None:
+        print(json.dumps(index.builds_per_date(by_date), indent=2))
+
+    else:
+        print(index.to_json())
+
+
+def classify_tag(tag: str) -> tuple[str, str | None, str | None]:
+    if tag.startswith("_"):
+        if tag == "_manifest":
+            return "manifest", None, None
+
+        return "other", None, None
+
+    if "_" not in tag:
+        if all(c.isalnum() or c == "-" for c in tag):
+            return "variant", tag, None
+
+        return "other", None, None
+
+    sep_idx = tag.rfind("_")
+    if sep_idx <= 0:
+        return "other", None, None
+
+    variant = tag[:sep_idx]
+    rest = tag[sep_idx + 1 :]
+    if not (variant and all(c.isalnum() or c == "-" for c in variant)):
+        return "other", None, None
+
+    if "." in rest:
+        last_dot = rest.rfind(".")
+        if last_dot > 0:
+            build_num = rest[last_dot + 1 :]
+            if build_num.isdigit():
+                version_part = rest[:last_dot]
+                if version_part.count(".") >= 2:
+                    full_version = f"{version_part}.{build_num}"
+                    return "build", variant, full_version
+
+    if rest and all(c.isalnum() or c in ".-" for c in rest):
+        return "version", variant, rest
+
+    return "other", None, None
+
+
+def _parse_date(version: str) -> date | None:
+    try:
+        year, month, day = version.split(".")
+        return date(int(year), int(month), int(day))
+
+    except ValueError:
+        return None
+
+
+class TagIndex:
+    def __init__(self, tags: Iterable[str] = ()) -> None:
+        self.variant_tags: set[str] = set()
+        self.builds: dict[str, list[Build]] = {}
+        self.versions: dict[str, list[Version]] = {}
+        self.other: list[str] = []
+        for tag in tags:
+            self._add(tag)
+
+        for builds in self.builds.values():
+            builds.sort()
+
+        for versions in self.versions.values():
+            versions.sort()
+
+    def _add(self, tag: str) -> None:
+        kind, variant, version = classify_tag(tag)
+        match kind:
+            case "variant":
+                assert variant is not None
+                self.variant_tags.add(variant)
+                return
+
+            case "build":
+                assert variant is not None and version is not None
+                version, build = version.rsplit(".", 1)
+                day = _parse_date(version)
+                if day is not None:
+                    self.builds.setdefault(variant, []).append((day, int(build), tag))
+                    return
+
+            case "version":
+                assert variant is not None and version is not None
+                day = _parse_date(version)
+                if day is not None:
+                    self.versions.setdefault(variant, []).append((day, tag))
+                    return
+
+            case "manifest":
+                return
+
+            case _:
+                pass
+
+        self.other.append(tag)
+
+    def variants(self) -> list[str]:
+        return sorted({*self.variant_tags, *self.builds, *self.versions})
+
+    def tags(self, variant: str) -> list[str]:
+        return [
+            *([variant] if variant in self.variant_tags else []),
+            *(x[1] for x in self.versions.get(variant, [])),
+            *self.build_tags(variant),
+        ]
+
+    def build_tags(self, variant: str) -> list[str]:
+        return [x[2] for x in self.builds.get(variant, [])]
+
+    def latest_build(self, variant: str) -> str | None:
+        builds = self.builds.get(variant, None)
+        return builds[-1][2] if builds else None
+
+    def builds_before(self, variant: str, day: date) -> list[str]:
+        builds = self.builds.get(variant, [])
+        return [x[2] for x in builds[: bisect_left(builds, (day,))]]
+
+    def builds_on(self, variant: str, day: date) -> list[str]:
+        builds = self.builds.get(variant, [])
+        start = bisect_left(builds, (day,))
+        end = bisect_right(builds, (day, float("inf")))
+        return [x[2] for x in builds[start:end]]
+
+    def builds_older_than(self, days: int, today: date | None = None) -> list[str]:
+        if today is None:
+            today = datetime.now(UTC).date()
+
+        cutoff = today - timedelta(days=days)
+        return [
+            x for variant in self.builds for x in self.builds_before(variant, cutoff)
+        ]
+
+    def builds_per_date(self, variant: str) -> dict[str, list[str]]:
+        dates: dict[str, list[str]] = {}
+        for day, _, tag in self.builds.get(variant, []):
+            dates.setdefault(day.strftime("%Y.%m.%d"), []).append(tag)
+
+        return dates
+
+    def versions_since(self, variant: str, day: date) -> list[str]:
+        versions = self.versions.get(variant, [])
+        return [x[1] for x in versions[bisect_left(versions, (day,)) :]]
+
+    def versions_before(self, variant: str, day: date) -> list[str]:
+        versions = self.versions.get(variant, [])
+        return [x[1] for x in versions[: bisect_left(versions, (day,))]]
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "version": 1,
+                "variants": sorted(self.variant_tags),
+                "builds": {k: [x[2] for x in v] for k, v in self.builds.items()},
+                "versions": {k: [x[1] for x in v] for k, v in self.versions.items()},
+                "other": self.other,
+            },
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def from_json(cls, data: str) -> TagIndex:
+        raw = cast(dict[str, Any], json.loads(data))  # pyright: ignore[reportExplicitAny]
+        assert raw.get("version", None) == 1, "Unsupported tag index version"
+        index = cls()
+        index.variant_tags = set(cast(list[str], raw["variants"]))
+        # The lists are stored already sorted, only the dates need to be parsed
+        for variant, tags in cast(dict[str, list[str]], raw["builds"]).items():
+            builds: list[Build] = []
+            for tag in tags:
+                version, build = tag[len(variant) + 1 :].rsplit(".", 1)
+                day = _parse_date(version)
+                assert day is not None
+                builds.append((day, int(build), tag))
+
+            index.builds[variant] = builds
+
+        for variant, tags in cast(dict[str, list[str]], raw["versions"]).items():
+            versions: list[Version] = []
+            for tag in tags:
+                day = _parse_date(tag[len(variant) + 1 :])
+                assert day is not None
+                versions.append((day, tag))
+
+            index.versions[variant] = versions
+
+        index.other = cast(list[str], raw["other"])
+        return index
+
+
+def load_tag_index(rebuild: bool = False) -> TagIndex:
+    if not rebuild:
+        try:
+            data = image_labels(f"{REPO}:_manifest", True).get(INDEX_LABEL, None)
+
+        except RegistryError as e:
+            if cast(int, getattr(e, "status")) != 404:
+                raise
+
+            # Nothing has been published yet, or the manifest was deleted
+            data = None
+
+        if data is not None:
+            return TagIndex.from_json(data)
+
+    return TagIndex(image_tags(REPO, True))
+
+
+if __name__ == "__main__":
+    kwds["description"] = kwds["help"]
+    del kwds["help"]
+    parser = ArgumentParser(
+        **cast(  # pyright: ignore[reportAny]
+            dict[str, Any],  # pyright: ignore[reportExplicitAny]
+            kwds,
+        ),
+    )
+    register(parser)
+    args = parser.parse_args()
+    command(args)
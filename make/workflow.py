@@ -37,91 +37,92 @@ def register(parser: ArgumentParser) -> None:
     )
 
 
-def command(args: Namespace) -> None:
-    config: Config = parse_all_config()
-
-    def build_job_graph(config: Config) -> tuple[Graph, Indegree]:
-        graph: Graph = {
-            "rootfs": {
-                "depends": "check",
-                "cleanup": False,
-                "iso": True,
-            }
+def build_job_graph(config: Config) -> tuple[Graph, Indegree]:
+    graph: Graph = {
+        "rootfs": {
+            "depends": "check",
+            "cleanup": False,
+            "iso": True,
         }
-        indegree: Indegree = {"rootfs": 0}
-        for variant, data in cast(
-            dict[str, dict[str, str | None | list[str]]], config["variants"]
-        ).items():
-            if variant in ("check", "rootfs"):
-                raise ValueError(f"Invalid use of protected variant name: {variant}")
-
-            graph[variant] = {
-                "depends": data.get("depends", None) or "rootfs",
-                "cleanup": cast(bool, data.get("clean", False)),
-                "iso": cast(bool, data.get("iso", False)),
+    }
+    indegree: Indegree = {"rootfs": 0}
+    for variant, data in cast(
+        dict[str, dict[str, str | None | list[str]]], config["variants"]
+    ).items():
+        if variant in ("check", "rootfs"):
+            raise ValueError(f"Invalid use of protected variant name: {variant}")
+
+        graph[variant] = {
+            "depends": data.get("depends", None) or "rootfs",
+            "cleanup": cast(bool, data.get("clean", False)),
+            "iso": cast(bool, data.get("iso", False)),
+        }
+        indegree[variant] = 0
+        for template in cast(list[str], data["templates"]):
+            full_id = f"{variant}-{template}"
+            clean = cast(bool, data.get("clean", False))
+            iso = cast(bool, data.get("iso", False))
+            for template_name in template.split("-"):
+                template_path = f"templates/{template_name}.Containerfile"
+                if not os.path.exists(template_path):
+                    continue
+
+                _, template_data = parse_config(
+                    f"templates/{template_name}.Containerfile"
+                )
+                clean = clean or cast(bool, template_data.get("clean", False))
+                iso = cast(bool, template_data.get("iso", True))
+
+            # TODO get clean for template
+            graph[full_id] = {
+                "depends": (
+                    f"{variant}-{template.rsplit('-', 1)[0]}"
+                    if "-" in template
+                    else variant
+                ),
+                "cleanup": clean,
+                "iso": iso,
             }
-            indegree[variant] = 0
-            for template in cast(list[str], data["templates"]):
-                full_id = f"{variant}-{template}"
-                clean = cast(bool, data.get("clean", False))
-                iso = cast(bool, data.get("iso", False))
-                for template_name in template.split("-"):
-                    template_path = f"templates/{template_name}.Containerfile"
-                    if not os.path.exists(template_path):
-                        continue
-
-                    _, template_data = parse_config(
-                        f"templates/{template_name}.Containerfile"
-                    )
-                    clean = clean or cast(bool, template_data.get("clean", False))
-                    iso = cast(bool, template_data.get("iso", True))
-
-                # TODO get clean for template
-                graph[full_id] = {
-                    "depends": (
-                        f"{variant}-{template.rsplit('-', 1)[0]}"
-                        if "-" in template
-                        else variant
-                    ),
-                    "cleanup": clean,
-                    "iso": iso,
-                }
-                indegree[full_id] = 0
-
-        for job_id, data in graph.items():
-            depends = data["depends"]
-            if job_id == "rootfs":
-                continue
+            indegree[full_id] = 0
 
-            indegree[job_id] += 1
-            if depends not in graph:
-                raise RuntimeError(f"{job_id} cannot find dependency {depends}")
+    for job_id, data in graph.items():
+        depends = data["depends"]
+        if job_id == "rootfs":
+            continue
 
-        return graph, indegree
+        indegree[job_id] += 1
+        if depends not in graph:
+            raise RuntimeError(f"{job_id} cannot find dependency {depends}")
 
-    def topological_sort(graph: Graph, indegree: Indegree) -> list[str]:
-        heap: list[str] = []
-        for job, deg in indegree.items():
-            if deg == 0:
-                heapq.heappush(heap, job)
+    return graph, indegree
 
-        order: list[str] = []
-        while heap:
-            job = heapq.heappop(heap)
-            order.append(job)
-            for dep_job, data in graph.items():
-                if data["depends"] != job:
-                    continue
 
-                indegree[dep_job] -= 1
-                if indegree[dep_job] == 0:
-                    heapq.heappush(heap, dep_job)
+def topological_sort(graph: Graph, indegree: Indegree) -> list[str]:
+    heap: list[str] = []
+    for job, deg in indegree.items():
+        if deg == 0:
+            heapq.heappush(heap, job)
+
+    order: list[str] = []
+    while heap:
+        job = heapq.heappop(heap)
+        order.append(job)
+        for dep_job, data in graph.items():
+            if data["depends"] != job:
+                continue
+
+            indegree[dep_job] -= 1
+            if indegree[dep_job] == 0:
+                heapq.heappush(heap, dep_job)
 
-        if len(order) != len(graph):
-            raise RuntimeError("Cycle detected in job dependencies")
+    if len(order) != len(graph):
+        raise RuntimeError("Cycle detected in job dependencies")
 
-        return order
+    return order
 
+
+def command(args: Namespace) -> None:
+    config: Config = parse_all_config()
     graph, indegree = build_job_graph(config)
 
     def indent(lines: list[str], level: int = 1) -> list[str]:
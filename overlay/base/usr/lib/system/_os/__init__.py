@@ -22,7 +22,12 @@ def cli(argv: list[str]) -> None:
     __dirname__ = os.path.dirname(__file__)
     modulename = os.path.basename(__dirname__)
     subparsers = parser.add_subparsers(help="Action to run")
-    for file in iglob(os.path.join(__dirname__, "cli", "*.py")):
+    files = sorted(
+        file
+        for path in cast(list[str], __path__)
+        for file in iglob(os.path.join(path, "cli", "*.py"))
+    )
+    for file in files:
         if file.endswith("__.py"):
             continue
 
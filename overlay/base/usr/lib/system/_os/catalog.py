@@ -0,0 +1,72 @@
+import json
+import os
+import threading
+from collections.abc import Callable
+from typing import cast
+
+from . import SYSTEM_PATH
+
+CATALOG_PATH = os.path.join(SYSTEM_PATH, "catalog")
+
+_entries: dict[str, dict[str, object]] = {}
+_lock = threading.Lock()
+
+
+def _entry(checksum: str) -> dict[str, object]:
+    entry = _entries.get(checksum, None)
+    if entry is None:
+        try:
+            with open(os.path.join(CATALOG_PATH, f"{checksum}.json")) as f:
+                entry = cast(dict[str, object], json.load(f))
+
+        except OSError, ValueError:
+            entry = {}
+
+        _entries[checksum] = entry
+
+    return entry
+
+
+def cached[T](checksum: str, key: str, compute: Callable[[], T]) -> T:
+    # Commits never change, so anything worked out from one only has to be
+    # worked out once
+    with _lock:
+        entry = _entry(checksum)
+        if key in entry:
+            return cast(T, entry[key])
+
+    value = compute()
+    with _lock:
+        entry[key] = value
+        data = dict(entry)
+
+    path = os.path.join(CATALOG_PATH, f"{checksum}.json")
+    try:
+        os.makedirs(CATALOG_PATH, exist_ok=True)
+        with open(f"{path}.{os.getpid()}", "w") as f:
+            json.dump(data, f)
+
+        os.replace(f"{path}.{os.getpid()}", path)
+
+    except OSError:
+        # Without write access the catalog is only kept in memory
+        pass
+
+    return value
+
+
+def prune_catalog(exists: Callable[[str], bool]) -> None:
+    try:
+        names = os.listdir(CATALOG_PATH)
+
+    except FileNotFoundError:
+        return
+
+    for name in names:
+        checksum, ext = os.path.splitext(name)
+        if ext != ".json" or exists(checksum):
+            continue
+
+        os.unlink(os.path.join(CATALOG_PATH, name))
+        with _lock:
+            _ = _entries.pop(checksum, None)
@@ -6,6 +6,15 @@ from argparse import (
     ArgumentParser,
     Namespace,
 )
+from collections import deque
+from collections.abc import (
+    Generator,
+    Iterable,
+)
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
 from enum import StrEnum
 from glob import iglob
 from typing import (
@@ -17,9 +26,8 @@ from ..console import bytes_to_stdout
 from ..ostree import (
     Deployment,
     deployments,
-    ostree,
+    diff_commits,
 )
-from ..podman import context_hash
 from ..system import (
     file_hash,
     is_root,
@@ -125,12 +133,35 @@ def context_files(deployment: Deployment) -> dict[str, str]:
     }
 
 
-def diff_files(
+type Change = tuple[str, tuple[str | None, str | None]]
+
+
+def diff_changes(
+    from_deployment: Deployment,
+    to_deployment: Deployment,
+) -> Generator[Change]:
+    for status, file in diff_commits(
+        from_deployment.sysroot.repo(),  # pyright: ignore[reportUnknownMemberType, reportUnknownArgumentType]
+        from_deployment.checksum,
+        to_deployment.checksum,
+    ):
+        match status:
+            case "A":
+                yield file, (None, "")
+
+            case "D":
+                yield file, ("", None)
+
+            case _:
+                yield file, ("", "")
+
+
+def diff_output(
     from_path: str,
     to_path: str,
     from_label: str | None = None,
     to_label: str | None = None,
-) -> None:
+) -> bytes:
     cmd = [
         "diff",
         "-U0",
@@ -160,37 +191,55 @@ def diff_files(
     if diff_proc.wait() not in (0, 1):
         raise subprocess.CalledProcessError(diff_proc.returncode, cmd)
 
-    bytes_to_stdout(output)
+    return output
+
+
+def diff_files(
+    from_path: str,
+    to_path: str,
+    from_label: str | None = None,
+    to_label: str | None = None,
+) -> None:
+    bytes_to_stdout(diff_output(from_path, to_path, from_label, to_label))
 
 
 def print_file_changes(
     from_deployment: Deployment,
     to_deployment: Deployment,
-    changes: dict[str, tuple[str | None, str | None]],
+    changes: Iterable[Change],
     output: Output,
 ) -> None:
     match output:
         case Output.DIFF:
-            for file, (from_hash, to_hash) in changes.items():
+            from_root = from_deployment.path
+            to_root = to_deployment.path
+
+            def render(file: str, from_hash: str | None, to_hash: str | None) -> bytes:
                 from_path = (
-                    f"{from_deployment.path}/{file}"
-                    if from_hash is not None
-                    else "/dev/null"
-                )
-                to_path = (
-                    f"{to_deployment.path}/{file}"
-                    if to_hash is not None
-                    else "/dev/null"
+                    f"{from_root}/{file}" if from_hash is not None else "/dev/null"
                 )
-                _ = sys.stdout.buffer.write(f"--- {file}\n".encode())
-                diff_files(from_path, to_path)
+                to_path = f"{to_root}/{file}" if to_hash is not None else "/dev/null"
+                return f"--- {file}\n".encode() + diff_output(from_path, to_path)
+
+            # Changes are diffed as they are found, and printed in order. Only a
+            # few diffs are kept ahead of the output, so memory use stays flat
+            jobs = os.cpu_count() or 1
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                pending: deque[Future[bytes]] = deque()
+                for file, (from_hash, to_hash) in changes:
+                    pending.append(executor.submit(render, file, from_hash, to_hash))
+                    if len(pending) > jobs * 2:
+                        bytes_to_stdout(pending.popleft().result())
+
+                while pending:
+                    bytes_to_stdout(pending.popleft().result())
 
         case Output.NAME_ONLY:
-            for file in changes:
+            for file, _ in changes:
                 print(file)
 
         case Output.NAME_STATUS:
-            for file, (from_hash, to_hash) in changes.items():
+            for file, (from_hash, to_hash) in changes:
                 if from_hash is None:
                     status = "\033[32mA\033[0m"
 
@@ -236,8 +285,8 @@ def command(args: Namespace) -> None:
     changes: dict[str, tuple[str | None, str | None]]
     match cast(Selection, args.selection):
         case Selection.PACKAGES:
-            from_hash = context_hash(path=from_deployment.path)
-            to_hash = context_hash(path=to_deployment.path)
+            from_hash = from_deployment.context_hash
+            to_hash = to_deployment.context_hash
             from_info = from_deployment.os_info
             to_info = to_deployment.os_info
             from_id = from_info.get("VERSION_ID", "0")
@@ -282,7 +331,7 @@ def command(args: Namespace) -> None:
                 changes[from_image] = from_version, to_version
 
             changes.update(diff_dicts(from_deployment.packages, to_deployment.packages))
-            print_file_changes(from_deployment, to_deployment, changes, output)
+            print_file_changes(from_deployment, to_deployment, changes.items(), output)
 
         case Selection.CONTEXT:
             print_file_changes(
@@ -291,49 +340,17 @@ def command(args: Namespace) -> None:
                 diff_dicts(
                     context_files(from_deployment),
                     context_files(to_deployment),
-                ),
+                ).items(),
                 output,
             )
 
         case Selection.FULL:
-            diff_output: list[bytes] = []
-            ostree(
-                "diff",
-                from_deployment.checksum,
-                to_deployment.checksum,
-                onstdout=diff_output.append,
+            print_file_changes(
+                from_deployment,
+                to_deployment,
+                diff_changes(from_deployment, to_deployment),
+                output,
             )
-            changes = {}
-            for line in b"".join(diff_output).decode("utf-8").splitlines():
-                if not line:
-                    continue
-
-                path = line[1:].strip().lstrip("/")
-                if os.path.isdir(f"{from_deployment.path}/{path}") or os.path.isdir(
-                    f"{to_deployment.path}/{path}"
-                ):
-                    continue
-
-                match line[0]:
-                    case "A":
-                        changes[path] = None, ""
-
-                    case "D":
-                        changes[path] = "", None
-
-                    case "M":
-                        changes[path] = "", ""
-
-                    case _:
-                        pass
-
-            if changes:
-                print_file_changes(
-                    from_deployment,
-                    to_deployment,
-                    dict(sorted(changes.items())),
-                    output,
-                )
 
 
 if __name__ == "__main__":
@@ -13,7 +13,7 @@ from .. import (
     ROOTFS_PATH,
     SYSTEM_PATH,
 )
-from ..podman import export
+from ..podman import export_tree
 from ..system import is_root
 
 kwds = {"help": "Export your current system image to a folder"}
@@ -49,15 +49,12 @@ def command(args: Namespace) -> None:
     workingDir = os.path.abspath(cast(str, args.workingDir))
     assert rootfs != workingDir
     assert not workingDir.startswith(rootfs)
-    with export(
+    _ = export_tree(
+        rootfs,
         cast(str, args.tag),
         cast(str, args.setup),
         workingDir,
-    ) as t:
-        if not os.path.exists(rootfs):
-            os.makedirs(rootfs, exist_ok=True)
-
-        t.extractall(rootfs, numeric_owner=True, filter="fully_trusted")
+    )
 
 
 if __name__ == "__main__":
@@ -17,7 +17,7 @@ from typing import (
 from .. import OS_NAME
 from ..ostree import (
     chroot,
-    commit_export,
+    commit_image,
     deploy,
     deployments,
     ostree,
@@ -25,7 +25,7 @@ from ..ostree import (
 )
 from ..podman import (
     build,
-    podman_cmd,
+    image_copy,
 )
 from ..system import (
     baseImage,
@@ -164,13 +164,7 @@ def install(
         ],
     )
     os.unlink(systemfile)
-    commit_export(
-        branch,
-        setup="""
-        rm -f /etc
-        rm -rf /var/*
-        """,
-    )
+    commit_image(branch)
     deploy(branch, sysroot)
     execute(
         "grub-install",
@@ -214,33 +208,7 @@ def install(
         storage = os.path.join(
             sysroot, "ostree/deploy", OS_NAME, "var/lib/containers/storage"
         )
-        execute(
-            "bash",
-            "-c",
-            " | ".join(
-                [
-                    shlex.join(
-                        podman_cmd(
-                            "save",
-                            "--multi-image-archive",
-                            "system:latest",
-                            baseImage(),
-                        )
-                    ),
-                    shlex.join(
-                        [
-                            "podman",
-                            f"--root={storage}",
-                            "--runroot=/tmp/podman-runroot",
-                            "--storage-driver=overlay",
-                            "--events-backend=file",
-                            "load",
-                        ]
-                    ),
-                ]
-            ),
-        )
-        os.unlink(os.path.join(storage, "db.sql"))
+        image_copy(["system:latest", baseImage()], storage)
         atexit.unregister(exitFunc1)
         execute("umount", "/var/tmp")  # noqa: S108
         os.rmdir(tmp)
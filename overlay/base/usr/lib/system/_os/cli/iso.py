@@ -1,7 +1,7 @@
 import atexit
 import os
-import shlex
 import shutil
+import subprocess
 import sys
 from argparse import (
     ArgumentParser,
@@ -15,19 +15,19 @@ from typing import (
 
 from .. import (
     OS_NAME,
-    ROOTFS_PATH,
     SYSTEM_PATH,
 )
 from ..podman import (
-    export,
+    export_stream,
+    image_copy,
     podman,
-    podman_cmd,
 )
 from ..system import (
     baseImage,
     execute,
     is_root,
 )
+from ..tar import normalize_mtime
 
 kwds = {"help": "Build a bootable ISO image to install your system"}
 
@@ -75,41 +75,58 @@ def iso() -> str:
     )
     os.chdir(SYSTEM_PATH)
     exitFunc1 = atexit.register(podman, "rmi", f"system:iso-{uuid}")
-    if os.path.exists(ROOTFS_PATH):
-        shutil.rmtree(ROOTFS_PATH)
-
-    with export(
-        f"iso-{uuid}",
-        workingDir=SYSTEM_PATH,
-    ) as t:
-        if not os.path.exists(ROOTFS_PATH):
-            os.makedirs(ROOTFS_PATH, exist_ok=True)
-
-        t.extractall(ROOTFS_PATH, numeric_owner=True, filter="fully_trusted")
-
-    atexit.unregister(exitFunc1)
-    podman("rmi", f"system:iso-{uuid}")
-    execute(
-        "bash",
-        "-c",
-        " | ".join(
+    storage = os.path.join(SYSTEM_PATH, "iso-storage")
+    for path in (storage, "airootfs.sfs", "extract"):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+
+        elif os.path.exists(path):
+            os.unlink(path)
+
+    # The base image has to be in the container storage of the live system, so
+    # that it can be installed without a network connection
+    image_copy([buildImage], storage)
+    # Instead of extracting the image to disk and running mksquashfs over it,
+    # the export is streamed into sqfstar with the container storage appended
+    cmd = ["sqfstar", "-comp", "zstd", "airootfs.sfs"]
+    sqfstar = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    assert sqfstar.stdin is not None
+    try:
+        with export_stream(f"iso-{uuid}", workingDir=SYSTEM_PATH) as stdout:
+            _ = normalize_mtime(stdout, sqfstar.stdin, end=False)
+
+        atexit.unregister(exitFunc1)
+        podman("rmi", f"system:iso-{uuid}")
+        tar = subprocess.Popen(
             [
-                shlex.join(podman_cmd("save", buildImage)),
-                shlex.join(
-                    [
-                        "podman",
-                        f"--root={ROOTFS_PATH}/var/lib/containers/storage",
-                        "--runroot=/tmp/podman-runroot",
-                        "--storage-driver=overlay",
-                        "--events-backend=file",
-                        "load",
-                    ]
-                ),
-            ]
-        ),
-    )
-    os.unlink(os.path.join(ROOTFS_PATH, "var/lib/containers/storage/db.sql"))
-    _ = shutil.copytree(os.path.join(ROOTFS_PATH, "etc/system/archiso"), "archiso")
+                "tar",
+                f"--directory={storage}",
+                "--numeric-owner",
+                "--xattrs",
+                "--xattrs-include=*",
+                # Rename the members and hardlink targets, but not symlink targets
+                r"--transform=flags=rh;s,^\.,var/lib/containers/storage,",
+                "--create",
+                "--file=-",
+                ".",
+            ],
+            stdout=subprocess.PIPE,
+        )
+        assert tar.stdout is not None
+        _ = normalize_mtime(tar.stdout, sqfstar.stdin)
+        if tar.wait():
+            raise subprocess.CalledProcessError(tar.returncode, tar.args)
+
+    finally:
+        sqfstar.stdin.close()
+        _ = sqfstar.wait()
+
+    if sqfstar.returncode:
+        raise subprocess.CalledProcessError(sqfstar.returncode, cmd)
+
+    shutil.rmtree(storage)
+    extract_archiso("airootfs.sfs")
+    _ = shutil.move("airootfs.sfs", "archiso/arkes/x86_64/airootfs.sfs")
     for path in [
         "loader/entries/01-archiso-x86_64-linux.conf",
         "grub/grub.cfg",
@@ -121,12 +138,6 @@ def iso() -> str:
             _ = f.truncate()
             _ = f.write(content.replace("%UUID%", uuid))
 
-    execute(
-        "mksquashfs", ROOTFS_PATH, "archiso/arkes/x86_64/airootfs.sfs", "-comp", "zstd"
-    )
-    _ = shutil.copy2(os.path.join(ROOTFS_PATH, "etc/system/efiboot.img"), "efiboot.img")
-    shutil.rmtree(ROOTFS_PATH)
-
     parts = buildImage.split(":")
     variant = parts[-1] if len(parts) == 2 else "latest"
     name = f"{OS_NAME}-{variant}-{uuid}.iso"
@@ -159,6 +170,22 @@ def iso() -> str:
     return name
 
 
+def extract_archiso(squashfs: str) -> None:
+    # /etc is a symlink to /usr/etc in the image, and unsquashfs does not follow
+    # symlinks in the paths it is asked to extract
+    execute(
+        "unsquashfs",
+        "-dest",
+        "extract",
+        squashfs,
+        "usr/etc/system/archiso",
+        "usr/etc/system/efiboot.img",
+    )
+    _ = shutil.move("extract/usr/etc/system/archiso", "archiso")
+    _ = shutil.move("extract/usr/etc/system/efiboot.img", "efiboot.img")
+    shutil.rmtree("extract")
+
+
 if __name__ == "__main__":
     parser = ArgumentParser(
         **cast(dict[str, Any], kwds),  # pyright:ignore [reportAny,reportExplicitAny]
@@ -13,6 +13,7 @@ from ..ostree import (
     Deployment,
     deployments,
 )
+from ..podman import parse_containerfiles
 from ..system import (
     is_root,
 )
@@ -164,10 +165,13 @@ def command(args: Namespace) -> None:
             )
             sys.exit(1)
 
+        _deployments = list(deployments())
+        # Parse every Systemfile at once so Deployment.image only hits the cache
+        _ = parse_containerfiles((x.systemfile, None) for x in _deployments)
         with ThreadPoolExecutor(max_workers=50) as exc:
             statuses = exc.map(
                 partial(get_status, outputType=outputType, outputFormat=outputFormat),
-                deployments(),
+                _deployments,
             )
             match outputFormat:
                 case OutputFormat.Json:
@@ -8,14 +8,12 @@ from typing import (
     Any,
     TextIO,
     cast,
+    override,
 )
 
 import progressbar
 
-from ..console import (
-    AlwaysUpdateProgressBar,
-    print_stderr,
-)
+from ..console import print_stderr
 from ..dbus import (
     checkupdates,
     pull,
@@ -27,6 +25,13 @@ from ..system import baseImage
 kwds = {"help": "Perform a system upgrade"}
 
 
+class AlwaysUpdateProgressBar(progressbar.ProgressBar):
+    # Patched to always update
+    @override
+    def update(self, value: int | None = None, force: bool = False) -> None:  # pyright: ignore[reportIncompatibleMethodOverride]
+        super().update(value, force=True)
+
+
 class ProgressState:
     MAX_LABEL_SIZE: int = 30
 
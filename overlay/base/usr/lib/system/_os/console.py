@@ -5,9 +5,6 @@ import subprocess
 import sys
 import termios
 import tty
-from typing import override
-
-import progressbar
 
 
 def bytes_to_stdout(line: bytes | str) -> None:
@@ -95,10 +92,3 @@ def shell(*args: str) -> int:
             pass
 
     return exit_code
-
-
-class AlwaysUpdateProgressBar(progressbar.ProgressBar):
-    # Patched to always update
-    @override
-    def update(self, value: int | None = None, force: bool = False) -> None:  # pyright: ignore[reportIncompatibleMethodOverride]
-        super().update(value, force=True)
@@ -15,17 +15,20 @@ from ..console import (
     bytes_to_stdout,
 )
 from ..dbus import groups_for_sender
+from ..environment import invalidate_environment
 from ..ostree import (
-    commit_export,
+    commit_image,
     deploy,
     prune,
     update_grub_config,
 )
 from ..podman import (
+    BuildProgress,
     build,
     image_digest,
     image_exists,
     pull,
+    watch_context,
 )
 from ..system import (
     baseImage,
@@ -60,6 +63,13 @@ class Object(dbus.service.Object):
         self._build_thread: threading.Thread | None = None
         self._pull_thread: threading.Thread | None = None
         self._checkupdates_thread: threading.Thread | None = None
+        # Keeps the context hash current, so checkupdates does not need to walk
+        # /etc/system every time it runs
+        try:
+            watch_context()
+
+        except OSError as e:
+            print(f"Unable to watch /etc/system: {e}")
 
     def notify_all(self, msg: str, action: str) -> None:
         for path in os.scandir("/run/user"):
@@ -130,6 +140,8 @@ class Object(dbus.service.Object):
             error(f"Exception: {e}\n{traceback.format_exc()}")
 
     def _upgrade(self, sender: str) -> None | bool:
+        # Mounts and sockets may have changed since the last run
+        invalidate_environment()
         self.notify_all("Starting system upgrade", "upgrade")
         try:
             with inhibit(
@@ -164,7 +176,7 @@ class Object(dbus.service.Object):
                     return
 
                 self.upgrade_stderr(b"PROGRESS 2/5 Committing to ostree\n")
-                commit_export(
+                commit_image(
                     onstdout=self.upgrade_stdout,
                     onstderr=self.upgrade_stderr,
                 )
@@ -221,50 +233,6 @@ class Object(dbus.service.Object):
             self._upgrade_dkms_progress_status = (0, 0)
             self._emit_upgrade_progress()
 
-        elif line.startswith(b"STEP "):
-            parts = line[5:].split(b"/", 1)
-            if len(parts) != 2:
-                self.upgrade_stderr(
-                    f"Failed to parse STEP: {line!r}\n\tNo b'/' found\n".encode()
-                )
-                return
-
-            second_part = parts[1].split(b":")
-            try:
-                current = int(parts[0])
-                total = int(second_part[0])
-
-            except ValueError as e:
-                self.upgrade_stderr(f"Failed to parse STEP: {line!r}\n\t{e}\n".encode())
-                return
-
-            self._upgrade_step_progress_status = (current, total)
-            self._upgrade_dkms_progress_status = (0, 0)
-            self._emit_upgrade_progress()
-
-        elif line.startswith(b"[dkms] ("):
-            parts = line.split(b"(", 1)
-            parts = parts[1].split(b"/", 1)
-            if len(parts) != 2:
-                self.upgrade_stderr(
-                    f"Failed to parse [dkms]: {line!r}\n\tNo b'/' found\n".encode()
-                )
-                return
-
-            second_part = parts[1].split(b")")
-            try:
-                current = int(parts[0])
-                total = int(second_part[0])
-
-            except ValueError as e:
-                self.upgrade_stderr(
-                    f"Failed to parse [dkms]: {line!r}\n\t{e}\n".encode()
-                )
-                return
-
-            self._upgrade_dkms_progress_status = (current, total)
-            self._emit_upgrade_progress()
-
     def _emit_upgrade_progress(self) -> None:
         if self._upgrade_thread is None:
             return
@@ -384,52 +352,22 @@ class Object(dbus.service.Object):
 
         self.build_progress(round(current / status_total * 100))
 
-    def _build_parse(self, line: bytes) -> None:
-        if line.startswith(b"STEP "):
-            parts = line[5:].split(b"/", 1)
-            if len(parts) != 2:
-                self.upgrade_stderr(
-                    f"Failed to parse STEP: {line!r}\n\tNo b'/' found\n".encode()
-                )
-                return
-
-            second_part = parts[1].split(b":")
-            try:
-                current = int(parts[0])
-                total = int(second_part[0])
-
-            except ValueError as e:
-                self.upgrade_stderr(f"Failed to parse STEP: {line!r}\n\t{e}\n".encode())
-                return
-
-            self._build_step_progress_status = (current, total)
+    def _build_event(self, progress: BuildProgress) -> None:
+        if progress.kind == "step":
+            self._build_step_progress_status = (progress.current, progress.total)
             self._build_dkms_progress_status = (0, 0)
-            self._emit_build_progress()
-
-        elif line.startswith(b"[dkms] ("):
-            parts = line.split(b"(", 1)
-            parts = parts[1].split(b"/", 1)
-            if len(parts) != 2:
-                self.upgrade_stderr(
-                    f"Failed to parse [dkms]: {line!r}\n\tNo b'/' found\n".encode()
-                )
-                return
-
-            second_part = parts[1].split(b")")
-            try:
-                current = int(parts[0])
-                total = int(second_part[0])
+            self._upgrade_step_progress_status = (progress.current, progress.total)
+            self._upgrade_dkms_progress_status = (0, 0)
 
-            except ValueError as e:
-                self.upgrade_stderr(
-                    f"Failed to parse [dkms]: {line!r}\n\t{e}\n".encode()
-                )
-                return
+        else:
+            self._build_dkms_progress_status = (progress.current, progress.total)
+            self._upgrade_dkms_progress_status = (progress.current, progress.total)
 
-            self._build_dkms_progress_status = (current, total)
-            self._emit_build_progress()
+        self._emit_build_progress()
+        self._emit_upgrade_progress()
 
     def _build(self) -> None | bool:
+        invalidate_environment()
         self.notify_all("Building system image", "build")
         try:
             with inhibit(
@@ -442,6 +380,7 @@ class Object(dbus.service.Object):
                     buildArgs={"KARGS": system_kernelCommandLine()},
                     onstdout=self.build_stdout,
                     onstderr=self.build_stderr,
+                    onprogress=self._build_event,
                 )
                 self.build_stderr(b"[system] Done\n")
                 self.build_progress(100)
@@ -482,11 +421,7 @@ class Object(dbus.service.Object):
     )
     def build_stdout(self, stdout: bytes) -> None:
         bytes_to_stdout(b"[build:1] " + stdout)
-        self._build_parse(stdout)
-        if self._upgrade_thread is None:
-            self._upgrade_parse(stdout)
-
-        else:
+        if self._upgrade_thread is not None:
             self.upgrade_stdout(stdout)
 
     @dbus.service.signal(  # pyright:ignore [reportUnknownMemberType]
@@ -495,11 +430,7 @@ class Object(dbus.service.Object):
     )
     def build_stderr(self, stderr: bytes) -> None:
         bytes_to_stderr(b"[build:2] " + stderr)
-        self._build_parse(stderr)
-        if self._upgrade_thread is None:
-            self._upgrade_parse(stderr)
-
-        else:
+        if self._upgrade_thread is not None:
             self.upgrade_stderr(stderr)
 
     @dbus.service.method(  # pyright:ignore [reportUnknownMemberType]
@@ -543,6 +474,7 @@ class Object(dbus.service.Object):
             error(f"Exception: {e}\n{traceback.format_exc()}")
 
     def _checkupdates(self) -> None | bool:
+        invalidate_environment()
         try:
             self._updates = checkupdates()
             self._updates_ttl = time.time() + 60 * 5  # recheck in 5 minutes
@@ -635,6 +567,7 @@ class Object(dbus.service.Object):
             error(f"Exception: {e}\n{traceback.format_exc()}")
 
     def _pull(self) -> None | bool:
+        invalidate_environment()
         self.notify_all("Pulling base image", "pull")
         try:
             image = baseImage()
@@ -0,0 +1,116 @@
+import os
+import subprocess
+import threading
+from typing import NamedTuple
+
+from . import SYSTEM_PATH
+
+
+class Environment(NamedTuple):
+    container: bool
+    remote: bool
+    socket: str
+    ostree: str
+    ostree_root: str
+    ostree_repo: str
+    pacman: str
+    pacman_cache: str
+
+
+_environment: Environment | None = None
+_prepared: bool = False
+_lock = threading.RLock()
+
+
+def _probe() -> Environment:
+    try:
+        container = (
+            subprocess.run(
+                ["systemd-detect-virt", "--quiet", "--container"],
+                check=False,
+            ).returncode
+            == 0
+        )
+
+    except FileNotFoundError:
+        container = os.path.exists("/run/.containerenv") or os.path.exists(
+            "/.dockerenv"
+        )
+
+    if os.geteuid() == 0:
+        socket = "/run/podman/podman.sock"
+
+    else:
+        socket = f"/run/user/{os.getuid()}/podman/podman.sock"
+
+    if os.path.isdir("/ostree"):
+        ostree = "/ostree"
+        ostree_root = ""
+
+    else:
+        ostree = f"{SYSTEM_PATH}/ostree"
+        ostree_root = f"{SYSTEM_PATH}/"
+
+    pacman = "/usr/lib/pacman"
+    if not os.path.exists(pacman):
+        pacman = "/var/lib/pacman"
+
+    return Environment(
+        container=container,
+        remote=container,
+        socket=socket,
+        ostree=ostree,
+        ostree_root=ostree_root,
+        ostree_repo=os.path.join(ostree, "repo"),
+        pacman=pacman,
+        pacman_cache="/var/cache/pacman",
+    )
+
+
+def environment() -> Environment:
+    global _environment
+    if _environment is not None:
+        return _environment
+
+    with _lock:
+        if _environment is None:
+            _environment = _probe()
+
+        return _environment
+
+
+def system_environment() -> Environment:
+    global _prepared
+    if _prepared:
+        return environment()
+
+    with _lock:
+        env = environment()
+        if _prepared:
+            return env
+
+        os.makedirs(SYSTEM_PATH, exist_ok=True)
+        if env.ostree == "/ostree":
+            if not os.path.lexists(f"{SYSTEM_PATH}/ostree"):
+                os.symlink("/ostree", f"{SYSTEM_PATH}/ostree")
+
+        else:
+            from .ostree import ostree  # noqa: PLC0415
+
+            os.makedirs(env.ostree, exist_ok=True)
+            setattr(ostree, "repo", env.ostree_repo)
+            if not os.path.exists(env.ostree_repo):
+                ostree("init")
+
+        os.makedirs(env.pacman_cache, exist_ok=True)
+        _prepared = True
+
+    return env
+
+
+def invalidate_environment() -> None:
+    global _environment
+    global _prepared
+    with _lock:
+        _environment = None
+        _prepared = False
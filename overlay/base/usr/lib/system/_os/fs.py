@@ -0,0 +1,128 @@
+import fcntl
+import os
+import shutil
+import stat
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+
+FICLONE = 0x40049409
+CHUNK_SIZE = 1024 * 1024 * 1024
+
+
+def copy_data(src: str, dest: str) -> None:
+    with open(src, "rb") as i, open(dest, "wb") as o:
+        # A reflink shares the extents, so nothing is copied at all
+        try:
+            _ = fcntl.ioctl(o.fileno(), FICLONE, i.fileno())
+            return
+
+        except OSError:
+            pass
+
+        # copy_file_range stays in the kernel and lets the filesystem reflink or
+        # offload the copy where it can
+        try:
+            while os.copy_file_range(i.fileno(), o.fileno(), CHUNK_SIZE):
+                pass
+
+            return
+
+        except OSError:
+            _ = i.seek(0)
+            _ = o.seek(0)
+            _ = o.truncate()
+
+        shutil.copyfileobj(i, o)
+
+
+def clear(path: str) -> None:
+    try:
+        os.unlink(path)
+
+    except FileNotFoundError, IsADirectoryError:
+        pass
+
+
+def copy_entry(src: str, dest: str, st: os.stat_result) -> None:
+    if stat.S_ISLNK(st.st_mode):
+        os.symlink(os.readlink(src), dest)
+        os.lchown(dest, st.st_uid, st.st_gid)
+        return
+
+    copy_data(src, dest)
+    os.chown(dest, st.st_uid, st.st_gid)
+    # chown drops setuid bits and capabilities, so the mode and xattrs go last
+    shutil.copystat(src, dest)
+
+
+def copy_tree(
+    src: str,
+    dest: str,
+    skipList: list[str] | None = None,
+    jobs: int | None = None,
+    overwrite: bool = False,
+    *,
+    hardlink: bool = False,
+) -> int:
+    skip = set(skipList or [])
+    links: dict[tuple[int, int], tuple[str, Future[None]]] = {}
+    dirs: list[tuple[str, str]] = []
+    futures: list[Future[None]] = []
+    count = 0
+    with ThreadPoolExecutor(
+        max_workers=jobs or min(32, (os.cpu_count() or 1) * 4)
+    ) as executor:
+        stack = [""]
+        while stack:
+            path = stack.pop()
+            os.makedirs(f"{dest}{path}", exist_ok=True)
+            dirs.append((f"{src}{path}", f"{dest}{path}"))
+            for entry in os.scandir(f"{src}{path}"):
+                relpath = f"{path}/{entry.name}"
+                if relpath in skip:
+                    continue
+
+                st = entry.stat(follow_symlinks=False)
+                if stat.S_ISDIR(st.st_mode):
+                    stack.append(relpath)
+                    continue
+
+                if overwrite:
+                    clear(f"{dest}{relpath}")
+
+                if not stat.S_ISREG(st.st_mode) and not stat.S_ISLNK(st.st_mode):
+                    os.mknod(f"{dest}{relpath}", st.st_mode, st.st_rdev)
+                    os.chown(f"{dest}{relpath}", st.st_uid, st.st_gid)
+                    continue
+
+                # Keep hardlinks within the tree as hardlinks
+                link = links.get((st.st_dev, st.st_ino), None)
+                if link is not None:
+                    target, future = link
+                    future.result()
+                    os.link(target, f"{dest}{relpath}")
+                    continue
+
+                # The caller knows the source will not be modified in place
+                if hardlink and stat.S_ISREG(st.st_mode):
+                    os.link(entry.path, f"{dest}{relpath}")
+                    continue
+
+                count += 1
+                future = executor.submit(copy_entry, entry.path, f"{dest}{relpath}", st)
+                futures.append(future)
+                if st.st_nlink > 1 and stat.S_ISREG(st.st_mode):
+                    links[(st.st_dev, st.st_ino)] = (f"{dest}{relpath}", future)
+
+        for future in futures:
+            future.result()
+
+    # Parents are created before their children, so fix them up in reverse
+    for _src, _dest in reversed(dirs):
+        st = os.stat(_src)
+        os.chown(_dest, st.st_uid, st.st_gid)
+        shutil.copystat(_src, _dest)
+
+    return count
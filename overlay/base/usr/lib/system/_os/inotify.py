@@ -0,0 +1,95 @@
+import ctypes
+import os
+import struct
+from collections.abc import Generator
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+_event = struct.Struct("iIII")
+_libc = ctypes.CDLL(None, use_errno=True)
+
+
+def _check(ret: int) -> int:
+    if ret < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    return ret
+
+
+def watch_tree(path: str) -> Generator[None]:
+    # The watches are added before the generator is returned, so nothing that
+    # happens between setting up the watch and iterating over it is missed
+    fd = _check(_libc.inotify_init1(os.O_CLOEXEC))
+    dirs: dict[int, str] = {}
+
+    def add(path: str) -> None:
+        for root, _, _ in os.walk(path):
+            try:
+                dirs[_check(_libc.inotify_add_watch(fd, root.encode(), WATCH_MASK))] = (
+                    root
+                )
+
+            except FileNotFoundError, NotADirectoryError:
+                pass
+
+    try:
+        add(path)
+        if not dirs:
+            raise FileNotFoundError(path)
+
+    except BaseException:
+        os.close(fd)
+        raise
+
+    def events() -> Generator[None]:
+        try:
+            while True:
+                data = os.read(fd, 64 * 1024)
+                offset = 0
+                while offset < len(data):
+                    wd, mask, _, length = _event.unpack_from(data, offset)
+                    name = data[offset + _event.size : offset + _event.size + length]
+                    offset += _event.size + length
+                    if mask & IN_Q_OVERFLOW:
+                        continue
+
+                    if mask & IN_IGNORED:
+                        root = dirs.pop(wd, None)
+                        if root == path:
+                            return
+
+                        continue
+
+                    if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        add(os.path.join(dirs[wd], name.rstrip(b"\0").decode()))
+
+                yield
+
+        finally:
+            os.close(fd)
+
+    return events()
@@ -1,6 +1,9 @@
 # pyright: reportImportCycles=false
+import json
 import os
 import shlex
+import shutil
+import stat
 import subprocess
 from collections.abc import (
     Callable,
@@ -13,7 +16,13 @@ from typing import cast
 import gi  # pyright: ignore[reportMissingTypeStubs]
 
 from . import OS_NAME, ROOTFS_PATH, SYSTEM_PATH
+from .catalog import (
+    cached,
+    prune_catalog,
+)
 from .console import bytes_to_stderr, bytes_to_stdout
+from .fs import copy_entry
+from .pacman import local_packages
 from .system import (
     _execute,  # pyright:ignore [reportPrivateUsage]
     baseImage,
@@ -23,6 +32,7 @@ from .system import (
 gi.require_version("OSTree", "1.0")  # pyright: ignore[reportUnknownMemberType]
 from gi.repository import (  # pyright: ignore[reportMissingTypeStubs]
     Gio,  # pyright: ignore[reportUnknownVariableType, reportAttributeAccessIssue]
+    GLib,  # pyright: ignore[reportUnknownVariableType, reportAttributeAccessIssue]
     OSTree,  # pyright: ignore[reportUnknownVariableType, reportAttributeAccessIssue]
 )
 
@@ -44,6 +54,170 @@ def ostree(
 setattr(ostree, "repo", "/ostree/repo")
 
 
+def _os_release(root: str) -> dict[str, str]:
+    with open(os.path.join(root, "usr/lib/os-release")) as f:
+        return {
+            x[0]: x[1]
+            for x in [
+                x.strip().split("=", 1) for x in f if "=" in x if not x.startswith("#")
+            ]
+        }
+
+
+def _image_packages(root: str) -> dict[str, str]:
+    packages: list[tuple[str, str]] = []
+    try:
+        with open(
+            os.path.join(root, "usr/lib/system/packages.txt"),
+            encoding="utf-8",
+        ) as f:
+            packages = [
+                cast(tuple[str, str], tuple(x.split(" ", 1)))
+                for x in f.read().strip().splitlines()
+            ]
+
+    except FileNotFoundError:
+        pass
+
+    return dict(packages)
+
+
+# Facts about a commit that are stored as metadata on it, by catalog key
+COMMIT_FACTS: dict[str, tuple[str, str, Callable[[str], object]]] = {
+    "os_info": ("arkes.os-release", "a{ss}", _os_release),
+    "packages": ("arkes.packages", "a{ss}", local_packages),
+    "imagePackages": ("arkes.image-packages", "a{ss}", _image_packages),
+}
+
+
+def commit_metadata_args(
+    rootfs: str,
+    onstderr: Callable[[bytes], None] = bytes_to_stderr,
+) -> list[str]:
+    args: list[str] = []
+    for name, signature, read in COMMIT_FACTS.values():
+        try:
+            value = GLib.Variant(signature, read(rootfs))  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+
+        except OSError, ValueError:
+            onstderr(f"Not adding {name} to the commit metadata\n".encode())
+            continue
+
+        args.append(f"--add-metadata={name}={value.print_(True)}")  # pyright: ignore[reportUnknownMemberType]
+
+    return args
+
+
+def commit_metadata(repo: OSTree.Repo, checksum: str) -> dict[str, object]:  # pyright: ignore[reportUnknownMemberType, reportUnknownParameterType]
+    _, commit, _ = repo.load_commit(checksum)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    return cast(dict[str, object], commit.get_child_value(0).unpack())  # pyright: ignore[reportUnknownMemberType]
+
+
+def _tree_children(tree: Gio.File) -> dict[str, tuple[bool, Gio.File]]:  # pyright: ignore[reportUnknownMemberType, reportUnknownParameterType]
+    children: dict[str, tuple[bool, Gio.File]] = {}  # pyright: ignore[reportUnknownMemberType]
+    for info in tree.enumerate_children(  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+        "standard::name,standard::type",
+        Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS,  # pyright: ignore[reportUnknownMemberType, reportUnknownArgumentType]
+        None,
+    ):
+        name = cast(str, info.get_name())  # pyright: ignore[reportUnknownMemberType]
+        children[name] = (
+            info.get_file_type() == Gio.FileType.DIRECTORY,  # pyright: ignore[reportUnknownMemberType]
+            tree.get_child(name),  # pyright: ignore[reportUnknownMemberType]
+        )
+
+    return children
+
+
+def _tree_files(
+    tree: Gio.File,  # pyright: ignore[reportUnknownMemberType, reportUnknownParameterType]
+    path: str,
+    status: str,
+) -> Generator[tuple[str, str]]:
+    for name, (is_dir, child) in sorted(_tree_children(tree).items()):  # pyright: ignore[reportUnknownVariableType]
+        if is_dir:
+            yield from _tree_files(child, f"{path}{name}/", status)  # pyright: ignore[reportUnknownArgumentType]
+
+        else:
+            yield status, f"{path}{name}"
+
+
+def _tree_diff(
+    from_tree: Gio.File,  # pyright: ignore[reportUnknownMemberType, reportUnknownParameterType]
+    to_tree: Gio.File,  # pyright: ignore[reportUnknownMemberType, reportUnknownParameterType]
+    path: str,
+) -> Generator[tuple[str, str]]:
+    from_children = _tree_children(from_tree)  # pyright: ignore[reportUnknownArgumentType]
+    to_children = _tree_children(to_tree)  # pyright: ignore[reportUnknownArgumentType]
+    for name in sorted(from_children.keys() | to_children.keys()):
+        if name not in to_children:
+            from_dir, from_file = from_children[name]  # pyright: ignore[reportUnknownVariableType]
+            if from_dir:
+                yield from _tree_files(from_file, f"{path}{name}/", "D")  # pyright: ignore[reportUnknownArgumentType]
+
+            else:
+                yield "D", f"{path}{name}"
+
+            continue
+
+        if name not in from_children:
+            to_dir, to_file = to_children[name]  # pyright: ignore[reportUnknownVariableType]
+            if to_dir:
+                yield from _tree_files(to_file, f"{path}{name}/", "A")  # pyright: ignore[reportUnknownArgumentType]
+
+            else:
+                yield "A", f"{path}{name}"
+
+            continue
+
+        from_dir, from_file = from_children[name]  # pyright: ignore[reportUnknownVariableType]
+        to_dir, to_file = to_children[name]  # pyright: ignore[reportUnknownVariableType]
+        # Directories are compared by the checksum of their contents, so whole
+        # subtrees that did not change are skipped without being walked
+        if from_dir == to_dir and from_file.get_checksum() == to_file.get_checksum():  # pyright: ignore[reportUnknownMemberType]
+            continue
+
+        if from_dir and to_dir:
+            yield from _tree_diff(from_file, to_file, f"{path}{name}/")  # pyright: ignore[reportUnknownArgumentType]
+
+        elif from_dir:
+            yield from _tree_files(from_file, f"{path}{name}/", "D")  # pyright: ignore[reportUnknownArgumentType]
+            yield "A", f"{path}{name}"
+
+        elif to_dir:
+            yield "D", f"{path}{name}"
+            yield from _tree_files(to_file, f"{path}{name}/", "A")  # pyright: ignore[reportUnknownArgumentType]
+
+        else:
+            yield "M", f"{path}{name}"
+
+
+def diff_commits(
+    repo: OSTree.Repo,  # pyright: ignore[reportUnknownMemberType, reportUnknownParameterType]
+    from_checksum: str,
+    to_checksum: str,
+    path: str = "",
+) -> Generator[tuple[str, str]]:
+    # Files are compared by the checksums ostree already has for them, so none
+    # of them are read. The same as OSTree.diff_dirs, which can not hand its
+    # results back through the python bindings
+    _, from_root, _ = repo.read_commit(from_checksum)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    _, to_root, _ = repo.read_commit(to_checksum)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    from_tree = from_root.resolve_relative_path(path) if path else from_root  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    to_tree = to_root.resolve_relative_path(path) if path else to_root  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    prefix = f"{path.strip('/')}/" if path.strip("/") else ""
+    from_exists = cast(bool, from_tree.query_exists(None))  # pyright: ignore[reportUnknownMemberType]
+    to_exists = cast(bool, to_tree.query_exists(None))  # pyright: ignore[reportUnknownMemberType]
+    if from_exists and to_exists:
+        yield from _tree_diff(from_tree, to_tree, prefix)  # pyright: ignore[reportUnknownArgumentType]
+
+    elif from_exists:
+        yield from _tree_files(from_tree, prefix, "D")  # pyright: ignore[reportUnknownArgumentType]
+
+    elif to_exists:
+        yield from _tree_files(to_tree, prefix, "A")  # pyright: ignore[reportUnknownArgumentType]
+
+
 def commit(
     branch: str = "system",
     rootfs: str | None = None,
@@ -73,6 +247,7 @@ def commit(
         f"--subject={datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}",
         f"--tree=dir={rootfs}",
         f"--skip-list={_skipList}",
+        *commit_metadata_args(rootfs, onstderr),
         onstdout=onstdout,
         onstderr=onstderr,
     )
@@ -84,21 +259,13 @@ def commit_export(
     setup: str = """
     rm -f /etc
     rm -rf /var/*
-    find / -xdev \\
-      \\( \\
-        -path /dev \\
-        -o -path /proc \\
-        -o -path /sys \\
-        -o -path /run \\
-        -o -path /tmp \\
-      \\) -prune -o -print0 \\
-    | xargs -0 -r -P$(nproc) -n500 touch -h -d "@1735689640"
     """,
     onstdout: Callable[[bytes], None] = bytes_to_stdout,
     onstderr: Callable[[bytes], None] = bytes_to_stderr,
 ) -> None:
     from .ostree import ostree_cmd  # noqa: PLC0415
     from .podman import export_stream  # noqa: PLC0415
+    from .tar import normalize_mtime  # noqa: PLC0415
 
     with export_stream(
         setup=setup,
@@ -118,7 +285,20 @@ def commit_export(
         )
         env = os.environ.copy()
         env["SOURCE_DATE_EPOCH"] = "0"
-        ostree_proc = subprocess.Popen(cmd, stdin=stdout, env=env)
+        ostree_proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, env=env)
+        assert ostree_proc.stdin is not None
+        # Timestamps are normalized in the stream instead of touching every file
+        # in the container before exporting it
+        try:
+            _ = normalize_mtime(stdout, ostree_proc.stdin)
+
+        except BrokenPipeError:
+            # ostree exited early, its return code says why
+            pass
+
+        finally:
+            ostree_proc.stdin.close()
+
         ostree_out, ostree_err = ostree_proc.communicate()
         if ostree_out is not None:  # pyright: ignore[reportUnnecessaryComparison]
             onstdout(ostree_out)
@@ -132,6 +312,157 @@ def commit_export(
             )
 
 
+COMMIT_CACHE_PATH = os.path.join(SYSTEM_PATH, "cache", "commit.json")
+
+
+def _stat_key(st: os.stat_result) -> str:
+    # Files in the layers of an image never change in place, so a new ctime or
+    # inode means a new file
+    return f"{st.st_ino}:{st.st_ctime_ns}:{st.st_size}:{st.st_mode}"
+
+
+def _stage(
+    rootfs: str,
+    staging: str,
+    skipList: list[str],
+    cache: dict[str, str],
+    onstderr: Callable[[bytes], None],
+) -> tuple[dict[str, str], int]:
+    objects = os.path.join(cast(str, getattr(ostree, "repo")), "objects")
+    keys: dict[str, str] = {}
+    linked = 0
+    dirs: list[tuple[str, str]] = []
+    stack = [""]
+    while stack:
+        path = stack.pop()
+        src = f"{rootfs}{path}"
+        dest = f"{staging}{path}"
+        os.mkdir(dest)
+        dirs.append((src, dest))
+        for entry in os.scandir(src):
+            relpath = f"{path}/{entry.name}"
+            if relpath in skipList:
+                continue
+
+            st = entry.stat(follow_symlinks=False)
+            if stat.S_ISDIR(st.st_mode):
+                stack.append(relpath)
+                continue
+
+            if not stat.S_ISREG(st.st_mode) and not stat.S_ISLNK(st.st_mode):
+                onstderr(f"Skipping unsupported file {relpath}\n".encode())
+                continue
+
+            key = _stat_key(st)
+            if stat.S_ISREG(st.st_mode):
+                keys[relpath] = key
+
+            checksum = cache.get(key, None)
+            if checksum is not None:
+                try:
+                    os.link(
+                        os.path.join(objects, checksum[:2], f"{checksum[2:]}.file"),
+                        f"{staging}{relpath}",
+                    )
+                    linked += 1
+                    continue
+
+                except FileNotFoundError:
+                    # The object was pruned since the last commit
+                    pass
+
+            copy_entry(entry.path, f"{staging}{relpath}", st)
+
+    # Parents are created before their children, so fix them up in reverse
+    for src, dest in reversed(dirs):
+        st = os.stat(src)
+        os.chown(dest, st.st_uid, st.st_gid)
+        shutil.copystat(src, dest)
+
+    return keys, linked
+
+
+def commit_image(
+    branch: str = "system",
+    image: str = "system:latest",
+    onstdout: Callable[[bytes], None] = bytes_to_stdout,
+    onstderr: Callable[[bytes], None] = bytes_to_stderr,
+) -> None:
+    from .environment import environment  # noqa: PLC0415
+    from .podman import image_mount  # noqa: PLC0415
+
+    if environment().remote:
+        # Images can only be mounted by the podman instance that owns the storage
+        commit_export(branch, onstdout=onstdout, onstderr=onstderr)
+        return
+
+    try:
+        with open(COMMIT_CACHE_PATH) as f:
+            cache = cast(dict[str, str], json.load(f))
+
+    except OSError, ValueError:
+        cache = {}
+
+    repo = cast(str, getattr(ostree, "repo"))
+    # The staging tree has to be on the same filesystem as the repo objects so
+    # that unchanged files can be hardlinks to them
+    staging = os.path.join(repo, "tmp", f"arkes-commit-{os.getpid()}")
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+
+    try:
+        with image_mount(image) as rootfs:
+            skipList = ["/etc", *[f"/var/{x}" for x in os.listdir(f"{rootfs}/var")]]
+            keys, linked = _stage(rootfs, staging, skipList, cache, onstderr)
+            metadata = commit_metadata_args(rootfs, onstderr)
+
+        onstderr(
+            f"Reused {linked} of {len(keys)} files from previous commits\n".encode()
+        )
+        execute(
+            "env",
+            "SOURCE_DATE_EPOCH=0",
+            *ostree_cmd(
+                "commit",
+                "--generate-composefs-metadata",
+                "--generate-sizes",
+                "--link-checkout-speedup",
+                f"--branch={OS_NAME}/{branch}",
+                f"--subject={datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}",
+                f"--tree=dir={staging}",
+                *metadata,
+            ),
+            onstdout=onstdout,
+            onstderr=onstderr,
+        )
+
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+
+    # Only remember the files in this commit, so the cache never outgrows it
+    checksums: dict[str, str] = {}
+    for line in (
+        subprocess.check_output(ostree_cmd("ls", "-R", "-C", f"{OS_NAME}/{branch}"))
+        .decode("utf-8")
+        .splitlines()
+    ):
+        if line.startswith("-"):
+            _, _, _, _, checksum, path = line.split(None, 5)
+            checksums[path] = checksum
+
+    cache = {key: checksums[path] for path, key in keys.items() if path in checksums}
+    try:
+        os.makedirs(os.path.dirname(COMMIT_CACHE_PATH), exist_ok=True)
+        with open(f"{COMMIT_CACHE_PATH}.tmp", "w") as f:
+            json.dump(cache, f)
+
+        os.replace(f"{COMMIT_CACHE_PATH}.tmp", COMMIT_CACHE_PATH)
+
+    except OSError as e:
+        onstderr(f"Failed to write {COMMIT_CACHE_PATH}: {e}\n".encode())
+
+
 def deploy(
     branch: str = "system",
     sysroot: str = "/",
@@ -193,6 +524,10 @@ def prune(
     )
     execute("ostree", "admin", "cleanup", onstdout=onstdout, onstderr=onstderr)
     podman("system", "prune", "-f", "--build")
+    objects = os.path.join(cast(str, getattr(ostree, "repo")), "objects")
+    prune_catalog(
+        lambda x: os.path.exists(os.path.join(objects, x[:2], f"{x[2:]}.commit"))
+    )
 
 
 def undeploy(
@@ -212,71 +547,55 @@ def undeploy(
 
 
 class Deployment:
-    def __init__(self, sysroot: OSTree.Sysroot, deployment: OSTree.Deployment) -> None:  # pyright: ignore[reportUnknownMemberType, reportUnknownParameterType]
+    # A snapshot of the deployment as of when the sysroot was loaded. Anything
+    # that comes from the commit itself is kept in the catalog instead
+    __slots__: tuple[str, ...] = (
+        "checksum",
+        "deployment",
+        "finalization_locked",
+        "index",
+        "pinned",
+        "serial",
+        "soft_reboot_target",
+        "staged",
+        "stateroot",
+        "sysroot",
+        "type",
+        "unlocked",
+    )
+
+    def __init__(
+        self,
+        sysroot: OSTree.Sysroot,  # pyright: ignore[reportUnknownParameterType, reportUnknownMemberType]
+        deployment: OSTree.Deployment,  # pyright: ignore[reportUnknownParameterType, reportUnknownMemberType]
+        type: str = "",
+    ) -> None:
         self.sysroot: OSTree.Sysroot = sysroot
         self.deployment: OSTree.Deployment = deployment
-
-    @property
-    def checksum(self) -> str:
-        return self.deployment.get_csum()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-
-    @property
-    def stateroot(self) -> str:
-        return self.deployment.get_osname()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-
-    @property
-    def unlocked(self) -> str:
-        state = self.deployment.unlocked_state_to_string(self.deployment.get_unlocked())  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-        assert isinstance(state, str)
-        return state
+        self.type: str = type
+        self.checksum: str = deployment.get_csum()  # pyright: ignore[reportUnknownMemberType]
+        self.stateroot: str = deployment.get_osname()  # pyright: ignore[reportUnknownMemberType]
+        self.unlocked: str = deployment.unlocked_state_to_string(  # pyright: ignore[reportUnknownMemberType]
+            deployment.get_unlocked()  # pyright: ignore[reportUnknownMemberType]
+        )
+        self.finalization_locked: bool = deployment.is_finalization_locked()  # pyright: ignore[reportUnknownMemberType]
+        self.soft_reboot_target: bool = deployment.is_soft_reboot_target()  # pyright: ignore[reportUnknownMemberType]
+        self.staged: bool = deployment.is_staged()  # pyright: ignore[reportUnknownMemberType]
+        self.pinned: bool = deployment.is_pinned()  # pyright: ignore[reportUnknownMemberType]
+        self.serial: int = deployment.get_deployserial()  # pyright: ignore[reportUnknownMemberType]
+        self.index: int = deployment.get_index()  # pyright: ignore[reportUnknownMemberType]
 
     @property
     def booted(self) -> bool:
-        deployment = self.sysroot.get_booted_deployment()  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
-        if deployment is None:
-            return False
-
-        return self.index == deployment.get_index()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
+        return self.type == "current"
 
     @property
     def pending(self) -> bool:
-        pending, _ = self.sysroot.query_deployments_for(self.stateroot)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
-        if pending is None:
-            return False
-
-        return self.index == pending.get_index()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
+        return self.type == "pending"
 
     @property
     def rollback(self) -> bool:
-        _, rollback = self.sysroot.query_deployments_for(self.stateroot)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
-        if rollback is None:
-            return False
-
-        return self.index == rollback.get_index()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-
-    @property
-    def finalization_locked(self) -> bool:
-        return self.deployment.is_finalization_locked()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-
-    @property
-    def soft_reboot_target(self) -> bool:
-        return self.deployment.is_soft_reboot_target()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-
-    @property
-    def staged(self) -> bool:
-        return self.deployment.is_staged()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-
-    @property
-    def pinned(self) -> bool:
-        return self.deployment.is_pinned()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-
-    @property
-    def serial(self) -> int:
-        return self.deployment.get_deployserial()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
-
-    @property
-    def index(self) -> int:
-        return self.deployment.get_index()  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType]
+        return self.type == "rollback"
 
     @property
     def path(self) -> str:
@@ -286,75 +605,46 @@ class Deployment:
         assert os.path.isdir(path)
         return path
 
-    @property
-    def os_info(self) -> dict[str, str]:
-        with open(os.path.join(self.path, "usr/lib/os-release")) as f:
-            return {
-                x[0]: x[1]
-                for x in [
-                    x.strip().split("=", 1)
-                    for x in f
-                    if "=" in x
-                    if not x.startswith("#")
-                ]
-            }
-
-    @property
-    def type(self) -> str:
-        if self.booted:
-            return "current"
+    def _fact(self, key: str) -> object:
+        # The catalog first, then the metadata stored with the commit, and only
+        # if the commit predates that, the files in the deployment
+        def load() -> object:
+            name, _, read = COMMIT_FACTS[key]
+            value = commit_metadata(self.sysroot.repo(), self.checksum).get(name, None)  # pyright: ignore[reportUnknownMemberType, reportUnknownArgumentType]
+            if value is None:
+                value = read(self.path)
 
-        if self.pending:
-            return "pending"
+            return value
 
-        if self.rollback:
-            return "rollback"
+        return cached(self.checksum, key, load)
 
-        return ""
+    @property
+    def os_info(self) -> dict[str, str]:
+        return dict(cast(dict[str, str], self._fact("os_info")))
 
     @property
     def packages(self) -> dict[str, str]:
-        from .system import in_nspawn_system_output  # noqa: PLC0415
-
-        packages: list[tuple[str, str]] = []
-        try:
-            packages = [
-                cast(tuple[str, str], tuple(x.split(" ", 1)))
-                for x in in_nspawn_system_output(
-                    "pacman", "-Q", deployment=self, quiet=True
-                )
-                .strip()
-                .decode("utf-8")
-                .splitlines()
-            ]
-
-        except subprocess.CalledProcessError as e:
-            if e.returncode != 2:
-                raise
-
-        return dict(packages)
+        return dict(cast(dict[str, str], self._fact("packages")))
 
     @property
     def imagePackages(self) -> dict[str, str]:
-        packages: list[tuple[str, str]] = []
-        try:
-            with open(
-                os.path.join(self.path, "usr/lib/system/packages.txt"),
-                encoding="utf-8",
-            ) as f:
-                packages = [
-                    cast(tuple[str, str], tuple(x.split(" ", 1)))
-                    for x in f.read().strip().splitlines()
-                ]
+        return dict(cast(dict[str, str], self._fact("imagePackages")))
 
-        except FileNotFoundError:
-            pass
-
-        return dict(packages)
+    @property
+    def systemfile(self) -> str:
+        return os.path.join(self.path, "etc/system/Systemfile")
 
+    # /etc is per deployment and can be edited at any time, so the Systemfile
+    # and its context are read every time instead of being kept in the catalog
     @property
     def image(self) -> str:
-        return baseImage(os.path.join(self.path, "etc/system/Systemfile"))
+        return baseImage(self.systemfile)
+
+    @property
+    def context_hash(self) -> str:
+        from .podman import context_hash  # noqa: PLC0415
+
+        return context_hash(path=self.path)
 
 
 def sysroot(sysroot_path: str | None = None) -> OSTree.Sysroot:  # pyright: ignore[reportUnknownMemberType, reportUnknownParameterType]
@@ -372,17 +662,39 @@ def sysroot(sysroot_path: str | None = None) -> OSTree.Sysroot:  # pyright: igno
     return sysroot  # pyright: ignore[reportUnknownVariableType]
 
 
+def _deployment_types(sysroot: OSTree.Sysroot) -> dict[int, str]:  # pyright: ignore[reportUnknownMemberType, reportUnknownParameterType]
+    types: dict[int, str] = {}
+    booted = sysroot.get_booted_deployment()  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    if booted is not None:
+        types[booted.get_index()] = "current"  # pyright: ignore[reportUnknownMemberType]
+
+    for stateroot in {x.get_osname() for x in sysroot.get_deployments()}:  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+        pending, rollback = sysroot.query_deployments_for(stateroot)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+        if pending is not None:
+            _ = types.setdefault(pending.get_index(), "pending")  # pyright: ignore[reportUnknownMemberType]
+
+        if rollback is not None:
+            _ = types.setdefault(rollback.get_index(), "rollback")  # pyright: ignore[reportUnknownMemberType]
+
+    return types
+
+
 def deployments(sysroot_path: str | None = None) -> Generator[Deployment]:
     _sysroot: OSTree.Sysroot = sysroot(sysroot_path)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+    types = _deployment_types(_sysroot)
     for deployment in _sysroot.get_deployments():  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
-        yield Deployment(_sysroot, deployment)  # pyright: ignore[reportUnknownArgumentType]
+        yield Deployment(
+            _sysroot,
+            deployment,  # pyright: ignore[reportUnknownArgumentType]
+            types.get(deployment.get_index(), ""),  # pyright: ignore[reportUnknownMemberType]
+        )
 
 
 def current_deployment() -> Deployment:
     _sysroot: OSTree.Sysroot = sysroot()  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
     deployment = _sysroot.get_booted_deployment()  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
     assert deployment is not None
-    return Deployment(_sysroot, deployment)  # pyright: ignore[reportUnknownArgumentType]
+    return Deployment(_sysroot, deployment, "current")  # pyright: ignore[reportUnknownArgumentType]
 
 
 def update_grub_config(
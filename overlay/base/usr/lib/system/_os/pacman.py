@@ -0,0 +1,44 @@
+import os
+
+
+def _read_desc(path: str) -> tuple[str, str]:
+    name = version = ""
+    with open(path, encoding="utf-8") as f:
+        lines = iter(f.read().splitlines())
+
+    for line in lines:
+        if line == "%NAME%":
+            name = next(lines, "")
+
+        elif line == "%VERSION%":
+            version = next(lines, "")
+
+        if name and version:
+            break
+
+    return name, version
+
+
+def local_packages(root: str) -> dict[str, str]:
+    # The same name to version map pacman -Q outputs, read straight from the
+    # local database instead of running pacman inside of the deployment
+    for dbpath in ("usr/lib/pacman/local", "var/lib/pacman/local"):
+        local = os.path.join(root, dbpath)
+        if os.path.isdir(local):
+            break
+
+    else:
+        return {}
+
+    packages: list[tuple[str, str]] = []
+    for entry in os.scandir(local):
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+
+        try:
+            packages.append(_read_desc(os.path.join(entry.path, "desc")))
+
+        except FileNotFoundError:
+            continue
+
+    return dict(sorted(packages))
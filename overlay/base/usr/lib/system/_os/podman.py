@@ -2,29 +2,34 @@
 import atexit
 import json
 import os
+import re
 import shlex
 import shutil
 import string
 import subprocess
 import tarfile
+import threading
 from collections.abc import (
     Callable,
     Generator,
     Iterable,
 )
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from glob import iglob
 from hashlib import sha256
-from time import time
+from time import (
+    time,
+    time_ns,
+)
 from typing import (
     IO,
+    TYPE_CHECKING,
     Any,
+    NamedTuple,
     cast,
 )
 
-import podman as _podman
-from podman.errors import APIError
-
 from . import (
     IMAGE,
     OS_NAME,
@@ -36,35 +41,44 @@ from .console import (
     bytes_to_stderr,
     bytes_to_stdout,
 )
-from .ostree import ostree
+from .environment import (
+    environment,
+    system_environment,
+)
+from .registry import get_registry_client
 from .system import (
     _execute,  # pyright:ignore [reportPrivateUsage]
     execute,
     file_hash,
-    is_root,
 )
 
-client: _podman.PodmanClient | None = None
+if TYPE_CHECKING:
+    from _hashlib import HASH
+
+    from podman import PodmanClient
+
+client: PodmanClient | None = None
+
+# The API takes the security_opt label options as specgen selinux_opts, which
+# are spelt without the label= prefix the CLI uses
+LABEL_DISABLE = "disable"
 
 
-def get_client() -> _podman.PodmanClient:
+def get_client() -> PodmanClient:
     global client
     if client is not None:
         return client
 
-    _socket = (
-        "http+unix:///run/podman/podman.sock"
-        if is_root()
-        else f"http+unix:///run/user/{os.getuid()}/podman/podman.sock"
-    )
-    client = _podman.PodmanClient(base_url=_socket)
+    from podman import PodmanClient  # noqa: PLC0415
+
+    client = PodmanClient(base_url=f"http+unix://{environment().socket}")
     _ = atexit.register(client.close)
     assert client.ping(), "Unable to connect to podman"
     return client
 
 
 def podman_cmd(*args: str) -> list[str]:
-    if _execute("systemd-detect-virt --quiet --container") == 0:
+    if environment().remote:
         return ["podman", "--remote", *args]
 
     return ["podman", *args]
@@ -113,17 +127,58 @@ def in_system_output(
     volumes: list[str] | None = None,
     flags: list[str] | None = None,
 ) -> bytes:
-    return subprocess.check_output(
-        in_system_cmd(
-            *args,
-            target=target,
-            entrypoint=entrypoint,
-            volumes=volumes,
-            flags=flags,
+    if flags:
+        # Arbitrary run flags have no API equivalent
+        return subprocess.check_output(
+            in_system_cmd(
+                *args,
+                target=target,
+                entrypoint=entrypoint,
+                volumes=volumes,
+                flags=flags,
+            )
         )
+
+    mounts: dict[str, dict[str, object]] = {}
+    overlays: list[dict[str, object]] = []
+    for volume in _in_system_volumes(volumes):
+        source, destination, *options = volume.split(":", 2)
+        options = options[0].split(",") if options else []
+        if "O" in options:
+            options.remove("O")
+            overlays.append(
+                {"source": source, "destination": destination, "options": options}
+            )
+
+        else:
+            mounts[source] = {"bind": destination, "extended_mode": options}
+
+    return _run_output(
+        target,
+        args,
+        {
+            "entrypoint": [entrypoint],
+            "privileged": True,
+            "security_opt": [LABEL_DISABLE],
+            "volumes": mounts,
+            "overlay_volumes": overlays,
+        },
     )
 
 
+def _in_system_volumes(volumes: list[str] | None) -> list[str]:
+    env = system_environment()
+    return [
+        "/run/podman/podman.sock:/run/podman/podman.sock",
+        f"{env.pacman}:/usr/lib/pacman:O",
+        "/etc/pacman.d/gnupg:/etc/pacman.d/gnupg:O",
+        f"{SYSTEM_PATH}:{SYSTEM_PATH}",
+        f"{env.ostree}:/sysroot/ostree",
+        f"{env.pacman_cache}:{env.pacman_cache}",
+        *(volumes or []),
+    ]
+
+
 def in_system_cmd(
     *args: str,
     target: str = "system:latest",
@@ -132,48 +187,13 @@ def in_system_cmd(
     flags: list[str] | None = None,
 ) -> list[str]:
     target = image_qualified_name(target)
-    if os.path.exists("/ostree") and os.path.isdir("/ostree"):
-        _ostree = "/ostree"
-        if not os.path.exists(SYSTEM_PATH):
-            os.makedirs(SYSTEM_PATH, exist_ok=True)
-
-        if not os.path.exists(f"{SYSTEM_PATH}/ostree"):
-            os.symlink("/ostree", f"{SYSTEM_PATH}/ostree")
-
-    else:
-        _ostree = f"{SYSTEM_PATH}/ostree"
-        os.makedirs(_ostree, exist_ok=True)
-        repo = os.path.join(_ostree, "repo")
-        setattr(ostree, "repo", repo)
-        if not os.path.exists(repo):
-            ostree("init")
-
-    cache = "/var/cache/pacman"
-    if not os.path.exists(cache):
-        os.makedirs(cache, exist_ok=True)
-
-    pacman = "/usr/lib/pacman"
-    if not os.path.exists(pacman):
-        pacman = "/var/lib/pacman"
-
-    volume_args: list[str] = [
-        "/run/podman/podman.sock:/run/podman/podman.sock",
-        f"{pacman}:/usr/lib/pacman:O",
-        "/etc/pacman.d/gnupg:/etc/pacman.d/gnupg:O",
-        f"{SYSTEM_PATH}:{SYSTEM_PATH}",
-        f"{_ostree}:/sysroot/ostree",
-        f"{cache}:{cache}",
-    ]
-    if volumes is not None:
-        volume_args += volumes
-
     return podman_cmd(
         "run",
         "--rm",
         "--privileged",
         "--security-opt=label=disable",
         "--pull=never",
-        *[f"--volume={x}" for x in volume_args],
+        *[f"--volume={x}" for x in _in_system_volumes(volumes)],
         *[f"--{x}" for x in (flags or [])],
         f"--entrypoint={entrypoint}",
         target,
@@ -181,19 +201,129 @@ def in_system_cmd(
     )
 
 
-def context_hash(extra: bytes | None = None, path: str = "/") -> str:
+CONTEXT_CACHE_PATH = os.path.join(SYSTEM_PATH, "cache", "context.json")
+
+_context_cache: dict[str, tuple[str, str]] | None = None
+_context_states: dict[str, HASH] = {}
+_context_watched: set[str] = set()
+_context_generation = 0
+_context_lock = threading.Lock()
+
+
+def _context_key(st: os.stat_result) -> str:
+    # Unlike image layers, files in /etc/system are edited in place. Any write,
+    # chmod, chown or xattr change updates the ctime
+    return f"{st.st_ino}:{st.st_mtime_ns}:{st.st_ctime_ns}:{st.st_size}:{st.st_mode}"
+
+
+def _context_state(path: str) -> HASH:
+    global _context_cache
+    with _context_lock:
+        if _context_cache is None:
+            try:
+                with open(CONTEXT_CACHE_PATH) as f:
+                    _context_cache = {
+                        k: (v[0], v[1])
+                        for k, v in cast(dict[str, list[str]], json.load(f)).items()
+                    }
+
+            except OSError, ValueError:
+                _context_cache = {}
+
+        cache = _context_cache
+
+    prefix = f"{path}/etc/system"
+    # A file written again within the timestamp granularity would look
+    # unchanged, so recently modified files are not cached yet
+    recent = time_ns() - 2_000_000_000
+    seen: set[str] = set()
+    changed = False
     m = sha256()
-    for file in sorted(
-        iglob(f"{path}/etc/system/**", recursive=True, include_hidden=True)
-    ):
-        m.update(file_hash(file).encode("utf-8"))
+    for file in sorted(iglob(f"{prefix}/**", recursive=True, include_hidden=True)):
+        st = os.stat(file)
+        key = _context_key(st)
+        seen.add(file)
+        cached = cache.get(file, None)
+        if cached is not None and cached[0] == key:
+            digest = cached[1]
+
+        else:
+            digest = file_hash(file)
+            if st.st_mtime_ns < recent and st.st_ctime_ns < recent:
+                cache[file] = (key, digest)
+                changed = True
 
+        m.update(digest.encode("utf-8"))
+
+    with _context_lock:
+        for file in [x for x in cache if x.startswith(prefix) and x not in seen]:
+            del cache[file]
+            changed = True
+
+        data = dict(cache) if changed else None
+
+    if data is not None:
+        try:
+            os.makedirs(os.path.dirname(CONTEXT_CACHE_PATH), exist_ok=True)
+            with open(f"{CONTEXT_CACHE_PATH}.{os.getpid()}", "w") as f:
+                json.dump(data, f)
+
+            os.replace(f"{CONTEXT_CACHE_PATH}.{os.getpid()}", CONTEXT_CACHE_PATH)
+
+        except OSError:
+            # The on disk cache is only an optimisation, it is fine to not have one
+            pass
+
+    return m
+
+
+def context_hash(extra: bytes | None = None, path: str = "/") -> str:
+    with _context_lock:
+        state = _context_states.get(path, None)
+        generation = _context_generation
+
+    if state is None:
+        state = _context_state(path)
+        # Only a watched context can be trusted to not have changed since
+        with _context_lock:
+            if path in _context_watched and generation == _context_generation:
+                _context_states[path] = state
+
+    m = state.copy()
     if extra is not None:
         m.update(extra)
 
     return m.hexdigest()
 
 
+def watch_context(path: str = "/") -> None:
+    from .inotify import watch_tree  # noqa: PLC0415
+
+    changes = watch_tree(f"{path}/etc/system")
+
+    def invalidate() -> None:
+        global _context_generation
+        with _context_lock:
+            _context_generation += 1
+            _ = _context_states.pop(path, None)
+
+    def run() -> None:
+        try:
+            for _ in changes:
+                invalidate()
+
+        finally:
+            with _context_lock:
+                _context_watched.discard(path)
+
+            invalidate()
+
+    with _context_lock:
+        _context_watched.add(path)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
 def system_hash() -> str:
     with open("/usr/lib/os-release") as f:
         local_info = {
@@ -207,13 +337,11 @@ def system_hash() -> str:
 def image_info(image: str, remote: bool = True) -> dict[str, object]:
     image = image_qualified_name(image)
     if remote:
-        args = ["skopeo", "inspect", f"docker://{image}"]
+        registry, repo, tag, digest = image_name_parts(image)
+        assert registry is not None
+        return get_registry_client().inspect(registry, repo, digest or tag or "latest")
 
-    else:
-        args = podman_cmd("inspect", "--format={{ json . }}", image)
-
-    data = subprocess.check_output(args)
-    return cast(dict[str, object], json.loads(data))
+    return cast(dict[str, object], get_client().images.get(image).attrs)
 
 
 def image_labels(image: str, remote: bool = True) -> dict[str, str]:
@@ -262,19 +390,8 @@ def image_tags(image: str, skip_manifest: bool = False) -> list[str]:
         if tags:
             return ["_manifest", *tags]
 
-    data: dict[str, str | list[str]] = json.loads(  # pyright:ignore [reportAny]
-        subprocess.check_output(
-            [
-                "skopeo",
-                "list-tags",
-                f"docker://{registry}/{image}",
-            ]
-        )
-    )
-    assert isinstance(data, dict), f"Unexpected data {data}"
-    tags = data.get("Tags", [])
-    assert isinstance(tags, list), f"Tags is not a list: {tags}"
-    return tags
+    assert registry is not None
+    return get_registry_client().tags(registry, image)
 
 
 def image_name_parts(name: str) -> tuple[str | None, str, str | None, str | None]:
@@ -345,17 +462,10 @@ def image_qualified_name(image: str) -> str:
 
 
 def _image_digest_remote(image: str) -> str:
-    return (
-        subprocess.check_output(
-            [
-                "skopeo",
-                "inspect",
-                f"docker://{image}",
-                "--format={{.Digest}}",
-            ]
-        )
-        .strip()
-        .decode("utf-8")
+    registry, repo, tag, digest = image_name_parts(image)
+    assert registry is not None
+    return get_registry_client().manifest_digest(
+        registry, repo, digest or tag or "latest"
     )
 
 
@@ -363,6 +473,8 @@ _last_manifest_pull: float = 0
 
 
 def _latest_manifest() -> bool:
+    from podman.errors import APIError  # noqa: PLC0415
+
     global _last_manifest_pull
     if time() - _last_manifest_pull < 30:
         return True
@@ -382,13 +494,7 @@ def _latest_manifest() -> bool:
 def image_digest(image: str, remote: bool = True, skip_manifest: bool = False) -> str:
     image = image_qualified_name(image)
     if not remote:
-        return (
-            subprocess.check_output(
-                ["podman", "inspect", image, "--format={{.Digest}}"]
-            )
-            .strip()
-            .decode("utf-8")
-        )
+        return cast(str, get_client().images.get(image).attrs["Digest"])
 
     registry, repo, tag, _ = image_name_parts(image)
     if (
@@ -408,22 +514,121 @@ def image_digest(image: str, remote: bool = True, skip_manifest: bool = False) -
 
 
 def image_size(image: str) -> int:
-    image = image_qualified_name(image)
-    manifest: dict[str, list[dict[str, int]]] = json.loads(  # pyright: ignore[reportAny]
-        subprocess.check_output(
-            [
-                "skopeo",
-                "inspect",
-                f"docker://{image}",
-                "--raw",
-            ]
-        )
-    )
+    registry, repo, tag, digest = image_name_parts(image_qualified_name(image))
+    assert registry is not None
+    _, raw = get_registry_client().manifest(registry, repo, digest or tag or "latest")
+    manifest: dict[str, list[dict[str, int]]] = json.loads(raw)  # pyright: ignore[reportAny]
     layers = manifest.get("layers", [])
     # TODO when multiarch images are added, update this to handle that
     return 0 if not layers else sum(layer.get("size", 0) for layer in layers)
 
 
+def image_retag(image: str, tags: list[str]) -> str:
+    registry, repo, tag, digest = image_name_parts(image_qualified_name(image))
+    assert registry is not None
+    client = get_registry_client()
+    digest, manifest = client.manifest(registry, repo, digest or tag or "latest")
+    with ThreadPoolExecutor(max_workers=max(len(tags), 1)) as executor:
+        for future in [
+            executor.submit(client.put_manifest, registry, repo, x, manifest)
+            for x in tags
+        ]:
+            _ = future.result()
+
+    return digest
+
+
+def image_untag(image: str) -> None:
+    registry, repo, tag, digest = image_name_parts(image_qualified_name(image))
+    assert registry is not None
+    get_registry_client().delete_manifest(registry, repo, digest or tag or "latest")
+
+
+def image_tag(image: str, target: str) -> None:
+    registry, repo, tag, _ = image_name_parts(image_qualified_name(target))
+    assert (
+        get_client()
+        .images.get(image_qualified_name(image))
+        .tag(  # pyright: ignore[reportUnknownMemberType]
+            image_name_from_parts(registry, repo, None, None), tag or "latest"
+        )
+    ), f"Failed to tag {image} as {target}"
+
+
+def image_remove(image: str) -> None:
+    _ = get_client().images.remove(image_qualified_name(image))  # pyright: ignore[reportUnknownMemberType]
+
+
+def _read_frames(stream: IO[bytes]) -> Generator[tuple[int, bytes]]:
+    # Non-tty container output is multiplexed as frames with an 8 byte header of
+    # the stream id and the big endian payload size
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            return
+
+        size = int.from_bytes(header[4:], "big")
+        data = b""
+        while len(data) < size:
+            chunk = stream.read(size - len(data))
+            if not chunk:
+                return
+
+            data += chunk
+
+        yield header[0], data
+
+
+def _container_logs(
+    name: str,
+    onstdout: Callable[[bytes], None],
+    onstderr: Callable[[bytes], None],
+) -> None:
+    response = get_client().api.get(  # pyright: ignore[reportUnknownMemberType]
+        f"/containers/{name}/logs",
+        params={"follow": True, "stdout": True, "stderr": True},
+        stream=True,
+    )
+    try:
+        response.raise_for_status()  # pyright: ignore[reportUnknownMemberType]
+        for fd, data in _read_frames(cast(IO[bytes], response.raw)):  # pyright: ignore[reportUnknownMemberType]
+            (onstderr if fd == 2 else onstdout)(data)
+
+    finally:
+        response.close()  # pyright: ignore[reportUnknownMemberType]
+
+
+def image_run_output(image: str, *args: str, entrypoint: str | None = None) -> bytes:
+    kwargs: dict[str, object] = {}
+    if entrypoint is not None:
+        kwargs["entrypoint"] = [entrypoint]
+
+    return _run_output(image, args, kwargs)
+
+
+def _run_output(image: str, args: tuple[str, ...], kwargs: dict[str, object]) -> bytes:
+    container = get_client().containers.create(  # pyright: ignore[reportUnknownMemberType]
+        image_qualified_name(image), command=list(args), **kwargs
+    )
+    try:
+        container.start()  # pyright: ignore[reportUnknownMemberType]
+        stdout: list[bytes] = []
+        _container_logs(
+            cast(str, container.id),  # pyright: ignore[reportUnknownMemberType]
+            stdout.append,
+            bytes_to_stderr,
+        )
+        ret = cast(int, container.wait())  # pyright: ignore[reportUnknownMemberType]
+
+    finally:
+        container.remove(force=True)  # pyright: ignore[reportUnknownMemberType]
+
+    if ret:
+        raise subprocess.CalledProcessError(ret, [image, *args], b"".join(stdout))
+
+    return b"".join(stdout)
+
+
 CONTAINER_POST_STEPS = r"""
 ARG KARGS
 ARG PACKAGES
@@ -442,12 +647,23 @@ RUN \
 """
 
 
+class BuildProgress(NamedTuple):
+    kind: str
+    current: int
+    total: int
+
+
+_build_progress = re.compile(rb"^(?:STEP (\d+)/(\d+):|\[dkms\] \((\d+)/(\d+)\))")
+
+
 def build(
     systemfile: str = "/etc/system/Systemfile",
     buildArgs: dict[str, str] | None = None,
     extraSteps: list[str] | None = None,
     onstdout: Callable[[bytes], None] = bytes_to_stdout,
     onstderr: Callable[[bytes], None] = bytes_to_stderr,
+    *,
+    onprogress: Callable[[BuildProgress], None] | None = None,
 ) -> None:
     from .system import baseImage  # noqa: PLC0415
 
@@ -455,18 +671,16 @@ def build(
     if not image_exists(base_image, remote=False):
         pull(base_image)
 
-    cache = "/var/cache/pacman"
+    cache = environment().pacman_cache
     if not os.path.exists(cache):
         os.makedirs(cache, exist_ok=True)
 
-    context = os.path.join(SYSTEM_PATH, "context")
-    if os.path.exists(context):
-        _ = shutil.rmtree(context)
-
-    containerfile = os.path.join(context, "Containerfile")
+    # The build reads /etc/system directly, only the Containerfile is generated.
+    # It lives outside of the context so that it is never sent to the builder
+    context = "/etc/system"
+    containerfile = os.path.join(SYSTEM_PATH, f"Containerfile.{os.getpid()}")
+    ignorefile = os.path.join(context, ".containerignore")
     try:
-        _ = shutil.copytree("/etc/system", context)
-
         _buildArgs = buildArgs or {}
         _extraSteps = extraSteps or []
         extra: bytes = "\n".join(
@@ -481,6 +695,28 @@ def build(
             _ = f.write(i.read())
             _ = f.write("\n".join(_extraSteps + [CONTAINER_POST_STEPS.strip()]))
 
+        def parse(line: bytes) -> None:
+            match = _build_progress.match(line)
+            if match is None or onprogress is None:
+                return
+
+            step, total, dkms, dkms_total = match.groups()
+            if step is not None:
+                onprogress(BuildProgress("step", int(step), int(total)))
+
+            else:
+                onprogress(BuildProgress("dkms", int(dkms), int(dkms_total)))
+
+        def _onstdout(line: bytes) -> None:
+            onstdout(line)
+            parse(line)
+
+        def _onstderr(line: bytes) -> None:
+            onstderr(line)
+            parse(line)
+
+        # The build API has no equivalent for --cap-add or --no-hostname, so this
+        # is the one operation left on the CLI
         podman(
             "build",
             "--force-rm",
@@ -493,15 +729,53 @@ def build(
             *[f"--build-arg={k}={v}" for k, v in _buildArgs.items()],
             f"--volume={cache}:{cache}",
             f"--file={containerfile}",
+            *([f"--ignorefile={ignorefile}"] if os.path.exists(ignorefile) else []),
             "--format=oci",
             "--timestamp=1735689640",
-            onstdout=onstdout,
-            onstderr=onstderr,
+            context,
+            onstdout=_onstdout,
+            onstderr=_onstderr,
         )
 
     finally:
-        if os.path.exists(context):
-            shutil.rmtree(context)
+        if os.path.exists(containerfile):
+            os.unlink(containerfile)
+
+
+def image_copy(images: list[str], root: str) -> None:
+    from .storage import copy_images  # noqa: PLC0415
+
+    names = [image_qualified_name(x) for x in images]
+    store = cast(dict[str, Any], get_client().info()["store"])  # pyright: ignore[reportExplicitAny]
+    if environment().remote or store["graphDriverName"] != "overlay":
+        # Let podman copy the layer diffs between the stores instead
+        for name in names:
+            podman(
+                "push",
+                name,
+                f"containers-storage:[overlay@{root}+/tmp/podman-runroot]{name}",
+            )
+
+        return
+
+    ids: dict[str, list[str]] = {}
+    for name in names:
+        _id = cast(str, get_client().images.get(name).id)  # pyright: ignore[reportUnknownMemberType]
+        ids.setdefault(_id.removeprefix("sha256:"), []).append(name)
+
+    os.makedirs(root, exist_ok=True)
+    _ = copy_images(cast(str, store["graphRoot"]), root, ids)
+
+
+@contextmanager
+def image_mount(image: str = "system:latest") -> Generator[str]:
+    image = image_qualified_name(image)
+    path = subprocess.check_output(podman_cmd("image", "mount", image))
+    try:
+        yield path.decode("utf-8").strip()
+
+    finally:
+        _ = subprocess.run(podman_cmd("image", "unmount", image), check=False)
 
 
 @contextmanager
@@ -527,30 +801,35 @@ def export_stream(
             containers.get(name).remove()  # pyright: ignore[reportUnknownMemberType]
 
     exitFunc1 = atexit.register(rm, name)
-    podman(
-        "run",
-        f"--name={name}",
-        "--privileged",
-        "--security-opt=label=disable",
-        "--volume=/run/podman/podman.sock:/run/podman/podman.sock",
-        f"system:{tag}",
-        "-c",
-        setup,
-        onstdout=onstdout,
-        onstderr=onstderr,
+    client = get_client()
+    container = client.containers.create(  # pyright: ignore[reportUnknownMemberType]
+        image_qualified_name(f"system:{tag}"),
+        command=["-c", setup],
+        name=name,
+        privileged=True,
+        security_opt=[LABEL_DISABLE],
+        volumes={
+            "/run/podman/podman.sock": {
+                "bind": "/run/podman/podman.sock",
+                "mode": "rw",
+            },
+        },
     )
-    cmd = podman_cmd("export", name)
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-    assert process.stdout is not None
+    container.start()  # pyright: ignore[reportUnknownMemberType]
+    _container_logs(name, onstdout, onstderr)
+    ret = cast(int, container.wait())  # pyright: ignore[reportUnknownMemberType]
+    if ret:
+        raise subprocess.CalledProcessError(ret, ["-c", setup], None, None)
+
+    # Read the export straight off the socket instead of piping it through a
+    # podman process
+    response = client.api.get(f"/containers/{name}/export", stream=True)  # pyright: ignore[reportUnknownMemberType]
     try:
-        yield process.stdout
+        response.raise_for_status()  # pyright: ignore[reportUnknownMemberType]
+        yield cast(IO[bytes], response.raw)  # pyright: ignore[reportUnknownMemberType]
 
     finally:
-        process.stdout.close()
-        _ = process.wait()
-        if process.returncode != 0:
-            raise subprocess.CalledProcessError(process.returncode, cmd, None, None)
-
+        response.close()  # pyright: ignore[reportUnknownMemberType]
         atexit.unregister(exitFunc1)
         rm(name)
         os.chdir(cwd)
@@ -568,6 +847,30 @@ def export(
         yield tarfile.open(fileobj=stdout, mode="r|*")  # noqa: SIM115
 
 
+def export_tree(
+    rootfs: str,
+    tag: str = "latest",
+    setup: str = "",
+    workingDir: str | None = None,
+    *,
+    onstdout: Callable[[bytes], None] = bytes_to_stdout,
+    onstderr: Callable[[bytes], None] = bytes_to_stderr,
+) -> int:
+    from .fs import copy_tree  # noqa: PLC0415
+    from .tar import extract  # noqa: PLC0415
+
+    os.makedirs(rootfs, exist_ok=True)
+    overwrite = bool(os.listdir(rootfs))
+    # Without a setup script there is no need for a container, the files can be
+    # copied straight out of the image, which lets the filesystem share extents
+    if not setup and not environment().remote:
+        with image_mount(f"system:{tag}") as path:
+            return copy_tree(path, rootfs, overwrite=overwrite)
+
+    with export_stream(tag, setup, workingDir, onstdout, onstderr) as stdout:
+        return extract(stdout, rootfs, overwrite=overwrite)
+
+
 def hex_to_base62(hex_digest: str) -> str:
     if hex_digest.startswith("sha256:"):
         hex_digest = hex_digest[7:]
@@ -595,41 +898,138 @@ def pull(
     onstdout: Callable[[bytes], None] = bytes_to_stdout,
     onstderr: Callable[[bytes], None] = bytes_to_stderr,
 ) -> None:
-    podman(
-        "pull",
-        image_qualified_name(image),
-        onstdout=onstdout,
-        onstderr=onstderr,
+    from podman.errors import APIError  # noqa: PLC0415
+
+    response = get_client().api.post(  # pyright: ignore[reportUnknownMemberType]
+        "/images/pull",
+        params={"reference": image_qualified_name(image)},
+        stream=True,
     )
+    try:
+        response.raise_for_status()  # pyright: ignore[reportUnknownMemberType]
+        for line in cast(Iterable[bytes], response.iter_lines()):  # pyright: ignore[reportUnknownMemberType]
+            if not line:
+                continue
 
+            report = cast(dict[str, str], json.loads(line))
+            if "error" in report:
+                onstderr(f"{report['error']}\n".encode())
+                raise APIError(report["error"])
 
-def parse_containerfile(
-    containerfile: str | IO[str],
-    build_args: dict[str, str] | None = None,
-    pretty: bool = False,
-) -> list[dict[str, Any]]:  # pyright: ignore[reportExplicitAny]
-    is_path = isinstance(containerfile, str)
-    if is_path:
-        containerfile = open(containerfile)  # noqa: SIM115
+            if "stream" in report:
+                onstdout(report["stream"].encode())
+
+    finally:
+        response.close()  # pyright: ignore[reportUnknownMemberType]
+
+
+type Ops = list[dict[str, Any]]  # pyright: ignore[reportExplicitAny]
 
+CONTAINERFILE_CACHE_PATH = os.path.join(SYSTEM_PATH, "cache", "containerfile")
+
+_containerfile_cache: dict[str, Ops] = {}
+_containerfile_cache_lock = threading.Lock()
+
+
+def _containerfile_key(data: str, build_args: dict[str, str] | None) -> str:
+    m = sha256(data.encode("utf-8"))
+    for k, v in sorted((build_args or {}).items()):
+        m.update(f"\0{k}={v}".encode())
+
+    # Results from an older parser may not match what the current one outputs
+    parser = shutil.which("dockerfile2llbjson")
+    if parser is not None:
+        m.update(f"\0{os.stat(parser).st_mtime_ns}".encode())
+
+    return m.hexdigest()
+
+
+def _containerfile_cache_get(key: str) -> Ops | None:
+    with _containerfile_cache_lock:
+        if key in _containerfile_cache:
+            return _containerfile_cache[key]
+
+    try:
+        with open(os.path.join(CONTAINERFILE_CACHE_PATH, f"{key}.json")) as f:
+            data = cast(Ops, json.load(f))
+
+    except OSError, ValueError:
+        return None
+
+    with _containerfile_cache_lock:
+        _containerfile_cache[key] = data
+
+    return data
+
+
+def _containerfile_cache_set(key: str, data: Ops) -> None:
+    with _containerfile_cache_lock:
+        _containerfile_cache[key] = data
+
+    path = os.path.join(CONTAINERFILE_CACHE_PATH, f"{key}.json")
     try:
-        argv = ["-p"] if pretty else []
-        if build_args is not None:
-            argv += [x for k, v in build_args.items() for x in ["-b", f"{k}={v}"]]
-
-        data = json.loads(  # pyright: ignore[reportAny]
-            subprocess.check_output(
-                ["dockerfile2llbjson", *argv],
-                stdin=containerfile,
-            ).decode("utf-8")
+        os.makedirs(CONTAINERFILE_CACHE_PATH, exist_ok=True)
+        with open(f"{path}.{os.getpid()}", "w") as f:
+            json.dump(data, f)
+
+        os.replace(f"{path}.{os.getpid()}", path)
+
+    except OSError:
+        # The on disk cache is only an optimisation, it is fine to not have one
+        pass
+
+
+def parse_containerfiles(
+    containerfiles: Iterable[tuple[str | IO[str], dict[str, str] | None]],
+) -> list[Ops]:
+    requests: list[tuple[str, str, dict[str, str] | None]] = []
+    for containerfile, build_args in containerfiles:
+        if isinstance(containerfile, str):
+            with open(containerfile) as f:
+                data = f.read()
+
+        else:
+            data = containerfile.read()
+
+        requests.append((_containerfile_key(data, build_args), data, build_args))
+
+    results: dict[str, Ops] = {}
+    missing: dict[str, tuple[str, dict[str, str] | None]] = {}
+    for key, data, build_args in requests:
+        cached = _containerfile_cache_get(key)
+        if cached is not None:
+            results[key] = cached
+
+        else:
+            missing[key] = (data, build_args)
+
+    if missing:
+        # Everything that is not cached is parsed by a single parser process
+        output = subprocess.check_output(
+            ["dockerfile2llbjson", "-batch"],
+            input="".join(
+                json.dumps({"containerfile": data, "buildArgs": build_args or {}})
+                + "\n"
+                for data, build_args in missing.values()
+            ).encode("utf-8"),
         )
-        assert isinstance(data, list)
+        for key, line in zip(missing, output.splitlines(), strict=True):
+            res = cast(dict[str, Ops | str], json.loads(line))
+            if "error" in res:
+                raise RuntimeError(f"Failed to parse Containerfile: {res['error']}")
 
-    finally:
-        if is_path:
-            containerfile.close()
+            data = cast(Ops, res.get("ops", None) or [])
+            _containerfile_cache_set(key, data)
+            results[key] = data
 
-    return cast(list[dict[str, Any]], data)  # pyright: ignore[reportExplicitAny]
+    return [results[key] for key, _, _ in requests]
+
+
+def parse_containerfile(
+    containerfile: str | IO[str],
+    build_args: dict[str, str] | None = None,
+) -> Ops:
+    return parse_containerfiles([(containerfile, build_args)])[0]
 
 
 def base_images(
@@ -637,7 +1037,7 @@ def base_images(
 ) -> Iterable[str]:
     for base_image in [
         b
-        for x in parse_containerfile(containerfile, build_args, False)
+        for x in parse_containerfile(containerfile, build_args)
         for f in [
             cast(dict[str, dict[str, str]], x.get("Op", {}))
             .get("source", {})
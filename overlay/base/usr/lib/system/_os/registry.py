@@ -0,0 +1,416 @@
+import atexit
+import json
+import os
+import platform
+import re
+import threading
+from hashlib import sha256
+from http.client import (
+    HTTPConnection,
+    HTTPException,
+    HTTPSConnection,
+)
+from time import time
+from typing import cast
+from urllib.parse import (
+    urlencode,
+    urljoin,
+    urlsplit,
+)
+
+MANIFEST_MEDIA_TYPES = [
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+]
+INDEX_MEDIA_TYPES = [
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+]
+POOL_SIZE = 8
+TIMEOUT = 30
+
+type Response = tuple[int, dict[str, str], bytes]
+
+_challenge = re.compile(r'(\w+)="([^"]*)"')
+
+
+class RegistryError(Exception):
+    def __init__(self, status: int, reason: str, url: str) -> None:
+        super().__init__(f"{status} {reason}: {url}")
+        self.status: int = status
+        self.reason: str = reason
+        self.url: str = url
+
+
+def _is_insecure(registry: str) -> bool:
+    host = registry.rsplit(":", 1)[0]
+    return host in ("localhost", "127.0.0.1", "::1", "[::1]")
+
+
+def _auth_files() -> list[str]:
+    files: list[str] = []
+    if "REGISTRY_AUTH_FILE" in os.environ:
+        files.append(os.environ["REGISTRY_AUTH_FILE"])
+
+    if "XDG_RUNTIME_DIR" in os.environ:
+        files.append(
+            os.path.join(os.environ["XDG_RUNTIME_DIR"], "containers/auth.json")
+        )
+
+    files.append(f"/run/containers/{os.getuid()}/auth.json")
+    files.append(os.path.expanduser("~/.config/containers/auth.json"))
+    files.append(os.path.expanduser("~/.docker/config.json"))
+    return files
+
+
+def _credentials(registry: str) -> str | None:
+    for file in _auth_files():
+        try:
+            with open(file) as f:
+                data = cast(dict[str, dict[str, dict[str, str]]], json.load(f))
+
+        except OSError, ValueError:
+            continue
+
+        auths = data.get("auths", {})
+        for key in (registry, f"https://{registry}", f"{registry}/v1/"):
+            auth = auths.get(key, {}).get("auth", None)
+            if auth:
+                return auth
+
+    return None
+
+
+class RegistryClient:
+    def __init__(self, pool_size: int = POOL_SIZE) -> None:
+        self.pool_size: int = pool_size
+        self._lock: threading.Lock = threading.Lock()
+        self._idle: dict[tuple[str, str], list[HTTPConnection]] = {}
+        self._tokens: dict[tuple[str, str], tuple[str, float]] = {}
+
+    def _acquire(self, scheme: str, netloc: str) -> HTTPConnection:
+        with self._lock:
+            idle = self._idle.get((scheme, netloc), [])
+            if idle:
+                return idle.pop()
+
+        return self._connect(scheme, netloc)
+
+    def _connect(self, scheme: str, netloc: str) -> HTTPConnection:
+        if scheme == "http":
+            return HTTPConnection(netloc, timeout=TIMEOUT)
+
+        return HTTPSConnection(netloc, timeout=TIMEOUT)
+
+    def _release(self, scheme: str, netloc: str, conn: HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+
+            self._idle.clear()
+
+    def _roundtrip(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | None = None,
+    ) -> Response:
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+
+        # Connections in the pool may have been closed by the server while idle,
+        # so retry once on a fresh connection. The rest of the pool is likely just
+        # as stale, so the retry never takes from it
+        for attempt in range(2):
+            conn = (
+                self._connect(parts.scheme, parts.netloc)
+                if attempt
+                else self._acquire(parts.scheme, parts.netloc)
+            )
+            try:
+                conn.request(method, path, body=data, headers=headers)
+                res = conn.getresponse()
+                body = res.read()
+
+            except HTTPException, OSError:
+                conn.close()
+                if attempt:
+                    raise
+
+                continue
+
+            if res.will_close:
+                conn.close()
+
+            else:
+                self._release(parts.scheme, parts.netloc, conn)
+
+            return res.status, {k.lower(): v for k, v in res.getheaders()}, body
+
+        raise AssertionError("unreachable")
+
+    def _fetch(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str] | None = None,
+        data: bytes | None = None,
+    ) -> Response:
+        headers = dict(headers or {})
+        for _ in range(5):
+            status, res_headers, body = self._roundtrip(method, url, headers, data)
+            if status not in (301, 302, 303, 307, 308):
+                return status, res_headers, body
+
+            location = urljoin(url, res_headers["location"])
+            if urlsplit(location).netloc != urlsplit(url).netloc:
+                # Never leak registry credentials to a blob storage backend
+                _ = headers.pop("Authorization", None)
+
+            if status == 303:
+                method = "GET"
+                data = None
+
+            url = location
+
+        raise RegistryError(310, "Too many redirects", url)
+
+    def _token(self, registry: str, scope: str, challenge: str) -> str | None:
+        scheme, _, params = challenge.partition(" ")
+        auth = _credentials(registry)
+        if scheme.lower() == "basic":
+            if auth is None:
+                return None
+
+            with self._lock:
+                self._tokens[(registry, scope)] = (f"Basic {auth}", float("inf"))
+
+            return f"Basic {auth}"
+
+        if scheme.lower() != "bearer":
+            return None
+
+        options = dict(_challenge.findall(params))
+        realm = options.pop("realm", None)
+        if realm is None:
+            return None
+
+        headers: dict[str, str] = {}
+        if auth is not None:
+            headers["Authorization"] = f"Basic {auth}"
+
+        url = f"{realm}?{urlencode(options)}"
+        status, _, body = self._fetch("GET", url, headers)
+        if status != 200:
+            raise RegistryError(status, "Failed to get token", realm)
+
+        data = cast(dict[str, str | int], json.loads(body))
+        token = data.get("token", None) or data.get("access_token", None)
+        assert isinstance(token, str), "Registry did not return a token"
+        expires_in = data.get("expires_in", 60)
+        assert isinstance(expires_in, int)
+        with self._lock:
+            self._tokens[(registry, scope)] = (
+                f"Bearer {token}",
+                # Refresh a little early to avoid racing the expiry
+                time() + max(expires_in - 10, 0),
+            )
+
+        return f"Bearer {token}"
+
+    def _request(
+        self,
+        method: str,
+        registry: str,
+        repo: str,
+        path: str,
+        headers: dict[str, str] | None = None,
+        *,
+        data: bytes | None = None,
+        push: bool = False,
+    ) -> Response:
+        host = "registry-1.docker.io" if registry == "docker.io" else registry
+        if registry == "docker.io" and "/" not in repo:
+            repo = f"library/{repo}"
+
+        scheme = "http" if _is_insecure(registry) else "https"
+        url = f"{scheme}://{host}/v2/{repo}/{path}"
+        headers = dict(headers or {})
+        scope = f"repository:{repo}:{'pull,push' if push else 'pull'}"
+        with self._lock:
+            token, expires = self._tokens.get((registry, scope), (None, 0.0))
+
+        if token is not None and expires > time():
+            headers["Authorization"] = token
+
+        status, res_headers, body = self._fetch(method, url, headers, data)
+        if status == 401 and "www-authenticate" in res_headers:
+            token = self._token(registry, scope, res_headers["www-authenticate"])
+            if token is not None:
+                headers["Authorization"] = token
+                status, res_headers, body = self._fetch(method, url, headers, data)
+
+        if status >= 400:
+            raise RegistryError(status, body.decode("utf-8", "replace")[:200], url)
+
+        return status, res_headers, body
+
+    def manifest(self, registry: str, repo: str, reference: str) -> tuple[str, bytes]:
+        _, headers, body = self._request(
+            "GET",
+            registry,
+            repo,
+            f"manifests/{reference}",
+            {"Accept": ", ".join(MANIFEST_MEDIA_TYPES)},
+        )
+        digest = headers.get("docker-content-digest", None)
+        if digest is None:
+            digest = f"sha256:{sha256(body).hexdigest()}"
+
+        return digest, body
+
+    def manifest_digest(self, registry: str, repo: str, reference: str) -> str:
+        _, headers, _ = self._request(
+            "HEAD",
+            registry,
+            repo,
+            f"manifests/{reference}",
+            {"Accept": ", ".join(MANIFEST_MEDIA_TYPES)},
+        )
+        digest = headers.get("docker-content-digest", None)
+        if digest is None:
+            digest, _ = self.manifest(registry, repo, reference)
+
+        return digest
+
+    def put_manifest(
+        self,
+        registry: str,
+        repo: str,
+        reference: str,
+        manifest: bytes,
+    ) -> str:
+        media_type = cast(dict[str, str], json.loads(manifest)).get(
+            "mediaType", "application/vnd.oci.image.manifest.v1+json"
+        )
+        _, headers, _ = self._request(
+            "PUT",
+            registry,
+            repo,
+            f"manifests/{reference}",
+            {"Content-Type": media_type},
+            data=manifest,
+            push=True,
+        )
+        return headers.get(
+            "docker-content-digest", f"sha256:{sha256(manifest).hexdigest()}"
+        )
+
+    def delete_manifest(self, registry: str, repo: str, reference: str) -> None:
+        _ = self._request(
+            "DELETE",
+            registry,
+            repo,
+            f"manifests/{reference}",
+            push=True,
+        )
+
+    def blob(self, registry: str, repo: str, digest: str) -> bytes:
+        _, _, body = self._request("GET", registry, repo, f"blobs/{digest}")
+        return body
+
+    def tags(self, registry: str, repo: str) -> list[str]:
+        tags: list[str] = []
+        path = "tags/list?n=1000"
+        while True:
+            _, headers, body = self._request("GET", registry, repo, path)
+            data = cast(dict[str, list[str] | None], json.loads(body))
+            tags += data.get("tags", None) or []
+            link = headers.get("link", None)
+            if link is None:
+                return tags
+
+            # Link: </v2/<repo>/tags/list?n=1000&last=...>; rel="next"
+            path = "tags/list?" + urlsplit(link.split(";")[0].strip("<> ")).query
+
+    def inspect(self, registry: str, repo: str, reference: str) -> dict[str, object]:
+        digest, body = self.manifest(registry, repo, reference)
+        manifest = cast(dict[str, object], json.loads(body))
+        if manifest.get("mediaType", None) in INDEX_MEDIA_TYPES:
+            machine = platform.machine()
+            arch = {"x86_64": "amd64", "aarch64": "arm64"}.get(machine, machine)
+            entry = next(
+                (
+                    x
+                    for x in cast(
+                        list[dict[str, dict[str, str] | str]], manifest["manifests"]
+                    )
+                    if cast(dict[str, str], x.get("platform", {})).get("architecture")
+                    == arch
+                ),
+                None,
+            )
+            if entry is None:
+                raise RegistryError(
+                    404,
+                    f"No manifest for platform linux/{arch}",
+                    f"{registry}/{repo}:{reference}",
+                )
+
+            _, body = self.manifest(registry, repo, cast(str, entry["digest"]))
+            manifest = cast(dict[str, object], json.loads(body))
+
+        config_digest = cast(dict[str, str], manifest["config"])["digest"]
+        config = cast(
+            dict[str, object],
+            json.loads(self.blob(registry, repo, config_digest)),
+        )
+        container_config = cast(dict[str, object], config.get("config", None) or {})
+        layers = cast(list[dict[str, str | int]], manifest.get("layers", []))
+        return {
+            "Name": f"{registry}/{repo}",
+            "Digest": digest,
+            "Created": config.get("created", None),
+            "Architecture": config.get("architecture", None),
+            "Os": config.get("os", None),
+            "Labels": container_config.get("Labels", None) or {},
+            "Env": container_config.get("Env", None) or [],
+            "Layers": [x["digest"] for x in layers],
+            "LayersData": [
+                {
+                    "MIMEType": x.get("mediaType", None),
+                    "Digest": x["digest"],
+                    "Size": x.get("size", 0),
+                }
+                for x in layers
+            ],
+        }
+
+
+_client: RegistryClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_registry_client() -> RegistryClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = RegistryClient()
+            _ = atexit.register(_client.close)
+
+        return _client
@@ -0,0 +1,137 @@
+import fcntl
+import json
+import os
+from collections.abc import Generator
+from contextlib import (
+    ExitStack,
+    contextmanager,
+)
+from typing import cast
+
+from .fs import (
+    copy_data,
+    copy_tree,
+)
+
+type Record = dict[str, object]
+
+
+def _load(path: str) -> list[Record]:
+    try:
+        with open(path) as f:
+            return cast(list[Record], json.load(f))
+
+    except FileNotFoundError:
+        return []
+
+
+def _save(path: str, records: list[Record]) -> None:
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(records, f)
+
+    os.replace(f"{path}.tmp", path)
+
+
+@contextmanager
+def _locked(*paths: str) -> Generator[None]:
+    # containers-storage takes fcntl locks on these, so a read lock keeps the
+    # source from changing under us without blocking other readers
+    with ExitStack() as stack:
+        for path in paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            _ = stack.callback(os.close, fd)
+            fcntl.lockf(fd, fcntl.LOCK_SH)
+
+        yield
+
+
+def _chain(layers: dict[str, Record], layer: str | None) -> list[str]:
+    chain: list[str] = []
+    while layer:
+        chain.append(layer)
+        layer = cast(str | None, layers[layer].get("parent", None))
+
+    return chain[::-1]
+
+
+def _copy_layer(src: str, dest: str, layer: Record, hardlink: bool) -> None:
+    _id = cast(str, layer["id"])
+    # Only the diff is part of the layer, work and merged belong to mounts
+    _ = copy_tree(
+        f"{src}/overlay/{_id}",
+        f"{dest}/overlay/{_id}",
+        ["/work", "/merged"],
+        hardlink=hardlink,
+    )
+    os.mkdir(f"{dest}/overlay/{_id}/work", 0o700)
+    with open(f"{src}/overlay/{_id}/link") as f:
+        short = f.read().strip()
+
+    os.symlink(f"../{_id}/diff", f"{dest}/overlay/l/{short}")
+    tarsplit = f"overlay-layers/{_id}.tar-split.gz"
+    if os.path.exists(f"{src}/{tarsplit}"):
+        copy_data(f"{src}/{tarsplit}", f"{dest}/{tarsplit}")
+
+
+def copy_images(src: str, dest: str, images: dict[str, list[str]]) -> int:
+    # Copies images between two overlay containers-storage roots by copying the
+    # layer directories directly. Layers the destination already has are
+    # skipped, and when both roots are on the same filesystem the layer
+    # contents are hardlinked instead of copied
+    for path in ("overlay/l", "overlay-layers", "overlay-images"):
+        os.makedirs(f"{dest}/{path}", 0o700, exist_ok=True)
+
+    hardlink = os.stat(src).st_dev == os.stat(dest).st_dev
+    count = 0
+    with _locked(
+        f"{src}/overlay-layers/layers.lock",
+        f"{src}/overlay-images/images.lock",
+    ):
+        src_layers = {
+            cast(str, x["id"]): x for x in _load(f"{src}/overlay-layers/layers.json")
+        }
+        src_images = {
+            cast(str, x["id"]): x for x in _load(f"{src}/overlay-images/images.json")
+        }
+        dest_layers = _load(f"{dest}/overlay-layers/layers.json")
+        dest_images = _load(f"{dest}/overlay-images/images.json")
+        existing = {cast(str, x["id"]) for x in dest_layers}
+        for _id, requested in images.items():
+            image = dict(src_images[_id])
+            for layer in _chain(src_layers, cast(str | None, image.get("layer", None))):
+                if layer in existing:
+                    continue
+
+                _copy_layer(src, dest, src_layers[layer], hardlink)
+                dest_layers.append(src_layers[layer])
+                existing.add(layer)
+                count += 1
+
+            # Names are unique within a store, so take them away from whatever
+            # image had them before
+            _names = cast(list[str], image.get("names", []))
+            names = [x for x in _names if x in requested] or _names
+            for record in dest_images:
+                record["names"] = [
+                    x
+                    for x in cast(list[str], record.get("names", []))
+                    if x not in names
+                ]
+
+            current = next((x for x in dest_images if x["id"] == _id), None)
+            if current is not None:
+                current["names"] = [*cast(list[str], current["names"]), *names]
+                continue
+
+            image["names"] = names
+            _ = copy_tree(
+                f"{src}/overlay-images/{_id}",
+                f"{dest}/overlay-images/{_id}",
+                hardlink=hardlink,
+            )
+            dest_images.append(image)
+
+        _save(f"{dest}/overlay-layers/layers.json", dest_layers)
+        _save(f"{dest}/overlay-images/images.json", dest_images)
+
+    return count
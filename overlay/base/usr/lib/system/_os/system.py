@@ -16,14 +16,13 @@ from typing import (
     cast,
 )
 
-import dbus  # pyright:ignore [reportMissingTypeStubs]
-import xattr  # pyright:ignore [reportMissingTypeStubs]
-
 from . import SYSTEM_PATH
 from .console import bytes_to_stderr, bytes_to_stdout
 
 
 def file_hash(file: str) -> str:
+    import xattr  # pyright:ignore [reportMissingTypeStubs]  # noqa: PLC0415
+
     m = sha256()
     st = os.stat(file)
     m.update(f"{st.st_mode, st.st_uid, st.st_gid}".encode())
@@ -407,35 +406,13 @@ def in_nspawn_system_cmd(
     home: str = "ro",
     var: str = "ro",
 ) -> list[str]:
+    from .environment import system_environment  # noqa: PLC0415
     from .ostree import (  # noqa: PLC0415
         Deployment,
         current_deployment,
     )
 
-    _ostree_root = ""
-    if os.path.exists("/ostree") and os.path.isdir("/ostree"):
-        _ostree = "/ostree"
-        if not os.path.exists(SYSTEM_PATH):
-            os.makedirs(SYSTEM_PATH, exist_ok=True)
-
-        if not os.path.exists(f"{SYSTEM_PATH}/ostree"):
-            os.symlink("/ostree", f"{SYSTEM_PATH}/ostree")
-
-    else:
-        _ostree = f"{SYSTEM_PATH}/ostree"
-        os.makedirs(_ostree, exist_ok=True)
-        repo = os.path.join(_ostree, "repo")
-        _ostree_root = f"{SYSTEM_PATH}/"
-        from .ostree import ostree  # noqa: PLC0415
-
-        setattr(ostree, "repo", repo)
-        if not os.path.exists(repo):
-            ostree("init")
-
-    cache = "/var/cache/pacman"
-    if not os.path.exists(cache):
-        os.makedirs(cache, exist_ok=True)
-
+    env = system_environment()
     deployment = cast(Deployment | None, deployment)
     if deployment is None:
         deployment = current_deployment()
@@ -508,10 +485,10 @@ def in_nspawn_system_cmd(
         f"--bind={SYSTEM_PATH}:{SYSTEM_PATH}",
         "--bind=/boot:/boot",
         "--bind=/run/podman/podman.sock:/run/podman/podman.sock",
-        f"--bind={cache}",
+        f"--bind={env.pacman_cache}",
         *[f"--bind={x}" for x in binds],
         *[f"--overlay={x}" for x in overlays],
-        f"--pivot-root={_ostree_root}{deployment.path}:/sysroot",
+        f"--pivot-root={env.ostree_root}{deployment.path}:/sysroot",
         *args,
     ]
 
@@ -595,6 +572,8 @@ def inhibit(
     why: str,
     mode: str,
 ) -> Generator[int | None]:
+    import dbus  # pyright:ignore [reportMissingTypeStubs]  # noqa: PLC0415
+
     try:
         fd = cast(
             int,
@@ -0,0 +1,246 @@
+import os
+import shutil
+import stat
+import tarfile
+import threading
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+from typing import (
+    IO,
+    cast,
+)
+
+from .fs import clear
+
+TIMESTAMP = 1735689640
+BLOCK_SIZE = 512
+CHUNK_SIZE = 1024 * 1024
+# Files larger than this are written straight from the stream instead of being
+# queued for the writer pool
+STREAM_SIZE = 1024 * 1024
+
+_pax_times = (b"mtime", b"atime", b"ctime")
+_end = bytes(BLOCK_SIZE)
+_types = {
+    tarfile.CHRTYPE: stat.S_IFCHR,
+    tarfile.BLKTYPE: stat.S_IFBLK,
+    tarfile.FIFOTYPE: stat.S_IFIFO,
+}
+
+
+def _read(src: IO[bytes], size: int) -> bytes:
+    data = src.read(size)
+    while len(data) < size:
+        chunk = src.read(size - len(data))
+        if not chunk:
+            break
+
+        data += chunk
+
+    return data
+
+
+def _copy(src: IO[bytes], dest: IO[bytes], size: int) -> None:
+    while size:
+        chunk = src.read(min(size, CHUNK_SIZE))
+        if not chunk:
+            raise EOFError("Unexpected end of tar stream")
+
+        _ = dest.write(chunk)
+        size -= len(chunk)
+
+
+def _parse_size(field: bytes) -> int:
+    # Sizes over 8GiB are stored as a big endian base-256 number
+    if field[0] & 0x80:
+        return int.from_bytes(field[1:], "big")
+
+    return int(field.rstrip(b"\0 ") or b"0", 8)
+
+
+def _strip_pax_times(data: bytes) -> bytes:
+    records: list[bytes] = []
+    while data:
+        length, _, rest = data.partition(b" ")
+        record = data[: int(length)]
+        data = data[int(length) :]
+        if rest.split(b"=", 1)[0] not in _pax_times:
+            records.append(record)
+
+    return b"".join(records)
+
+
+def normalize_mtime(
+    src: IO[bytes],
+    dest: IO[bytes],
+    mtime: int = TIMESTAMP,
+    end: bool = True,
+) -> int:
+    # Only the headers are rewritten, file contents are passed through untouched.
+    # Without end the end of archive marker is left out, so that another archive
+    # can be appended to dest
+    field = b"%011o\0" % mtime
+    field_sum = sum(field)
+    count = 0
+    while True:
+        header = _read(src, BLOCK_SIZE)
+        if len(header) < BLOCK_SIZE or header == _end:
+            if end:
+                _ = dest.write(header)
+
+            # Pass through or drain the trailing blocks
+            while chunk := src.read(CHUNK_SIZE):
+                if end:
+                    _ = dest.write(chunk)
+
+            return count
+
+        size = _parse_size(header[124:136])
+        padded = -(-size // BLOCK_SIZE) * BLOCK_SIZE
+        data: bytes | None = None
+        block = bytearray(header)
+        block[136:148] = field
+        if header[156:157] in (b"x", b"g"):
+            # Extended headers can carry their own sub-second timestamps
+            data = _strip_pax_times(_read(src, padded)[:size])
+            size = len(data)
+            padded = -(-size // BLOCK_SIZE) * BLOCK_SIZE
+            block[124:136] = b"%011o\0" % size
+            block[148:156] = b" " * 8
+            checksum = sum(block)
+
+        else:
+            # Adjusting the existing checksum is much cheaper than summing the
+            # whole block again
+            checksum = (
+                int(header[148:156].rstrip(b"\0 "), 8)
+                - sum(header[136:148])
+                + field_sum
+            )
+
+        block[148:156] = b"%06o\0 " % checksum
+        _ = dest.write(block)
+        count += 1
+        if data is not None:
+            _ = dest.write(data.ljust(padded, b"\0"))
+
+        else:
+            _copy(src, dest, padded)
+
+
+def _apply(path: str, info: tarfile.TarInfo) -> None:
+    os.chown(path, info.uid, info.gid, follow_symlinks=False)
+    if not info.issym():
+        os.chmod(path, info.mode)
+
+    # chown drops capabilities, so the xattrs have to come after it
+    for key, value in info.pax_headers.items():
+        if key.startswith("SCHILY.xattr."):
+            os.setxattr(
+                path,
+                key[13:],
+                value.encode("utf-8", "surrogateescape"),
+                follow_symlinks=False,
+            )
+
+    os.utime(path, (info.mtime, info.mtime), follow_symlinks=False)
+
+
+def _write(path: str, data: bytes, info: tarfile.TarInfo) -> None:
+    with open(path, "wb") as f:
+        _ = f.write(data)
+
+    _apply(path, info)
+
+
+def extract(
+    src: IO[bytes],
+    dest: str,
+    jobs: int | None = None,
+    overwrite: bool = False,
+) -> int:
+    # Parsing the stream is inherently sequential, but writing the files out is
+    # not. Small files are handed to a pool of writers, with a bounded number of
+    # them held in memory at a time so a slow disk can not exhaust it
+    jobs = jobs or min(32, (os.cpu_count() or 1) * 4)
+    slots = threading.BoundedSemaphore(jobs * 4)
+    written: dict[str, Future[None]] = {}
+    dirs: list[tuple[str, tarfile.TarInfo]] = []
+    parents: set[str] = set()
+    dest = os.path.abspath(dest)
+    count = 0
+
+    def write(path: str, data: bytes, info: tarfile.TarInfo) -> None:
+        try:
+            _write(path, data, info)
+
+        finally:
+            slots.release()
+
+    with (
+        ThreadPoolExecutor(max_workers=jobs) as executor,
+        tarfile.open(fileobj=src, mode="r|*") as t,
+    ):
+        for info in t:
+            path = os.path.normpath(os.path.join(dest, info.name.lstrip("/")))
+            assert path == dest or path.startswith(f"{dest}/"), info.name
+            if info.isdir():
+                os.makedirs(path, exist_ok=True)
+                dirs.append((path, info))
+                parents.add(path)
+                continue
+
+            # Streams do not always include the directories their entries are in
+            parent = os.path.dirname(path)
+            if parent not in parents:
+                os.makedirs(parent, exist_ok=True)
+                parents.add(parent)
+
+            if overwrite:
+                clear(path)
+
+            if info.isreg():
+                count += 1
+                if info.size > STREAM_SIZE:
+                    with open(path, "wb") as f:
+                        shutil.copyfileobj(
+                            cast(IO[bytes], t.extractfile(info)), f, CHUNK_SIZE
+                        )
+
+                    _apply(path, info)
+                    continue
+
+                data = cast(IO[bytes], t.extractfile(info)).read()
+                _ = slots.acquire()
+                written[path] = executor.submit(write, path, data, info)
+
+            elif info.issym():
+                os.symlink(info.linkname, path)
+                _apply(path, info)
+
+            elif info.islnk():
+                target = os.path.join(dest, info.linkname.lstrip("/"))
+                future = written.get(target, None)
+                if future is not None:
+                    future.result()
+
+                os.link(target, path)
+
+            else:
+                os.mknod(
+                    path,
+                    info.mode | _types[info.type],
+                    os.makedev(info.devmajor, info.devminor),
+                )
+                _apply(path, info)
+
+        for future in written.values():
+            future.result()
+
+    # Parents are created before their children, so fix them up in reverse
+    for path, info in reversed(dirs):
+        _apply(path, info)
+
+    return count
@@ -1,6 +1,7 @@
 package main
 
 import (
+	"bufio"
 	"context"
 	"encoding/json"
 	"flag"
@@ -73,25 +74,17 @@ func (r *OfflineResolver) ResolveImageConfig(ctx context.Context, ref string, op
 	return ref, dgst, configJSON, nil
 }
 
-func main() {
-	logrus.SetLevel(logrus.WarnLevel)
-
-	var output = flag.String("o", "", "output JSON file (default stdout)")
-	var pretty = flag.Bool("p", false, "Pretty print JSON output")
-	var verbose = flag.Bool("v", false, "Verbose output")
-	var buildArgs buildArgSlice
-	flag.Var(&buildArgs, "b", "Build argument in key=value format (can be repeated)")
-	flag.Parse()
-
-	if *verbose {
-		logrus.SetLevel(logrus.DebugLevel)
-	}
+type batchRequest struct {
+	Containerfile string            `json:"containerfile"`
+	BuildArgs     map[string]string `json:"buildArgs"`
+}
 
-	df, err := io.ReadAll(os.Stdin)
-	if err != nil {
-		panic(err)
-	}
+type batchResponse struct {
+	Ops   []*pb.Op `json:"ops,omitempty"`
+	Error string   `json:"error,omitempty"`
+}
 
+func parse(df []byte, buildArgs map[string]string) ([]*pb.Op, error) {
 	caps := pb.Caps.CapSet(pb.Caps.All())
 
 	state, _, _, _, err := dockerfile2llb.Dockerfile2LLB(context.TODO(), df,
@@ -100,26 +93,88 @@ func main() {
 			LLBCaps:      &caps,
 			SourceMap:    nil,
 			Config: dockerui.Config{
-				BuildArgs: buildArgs.ToMap(),
+				BuildArgs: buildArgs,
 			},
 		})
 	if err != nil {
-		panic(err)
+		return nil, err
 	}
 
 	def, err := state.Marshal(context.TODO())
 	if err != nil {
-		panic(err)
+		return nil, err
 	}
 
 	var ops []*pb.Op
 	for _, dt := range def.Def {
 		var op pb.Op
 		if err := (&op).Unmarshal(dt); err != nil {
-			panic(err)
+			return nil, err
 		}
 		ops = append(ops, &op)
 	}
+	return ops, nil
+}
+
+// Reads one JSON request per line from stdin and writes one JSON response per
+// line to stdout, so many Containerfiles can be parsed by a single process
+func batch() {
+	decoder := json.NewDecoder(os.Stdin)
+	writer := bufio.NewWriter(os.Stdout)
+	encoder := json.NewEncoder(writer)
+	for {
+		var req batchRequest
+		err := decoder.Decode(&req)
+		if err == io.EOF {
+			break
+		}
+		if err != nil {
+			panic(err)
+		}
+
+		var res batchResponse
+		res.Ops, err = parse([]byte(req.Containerfile), req.BuildArgs)
+		if err != nil {
+			res.Error = err.Error()
+		}
+		if err := encoder.Encode(res); err != nil {
+			panic(err)
+		}
+		if err := writer.Flush(); err != nil {
+			panic(err)
+		}
+	}
+}
+
+func main() {
+	logrus.SetLevel(logrus.WarnLevel)
+
+	var output = flag.String("o", "", "output JSON file (default stdout)")
+	var pretty = flag.Bool("p", false, "Pretty print JSON output")
+	var verbose = flag.Bool("v", false, "Verbose output")
+	var batchMode = flag.Bool("batch", false, "Parse JSON lines of {\"containerfile\", \"buildArgs\"} from stdin")
+	var buildArgs buildArgSlice
+	flag.Var(&buildArgs, "b", "Build argument in key=value format (can be repeated)")
+	flag.Parse()
+
+	if *verbose {
+		logrus.SetLevel(logrus.DebugLevel)
+	}
+
+	if *batchMode {
+		batch()
+		return
+	}
+
+	df, err := io.ReadAll(os.Stdin)
+	if err != nil {
+		panic(err)
+	}
+
+	ops, err := parse(df, buildArgs.ToMap())
+	if err != nil {
+		panic(err)
+	}
 
 	var b []byte
 	if *pretty {